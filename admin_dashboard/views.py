@@ -7,7 +7,11 @@ from core.models import User, EBike, Booking, VehicleRegistration, ProviderDocum
 =======
 from core.models import User, EBike, Booking, VehicleRegistration, Notification, ProviderDocument, ContactMessage, Review, Withdrawal
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-from django.db.models import Sum, Q
+from django.db.models import Q
+from core.bookings import BookingConflictError, confirm_approval
+from core.ledger import provider_ledgers
+from core.mail import queue_email, queue_message, send_batch
+from core.notifications import notify, send_notifications, user_unread_count
 from decimal import Decimal
 from django.db.models.functions import TruncMonth
 from django.db.models import Count
@@ -15,12 +19,15 @@ from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 import json
 from datetime import datetime, timedelta
 
+# Booking IDs named in the bulk approval warning when emails fail; the rest are counted
+FAILED_EMAILS_LISTED = 20
+
 def is_admin(user):
     return user.is_authenticated and user.is_staff
 
@@ -32,44 +39,10 @@ def admin_dashboard(request):
     ebikes = EBike.objects.all()
     bookings = Booking.objects.all()
 
-    # Assume platform charges are 10% of each provider's earnings
-    platform_charge_percentage = Decimal('0.10')
-
-    providers_earnings = []
-    total_platform_charges = Decimal('0.0')  # Variable to store total platform charges
-    total_providers_earnings = Decimal('0.0')
-
-    for provider in vehicle_providers:
-        total_earnings = Decimal('0.0')
-        bikes = []
-
-        for bike in provider.ebikes.all():
-            earnings = Booking.objects.filter(ebike=bike, is_approved=True).aggregate(Sum('total_price'))['total_price__sum'] or Decimal('0.0')
-            total_earnings += earnings
-            bikes.append(bike)
-
-        # Calculate platform charges for the provider
-        platform_charges = total_earnings * platform_charge_percentage
-        total_platform_charges += platform_charges
-        total_providers_earnings += total_earnings
-
-        # Calculate available balance for the provider (same logic as provider dashboard)
-        platform_charges_provider = total_earnings * platform_charge_percentage
-        pending_provider_withdrawals = Decimal('0.0')
-        if hasattr(Withdrawal, 'objects'):
-            pending_provider_withdrawals = Withdrawal.objects.filter(
-                provider=provider,
-                status__in=['approved', 'pending']
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
-
-        provider_available_balance = max(total_earnings - platform_charges_provider - pending_provider_withdrawals, Decimal('0.0'))
-
-        providers_earnings.append({
-            'username': provider.username,
-            'bikes': bikes,
-            'total_earnings': total_earnings,
-            'available_balance': provider_available_balance,
-        })
+    # Earnings, platform charges (10%) and balances for every provider in a fixed number of queries
+    providers_earnings = provider_ledgers(vehicle_providers)
+    total_providers_earnings = sum((row['total_earnings'] for row in providers_earnings), Decimal('0.0'))
+    total_platform_charges = sum((row['platform_charges'] for row in providers_earnings), Decimal('0.0'))
 
     # Bookings per month for the last 12 months
     bookings_by_month = (
@@ -86,8 +59,8 @@ def admin_dashboard(request):
     pending_count = Booking.objects.filter(is_approved=False, is_rejected=False).count()
     pending_approvals_count = Booking.objects.filter(is_approved=False, is_rejected=False).count()
 
-    unread_notification_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-    notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')[:10]
+    unread_notification_count = user_unread_count(request.user)
+    notifications = Notification.objects.for_user(request.user).order_by('-created_at')[:10]
     
     # Document verification data
     pending_documents = ProviderDocument.objects.filter(status='pending').order_by('-uploaded_at')
@@ -114,7 +87,6 @@ def admin_dashboard(request):
     total_pending_withdrawals = Withdrawal.objects.filter(status='pending').count()
     
     # Add availability sync date (placeholder for now)
-    from datetime import datetime
     availability_last_sync_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     return render(request, 'admin_dashboard/dashboard.html', {
@@ -148,10 +120,11 @@ def admin_dashboard(request):
 @user_passes_test(is_admin)
 def approve_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
-    booking.status = 'approved'  # Set status to approved
-    booking.is_approved = True   # Also set is_approved for consistency
-    booking.is_rejected = False  # Reset rejection status
-    booking.save()
+    try:
+        confirm_approval(booking)  # Sets status, is_approved and is_rejected together
+    except BookingConflictError as e:
+        messages.error(request, f'Booking #{booking.id} was not approved: {e}')
+        return redirect('admin_dashboard')
 
     # Notify the user
     Notification.objects.create(
@@ -193,13 +166,12 @@ def approve_booking(request, booking_id):
     The AIS E-Bike Rental Team
     """
 
-    send_mail(
+    queue_email(
         subject=subject,
         message=plain_message,
         html_message=html_message,
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[booking.rider.email],
-        fail_silently=True
     )
 
     messages.success(request, f'Booking #{booking.id} has been approved successfully!')
@@ -519,6 +491,7 @@ def bulk_approve_documents(request):
             affected_providers.add(document.provider_id)
 
     # Verify providers who have no pending documents
+    newly_verified = []
     for provider_id in affected_providers:
         all_docs = ProviderDocument.objects.filter(provider_id=provider_id)
         if not all_docs.filter(status='pending').exists():
@@ -527,11 +500,12 @@ def bulk_approve_documents(request):
                 provider.is_verified_provider = True
                 provider.verification_notes = f"Verified on {timezone.now().strftime('%Y-%m-%d %H:%M')}"
                 provider.save()
-                Notification.objects.create(
-                    recipient=provider,
-                    message="Congratulations! Your account has been verified. You can now add ebikes to the platform.",
-                    link="/vehicle-providers/dashboard/"
-                )
+                newly_verified.append(provider)
+    notify(
+        newly_verified,
+        "Congratulations! Your account has been verified. You can now add ebikes to the platform.",
+        link="/vehicle-providers/dashboard/"
+    )
 
     messages.success(request, f'Successfully approved {approved_count} document(s).')
     return redirect('review_documents')
@@ -557,6 +531,7 @@ def bulk_reject_documents(request):
 
     documents = ProviderDocument.objects.filter(id__in=doc_ids)
     rejected_count = 0
+    notifications = []
 
     for document in documents:
         if document.status != 'rejected':
@@ -566,35 +541,47 @@ def bulk_reject_documents(request):
             document.reviewed_at = timezone.now()
             document.save()
             rejected_count += 1
-            Notification.objects.create(
-                recipient=document.provider,
+            notifications.append(Notification(
+                recipient_id=document.provider_id,
                 message=f"Your document {document.get_document_type_display()} was rejected. Please review the admin notes and resubmit.",
                 link="/vehicle-providers/view-documents/"
-            )
+            ))
+    send_notifications(notifications)
 
     messages.success(request, f'Successfully rejected {rejected_count} document(s).')
     return redirect('review_documents')
 @user_passes_test(is_admin)
 @require_POST
 def bulk_approve_bookings(request):
-    """Bulk approve multiple bookings"""
+    """
+    Bulk approve multiple bookings.
+
+    Approval emails are rendered first and then sent together over a single
+    email connection; the admin is told which bookings' riders could not be
+    emailed (those messages are queued in the outbox for retry).
+    """
     booking_ids = request.POST.getlist('booking_ids')
     if booking_ids:
-        bookings = Booking.objects.filter(id__in=booking_ids, is_approved=False)
+        bookings = Booking.objects.filter(id__in=booking_ids, is_approved=False).select_related('rider', 'ebike')
         approved_count = 0
+        conflicts = []
+        approval_emails = []
+        emailed_bookings = []
+        notifications = []
         
         for booking in bookings:
-            booking.status = 'approved'  # Set status to approved
-            booking.is_approved = True   # Also set is_approved for consistency
-            booking.is_rejected = False  # Reset rejection status
-            booking.save()
+            try:
+                confirm_approval(booking)
+            except BookingConflictError:
+                conflicts.append(f"#{booking.id}")
+                continue
 
             # Notify the user
-            Notification.objects.create(
+            notifications.append(Notification(
                 recipient=booking.rider,
                 message=f"Your booking for {booking.ebike.name} has been approved!",
                 link=f"/rider/booking/confirmation/{booking.id}/"
-            )
+            ))
 
             # Send booking approval email to rider
             subject = f'Booking Confirmed - Collect Your E-bike from AIS Store'
@@ -629,17 +616,49 @@ def bulk_approve_bookings(request):
             The AIS E-Bike Rental Team
             """
 
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                html_message=html_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[booking.rider.email],
-                fail_silently=True
-            )
+            if booking.rider.email:
+                email = EmailMultiAlternatives(
+                    subject=subject,
+                    body=plain_message,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[booking.rider.email],
+                )
+                email.attach_alternative(html_message, 'text/html')
+                approval_emails.append(email)
+                emailed_bookings.append(booking)
             approved_count += 1
-        
+
+        send_notifications(notifications)
         messages.success(request, f'Successfully approved {approved_count} booking(s)!')
+        if conflicts:
+            messages.error(
+                request,
+                f"{len(conflicts)} booking(s) overlap a booking that already holds the bike and were not approved: {', '.join(conflicts)}"
+            )
+
+        # Send every approval email over one connection and report failures by booking.
+        # Booking IDs rather than addresses, capped so a large batch doesn't produce an
+        # enormous flash message; send_batch logs each failed recipient.
+        results = send_batch(approval_emails)
+        sent_count = 0
+        failed = []
+        for booking, (email, error) in zip(emailed_bookings, results):
+            if error is None:
+                sent_count += 1
+            else:
+                failed.append(f"#{booking.id}")
+                queue_message(email)
+        if sent_count:
+            messages.info(request, f"Approval email sent to {sent_count} rider(s).")
+        if failed:
+            listed = ', '.join(failed[:FAILED_EMAILS_LISTED])
+            if len(failed) > FAILED_EMAILS_LISTED:
+                listed += f" and {len(failed) - FAILED_EMAILS_LISTED} more"
+            messages.warning(
+                request,
+                f"Approval email could not be sent for {len(failed)} booking(s): {listed}. "
+                f"Those emails stay queued in the outbox for retry."
+            )
     else:
         messages.error(request, 'No bookings selected for approval.')
     
@@ -654,8 +673,9 @@ def bulk_reject_bookings(request):
     rejection_reason = request.POST.get('rejection_reason', 'No reason provided')
 
     if booking_ids:
-        bookings = Booking.objects.filter(id__in=booking_ids, is_approved=False)
+        bookings = Booking.objects.filter(id__in=booking_ids, is_approved=False).select_related('ebike')
         rejected_count = 0
+        notifications = []
 
         for booking in bookings:
             booking.status = 'rejected'  # Set status to rejected
@@ -664,13 +684,15 @@ def bulk_reject_bookings(request):
             booking.save()
 
             # Notify the user
-            Notification.objects.create(
-                recipient=booking.rider,
+            notifications.append(Notification(
+                recipient_id=booking.rider_id,
                 message=f"Your booking for {booking.ebike.name} has been rejected. Reason: {rejection_reason}",
                 link=f"/rider/dashboard/"
-            )
+            ))
             rejected_count += 1
 
+        send_notifications(notifications)
+
         messages.success(request, f'Successfully rejected {rejected_count} booking(s)!')
     else:
         messages.error(request, 'No bookings selected for rejection.')
@@ -689,18 +711,20 @@ def bulk_verify_providers(request):
         providers = User.objects.filter(id__in=provider_ids, is_vehicle_provider=True, is_verified_provider=False)
         verified_count = 0
         
+        verified = []
         for provider in providers:
             provider.is_verified_provider = True
             provider.verification_notes = verification_notes
             provider.save()
-            
-            # Notify provider
-            Notification.objects.create(
-                recipient=provider,
-                message="Congratulations! Your account has been verified. You can now add ebikes to the platform.",
-                link="/vehicle-providers/dashboard/"
-            )
+            verified.append(provider)
             verified_count += 1
+
+        # Notify providers
+        notify(
+            verified,
+            "Congratulations! Your account has been verified. You can now add ebikes to the platform.",
+            link="/vehicle-providers/dashboard/"
+        )
         
         messages.success(request, f'Successfully verified {verified_count} provider(s)!')
     else:
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import sys
+
 import environ
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -64,6 +66,16 @@ MIDDLEWARE = [
     'core.middleware.DailyAvailabilitySyncMiddleware',
 ]
 
+# How DailyAvailabilitySyncMiddleware keeps bike availability fresh:
+# 'thread'  - the first request of the day schedules the sync in a background thread
+# 'command' - do nothing in requests; run `manage.py update_ebike_availability` from cron
+# Use a shared cache (Redis/Memcached) in production so only one worker claims the run.
+AVAILABILITY_SYNC_MODE = env('AVAILABILITY_SYNC_MODE', default='thread')
+# Under `manage.py test` a background sync thread would race the test database;
+# the middleware tests switch thread mode back on where they need it
+if sys.argv[1:2] == ['test']:
+    AVAILABILITY_SYNC_MODE = 'command'
+
 ROOT_URLCONF = 'ais_ebike_rental.urls'
 
 TEMPLATES = [
@@ -94,6 +106,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent booking transactions queue up
+            # instead of racing past the overlap check (see core.bookings)
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -144,6 +161,10 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Files only served through views that check access (core.storage), e.g. provider
+# statements. Must not be inside MEDIA_ROOT or otherwise reachable by URL.
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private_media')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 LOGIN_REDIRECT_URL = 'home'
@@ -180,11 +201,70 @@ RAZORPAY_WEBHOOK_SECRET = env('RAZORPAY_WEBHOOK_SECRET', default='')
 # AI Configuration: Gemini API (Google Generative AI)
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 
+# Which client answers AI requests (core.ai_backends): 'gemini' (real API),
+# 'fake' (offline, deterministic), 'record' (real API, responses saved to
+# AI_REPLAY_DIR) or 'replay' (serve the saved responses, no network)
+AI_BACKEND = env('AI_BACKEND', default='gemini')
+AI_FAKE_LATENCY = float(env('AI_FAKE_LATENCY', default=0.0))  # seconds per call
+AI_FAKE_ERROR_RATE = float(env('AI_FAKE_ERROR_RATE', default=0.0))  # 0.0 - 1.0
+AI_FAKE_SEED = 0
+AI_REPLAY_DIR = os.path.join(BASE_DIR, 'ai_recordings')
+
+# Gemini calls (core.ai): per-call deadline in seconds, retries after the first
+# attempt, and the circuit breaker (failures per window before opening, cooldown)
+AI_CALL_DEADLINE = 20
+AI_CALL_RETRIES = 2
+AI_RETRY_BACKOFF = 0.5
+AI_BREAKER_THRESHOLD = 5
+AI_BREAKER_WINDOW = 60
+AI_BREAKER_COOLDOWN = 30
+
+# Seconds a new, unpaid booking holds its dates while the rider pays (core.bookings)
+BOOKING_PAYMENT_HOLD = 30 * 60
+
+# Per-client request limits for the AI endpoints (core.ratelimit), by route and
+# role ('guest', 'rider', 'provider', 'admin', 'user' or 'default'). None = unlimited.
+RATE_LIMITS = {
+    'chatbot': {'guest': '10/m', 'default': '30/m', 'admin': None},
+    'smart_search': {'guest': '5/m', 'default': '15/m', 'admin': None},
+    'initial_questions': {'default': '30/m'},
+}
+
+# Where core.ratelimit reads a guest's IP: None for REMOTE_ADDR, or the META key of
+# the forwarding header set by the reverse proxy (e.g. 'HTTP_X_FORWARDED_FOR'),
+# taking the entry added by the outermost of RATE_LIMIT_TRUSTED_PROXIES proxies
+RATE_LIMIT_CLIENT_IP_HEADER = None
+RATE_LIMIT_TRUSTED_PROXIES = 1
+
+# Chatbot answer cache (core.chat_cache): LRU size and per-answer lifetime in seconds
+CHATBOT_CACHE_MAX_ENTRIES = 500
+CHATBOT_CACHE_TTL = 60 * 60
+
+# Chatbot conversation memory (core.conversation): turns kept verbatim per session
+# before older ones are folded into a summary, and lifetime after the last message
+CHATBOT_HISTORY_TURNS = 6
+CHATBOT_HISTORY_TTL = 2 * 60 * 60
+
+# Smart search (core.search_index): how many locally ranked bikes go into the Gemini prompt
+SMART_SEARCH_SHORTLIST_SIZE = 10
+
+# Provider statements (vehicle_providers.documents): bookings fetched per query while
+# drawing, and the size above which the PDF is spooled to disk rather than memory
+STATEMENT_CHUNK_SIZE = 2000
+STATEMENT_SPOOL_SIZE = 5 * 1024 * 1024
+# Seconds a finished background statement is kept before process_statement_jobs deletes it
+STATEMENT_JOB_RETENTION = 24 * 60 * 60
+
 # Production Email Configuration Enhancements
 # Configure email for better reliability in production
 EMAIL_TIMEOUT = 30  # Timeout for email sending operations
 EMAIL_USE_LOCALTIME = True  # Use local timezone in email timestamps
 
+# Outbound email queue (core.mail): views only queue messages, the
+# `manage.py send_queued_emails --loop` worker delivers them
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5  # Give up on a message after this many failures
+EMAIL_OUTBOX_RETRY_DELAY = 60  # Seconds before the first retry, doubled after each failure
+
 # Additional SMTP settings for production reliability
 if not DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
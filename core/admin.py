@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils import timezone
 from .models import (
 <<<<<<< HEAD
     User,
@@ -22,7 +23,8 @@ from .models import (
     Notification, 
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
     ContactMessage,
-    Withdrawal
+    Withdrawal,
+    OutboundEmail
 )
 
 class UserAdmin(BaseUserAdmin):
@@ -82,8 +84,8 @@ class ReviewAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'message_preview', 'is_read', 'created_at', 'is_public')
-    list_filter = ('is_read', 'is_public')
+    list_display = ('recipient', 'message_preview', 'is_read', 'created_at', 'is_public', 'is_staff_broadcast')
+    list_filter = ('is_read', 'is_public', 'is_staff_broadcast')
     search_fields = ('recipient__username', 'message')
     readonly_fields = ('created_at',)
     list_select_related = ('recipient',)
@@ -128,6 +130,23 @@ class WithdrawalAdmin(admin.ModelAdmin):
         }),
     )
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipient_list', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients', 'last_error')
+    readonly_fields = ('created_at', 'sent_at', 'locked_at', 'attempts', 'last_error')
+    ordering = ('-created_at',)
+    actions = ['retry_now']
+
+    def recipient_list(self, obj):
+        return ', '.join(obj.recipients)
+    recipient_list.short_description = 'Recipients'
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='queued', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"Queued {updated} email(s) for another attempt.")
+    retry_now.short_description = 'Retry selected emails now'
+
 <<<<<<< HEAD
 class TestimonialAdmin(admin.ModelAdmin):
     list_display = ('name', 'role', 'rating', 'is_active', 'is_highlighted', 'sort_order', 'created_at')
@@ -173,3 +192,4 @@ admin.site.register(Testimonial, TestimonialAdmin)
 admin.site.register(Notification, NotificationAdmin)
 admin.site.register(ContactMessage, ContactMessageAdmin)
 admin.site.register(Withdrawal, WithdrawalAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
@@ -0,0 +1,441 @@
+"""
+Lazily initialized Gemini client.
+
+Nothing here runs at import time: the SDK client is created on the first call
+to ``get_client()`` and the working model is probed on the first call to
+``get_working_model()``. The probed model is stored in the shared cache with a
+TTL, so after one worker has probed, the others (and restarts within the TTL)
+start with zero outbound calls.
+
+Every generation call goes through ``call()``/``acall()``, which give it a
+deadline, a bounded number of retries with jittered backoff, and a circuit
+breaker. The breaker's state lives in the shared cache, so once one worker
+sees Gemini failing the others stop waiting on it too; while it is open,
+calls fail immediately with ``AIUnavailable`` and callers serve a canned or
+cached answer instead.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Preferred models in order of preference (gemini-2.5-flash is the latest flagship!)
+PREFERRED_MODELS = ['gemini-2.5-flash', 'gemini-2.5-pro', 'gemini-2.5-flash-lite', 'gemini-pro']
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+WORKING_MODEL_CACHE_KEY = 'ai:gemini_working_model'
+WORKING_MODEL_TTL = getattr(settings, 'GEMINI_MODEL_CACHE_TTL', 6 * 60 * 60)
+# When probing fails, fall back to DEFAULT_MODEL and probe again after this
+FAILED_PROBE_TTL = 5 * 60
+
+# Per-call budget (seconds) covering every attempt, and retries after the first attempt
+CALL_DEADLINE = getattr(settings, 'AI_CALL_DEADLINE', 20)
+CALL_RETRIES = getattr(settings, 'AI_CALL_RETRIES', 2)
+RETRY_BACKOFF = getattr(settings, 'AI_RETRY_BACKOFF', 0.5)
+
+# The breaker opens after this many failed calls within the window, and lets a
+# single trial call through once the cooldown has passed
+BREAKER_THRESHOLD = getattr(settings, 'AI_BREAKER_THRESHOLD', 5)
+BREAKER_WINDOW = getattr(settings, 'AI_BREAKER_WINDOW', 60)
+BREAKER_COOLDOWN = getattr(settings, 'AI_BREAKER_COOLDOWN', 30)
+
+_client = None
+_client_lock = threading.Lock()
+_probe_lock = threading.Lock()
+
+
+def get_backend():
+    """Name of the configured AI backend (see core.ai_backends)."""
+    return getattr(settings, 'AI_BACKEND', 'gemini')
+
+
+def create_client():
+    """Build the client for the configured backend."""
+    backend = get_backend()
+    if backend == 'fake':
+        from core.ai_backends import FakeClient
+        return FakeClient(
+            latency=getattr(settings, 'AI_FAKE_LATENCY', 0.0),
+            error_rate=getattr(settings, 'AI_FAKE_ERROR_RATE', 0.0),
+            seed=getattr(settings, 'AI_FAKE_SEED', 0),
+        )
+    if backend == 'replay':
+        from core.ai_backends import ReplayClient
+        return ReplayClient(settings.AI_REPLAY_DIR)
+    if backend not in ('gemini', 'record'):
+        raise ValueError(f"Unknown AI_BACKEND {backend!r}; use 'gemini', 'fake', 'record' or 'replay'")
+
+    from google import genai
+
+    # Falls back to the GEMINI_API_KEY environment variable when the setting is empty
+    client = genai.Client(api_key=getattr(settings, 'GEMINI_API_KEY', None) or None)
+    if backend == 'record':
+        from core.ai_backends import RecordingClient
+        client = RecordingClient(client, settings.AI_REPLAY_DIR)
+    return client
+
+
+def get_client():
+    """Return the process-wide client for the configured backend, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def probe_working_model(client):
+    """
+    Find the first preferred model this API key can actually use.
+
+    Returns:
+        Model name, or None if the API is unreachable or no model works
+    """
+    try:
+        # API returns "models/gemini-..." but we need just "gemini-..."
+        available_models = [model.name.replace('models/', '') for model in client.models.list()]
+    except Exception as e:
+        logger.warning(f"Could not connect to Gemini API: {e}")
+        return None
+
+    logger.info(f"API Key supports these models: {available_models}")
+    supported_models = [model for model in PREFERRED_MODELS if model in available_models]
+    if not supported_models:
+        logger.error(f"None of the preferred models are available! Available models: {available_models}")
+        return None
+
+    for model_name in supported_models:
+        try:
+            client.models.generate_content(model=model_name, contents="test")
+            logger.info(f"✅ Successfully connected to Gemini - Model: {model_name}")
+            return model_name
+        except Exception as e:
+            logger.warning(f"Model {model_name} failed: {e}")
+    return None
+
+
+def get_working_model():
+    """
+    Return the model to use for generation, probing once per cache TTL.
+
+    The result is shared through the cache; within a process a lock keeps
+    concurrent first requests from probing in parallel. The offline backends
+    have nothing to probe and always use DEFAULT_MODEL.
+    """
+    if get_backend() in ('fake', 'replay'):
+        return DEFAULT_MODEL
+
+    model = cache.get(WORKING_MODEL_CACHE_KEY)
+    if model:
+        return model
+
+    with _probe_lock:
+        model = cache.get(WORKING_MODEL_CACHE_KEY)
+        if model:
+            return model
+
+        try:
+            model = probe_working_model(get_client())
+        except Exception as e:
+            logger.warning(f"Could not initialize Gemini client: {e}")
+            model = None
+
+        if model:
+            cache.set(WORKING_MODEL_CACHE_KEY, model, WORKING_MODEL_TTL)
+        else:
+            model = DEFAULT_MODEL
+            cache.set(WORKING_MODEL_CACHE_KEY, model, FAILED_PROBE_TTL)
+        return model
+
+
+def reset():
+    """Forget the client and the cached model (used by tests and after key rotation)."""
+    global _client
+    with _client_lock:
+        _client = None
+    cache.delete(WORKING_MODEL_CACHE_KEY)
+
+
+class AIUnavailable(Exception):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state is shared by all workers through the cache.
+
+    Closed: calls go through and failures are counted per window. Open: calls
+    are refused until the cooldown key expires. Half-open: the first caller to
+    claim the trial key makes one real call, which either closes the breaker or
+    opens it again. Transitions are logged and counted (see ``metrics()``).
+
+    ``aallow``/``arecord_success``/``arecord_failure`` do the same through the
+    cache's async API, for ``acall()`` on the event loop.
+    """
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        prefix = f'ai:breaker:{name}'
+        self.failures_key = f'{prefix}:failures'
+        self.open_key = f'{prefix}:open'
+        self.tripped_key = f'{prefix}:tripped'
+        self.trial_key = f'{prefix}:trial'
+        self.transitions_key = f'{prefix}:transitions'
+
+    def allow(self):
+        """Whether a call may go out now (claims the trial call when half-open)."""
+        state = cache.get_many([self.open_key, self.tripped_key])
+        if self.open_key in state:
+            return False
+        if self.tripped_key in state:
+            # Only one trial at a time; it expires in case the caller dies mid-call
+            return cache.add(self.trial_key, True, timeout=CALL_DEADLINE + 5)
+        return True
+
+    def record_success(self):
+        if cache.get(self.tripped_key):
+            cache.delete_many([self.tripped_key, self.trial_key, self.failures_key])
+            self._transition('closed')
+
+    def record_failure(self):
+        if cache.get(self.tripped_key):
+            # The half-open trial failed: back to open for another cooldown
+            cache.set(self.open_key, True, timeout=self.cooldown)
+            cache.delete(self.trial_key)
+            self._transition('opened')
+            return
+
+        cache.add(self.failures_key, 0, timeout=self.window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:  # expired between add() and incr()
+            cache.set(self.failures_key, 1, timeout=self.window)
+            failures = 1
+        # add() so that only one worker records the transition
+        if failures >= self.threshold and cache.add(self.open_key, True, timeout=self.cooldown):
+            cache.set(self.tripped_key, True, timeout=None)
+            self._transition('opened')
+
+    def record(self, outcome):
+        """Record how a call ended: 'success', 'failure', or None for errors that aren't the backend's."""
+        if outcome == 'success':
+            self.record_success()
+        elif outcome == 'failure':
+            self.record_failure()
+
+    async def arecord(self, outcome):
+        if outcome == 'success':
+            await self.arecord_success()
+        elif outcome == 'failure':
+            await self.arecord_failure()
+
+    async def aallow(self):
+        state = await cache.aget_many([self.open_key, self.tripped_key])
+        if self.open_key in state:
+            return False
+        if self.tripped_key in state:
+            return await cache.aadd(self.trial_key, True, timeout=CALL_DEADLINE + 5)
+        return True
+
+    async def arecord_success(self):
+        if await cache.aget(self.tripped_key):
+            await cache.adelete_many([self.tripped_key, self.trial_key, self.failures_key])
+            await self._atransition('closed')
+
+    async def arecord_failure(self):
+        if await cache.aget(self.tripped_key):
+            await cache.aset(self.open_key, True, timeout=self.cooldown)
+            await cache.adelete(self.trial_key)
+            await self._atransition('opened')
+            return
+
+        await cache.aadd(self.failures_key, 0, timeout=self.window)
+        try:
+            failures = await cache.aincr(self.failures_key)
+        except ValueError:
+            await cache.aset(self.failures_key, 1, timeout=self.window)
+            failures = 1
+        if failures >= self.threshold and await cache.aadd(self.open_key, True, timeout=self.cooldown):
+            await cache.aset(self.tripped_key, True, timeout=None)
+            await self._atransition('opened')
+
+    def _transition(self, state):
+        transitions = cache.get(self.transitions_key) or {'opened': 0, 'closed': 0}
+        cache.set(self.transitions_key, self._count_transition(transitions, state), timeout=None)
+
+    async def _atransition(self, state):
+        transitions = await cache.aget(self.transitions_key) or {'opened': 0, 'closed': 0}
+        await cache.aset(self.transitions_key, self._count_transition(transitions, state), timeout=None)
+
+    def _count_transition(self, transitions, state):
+        logger.warning(f"AI circuit breaker '{self.name}' {state}")
+        transitions[state] += 1
+        transitions['last'] = state
+        transitions['last_at'] = time.time()
+        return transitions
+
+    def state(self):
+        state = cache.get_many([self.open_key, self.tripped_key])
+        if self.open_key in state:
+            return 'open'
+        return 'half-open' if self.tripped_key in state else 'closed'
+
+    def metrics(self):
+        """Current state, failures in the window and open/close transition counts."""
+        transitions = cache.get(self.transitions_key) or {'opened': 0, 'closed': 0}
+        return {
+            'state': self.state(),
+            'failures': cache.get(self.failures_key, 0),
+            **transitions,
+        }
+
+    def reset(self):
+        cache.delete_many([
+            self.failures_key, self.open_key, self.tripped_key, self.trial_key, self.transitions_key,
+        ])
+
+
+breaker = CircuitBreaker('gemini')
+
+
+_error_types = None
+
+
+def error_types():
+    """
+    The exception types a Gemini call fails with, as ``(api_errors, transport_errors)``.
+
+    API errors carry the HTTP status Gemini (or a stand-in backend) answered
+    with; transport errors are timeouts and connection failures. Resolved on
+    first use, so importing this module doesn't import the SDK.
+    """
+    global _error_types
+    if _error_types is None:
+        from core.ai_backends import BackendError
+
+        api_errors, transport_errors = [BackendError], [TimeoutError, asyncio.TimeoutError, ConnectionError]
+        try:
+            import httpx
+            from google.genai import errors
+        except ImportError:  # Only the stand-in backends are available
+            pass
+        else:
+            api_errors.append(errors.APIError)
+            transport_errors.append(httpx.TransportError)
+        _error_types = (tuple(api_errors), tuple(transport_errors))
+    return _error_types
+
+
+def is_api_error(error):
+    """Whether ``error`` is Gemini answering with an error status."""
+    return isinstance(error, error_types()[0])
+
+
+def is_retryable(error):
+    """Timeouts, connection problems, rate limits and 5xx responses are worth retrying."""
+    api_errors, transport_errors = error_types()
+    if isinstance(error, transport_errors):
+        return True
+    if not isinstance(error, api_errors):
+        return False
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and (code in (408, 429) or code >= 500)
+
+
+def request_config(config, timeout):
+    """Add an HTTP timeout (the SDK takes milliseconds) to a generation config."""
+    return {**(config or {}), 'http_options': {'timeout': max(int(timeout * 1000), 1)}}
+
+
+def _backoff(attempt):
+    # Full jitter, so workers that failed together don't retry together
+    return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+
+def _budget(deadline, retries):
+    """When the call must be done by (monotonic clock), and how many retries it gets."""
+    expires = time.monotonic() + (CALL_DEADLINE if deadline is None else deadline)
+    return expires, CALL_RETRIES if retries is None else retries
+
+
+def _after_failure(error, attempt, retries, expires):
+    """
+    Decide what a failed attempt of ``call()``/``acall()`` leads to.
+
+    Returns:
+        ``(delay, outcome)``: retry after ``delay`` seconds, or, when ``delay``
+        is None, record ``outcome`` with the breaker and re-raise
+    """
+    if not is_retryable(error):
+        # An API error means Gemini answered, it just didn't like the request;
+        # anything else isn't Gemini's doing at all
+        return None, 'success' if is_api_error(error) else None
+    delay = _backoff(attempt)
+    if attempt == retries or time.monotonic() + delay >= expires:
+        return None, 'failure'
+    return delay, None
+
+
+def call(request, deadline=None, retries=None):
+    """
+    Run ``request(timeout)`` against Gemini with a deadline, retries and the breaker.
+
+    ``request`` is called with the seconds left before the deadline and should
+    pass them on to the SDK (see ``request_config``). Only timeouts, connection
+    errors and retryable API statuses are retried. Other API errors (e.g. a 400
+    for a bad prompt) are raised straight away and don't count against the
+    breaker; any other exception is raised without touching the breaker at all.
+
+    Raises:
+        AIUnavailable: If the breaker is open
+    """
+    if not breaker.allow():
+        raise AIUnavailable('Gemini circuit breaker is open')
+    expires, retries = _budget(deadline, retries)
+
+    for attempt in range(retries + 1):
+        try:
+            result = request(max(expires - time.monotonic(), 0.001))
+        except Exception as e:
+            delay, outcome = _after_failure(e, attempt, retries, expires)
+            if delay is None:
+                breaker.record(outcome)
+                raise
+            logger.info(f"Retrying Gemini call after error: {e}")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall(request, deadline=None, retries=None):
+    """Async version of ``call()``: ``request(timeout)`` returns an awaitable."""
+    if not await breaker.aallow():
+        raise AIUnavailable('Gemini circuit breaker is open')
+    expires, retries = _budget(deadline, retries)
+
+    for attempt in range(retries + 1):
+        remaining = max(expires - time.monotonic(), 0.001)
+        try:
+            result = await asyncio.wait_for(request(remaining), remaining)
+        except Exception as e:
+            delay, outcome = _after_failure(e, attempt, retries, expires)
+            if delay is None:
+                await breaker.arecord(outcome)
+                raise
+            logger.info(f"Retrying Gemini call after error: {e}")
+            await asyncio.sleep(delay)
+        else:
+            await breaker.arecord_success()
+            return result
@@ -0,0 +1,227 @@
+"""
+Stand-ins for the Gemini SDK client, selected with ``settings.AI_BACKEND``.
+
+- ``gemini``: the real SDK client (default)
+- ``fake``: answers locally and deterministically, with injectable latency
+  (``AI_FAKE_LATENCY``) and error rate (``AI_FAKE_ERROR_RATE``), so the AI
+  paths can be tested and load-tested without network access
+- ``record``: calls Gemini and saves every response under ``AI_REPLAY_DIR``
+- ``replay``: serves the responses saved by ``record`` from disk, and fails
+  like a 404 for prompts that were never recorded
+
+Each client exposes the parts of ``genai.Client`` this project uses
+(``models.generate_content``, ``models.generate_content_stream``,
+``aio.models.generate_content`` and ``aio.models.generate_content_stream``),
+so callers don't know which one they have.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+
+class BackendError(Exception):
+    """Error raised by a stand-in backend; ``code`` mirrors the SDK's APIError."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def _request_data(contents, config):
+    # The HTTP timeout changes from call to call and doesn't affect the answer
+    config = {key: value for key, value in (config or {}).items() if key != 'http_options'}
+    return json.dumps({'contents': contents, 'config': config}, sort_keys=True, default=str)
+
+
+def request_key(contents, config=None):
+    """Stable key for a generation request, used to name recordings."""
+    return hashlib.sha256(_request_data(contents, config).encode()).hexdigest()
+
+
+def _chunks(text, size=40):
+    return [SimpleNamespace(text=text[i:i + size]) for i in range(0, len(text), size)] or [SimpleNamespace(text='')]
+
+
+async def _achunks(text):
+    for chunk in _chunks(text):
+        yield chunk
+
+
+# --- Fake ---
+
+class FakeModels:
+    """Answers from the prompt alone: same request, same answer."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def answer(self, contents, config=None):
+        if self._should_fail():
+            raise BackendError(503, 'Fake backend: injected error')
+
+        config = config or {}
+        if config.get('response_mime_type') == 'application/json':
+            # Recommendation requests: pick the first bikes offered in the prompt
+            bike_ids = [int(bike_id) for bike_id in re.findall(r'Bike ID: (\d+)', str(contents))][:3]
+            return json.dumps({'recommendations': [
+                {'bike_id': bike_id, 'reason': 'Offline recommendation from the fake AI backend.'}
+                for bike_id in bike_ids
+            ]})
+        digest = request_key(contents, config)[:8]
+        return f"Thanks for your question! This is an offline answer from the fake AI backend (ref {digest})."
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self.answer(contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        time.sleep(self.latency)
+        yield from _chunks(self.answer(contents, config))
+
+    def list(self):
+        return []
+
+
+class AsyncFakeModels:
+    def __init__(self, models):
+        self._models = models
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self._models.latency)
+        return SimpleNamespace(text=self._models.answer(contents, config))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        # Like the SDK: awaiting the call gives an async iterator of chunks
+        await asyncio.sleep(self._models.latency)
+        return _achunks(self._models.answer(contents, config))
+
+
+class FakeClient:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.models = FakeModels(latency, error_rate, seed)
+        self.aio = SimpleNamespace(models=AsyncFakeModels(self.models))
+
+
+# --- Record / replay ---
+
+class RecordingStore:
+    """One JSON file per request under ``directory``, named by ``request_key``."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, contents, config):
+        return self.directory / f'{request_key(contents, config)}.json'
+
+    def load(self, contents, config):
+        path = self.path(contents, config)
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))['text']
+        except FileNotFoundError:
+            raise BackendError(404, f'No recorded response for this request ({path.name})') from None
+
+    def save(self, contents, config, text):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(contents, config)
+        # Write then rename, so a concurrent replay never reads half a file
+        temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps({'request': _request_data(contents, config), 'text': text}), encoding='utf-8')
+        temporary.replace(path)
+
+
+class ReplayModels:
+    def __init__(self, store):
+        self.store = store
+
+    def generate_content(self, model, contents, config=None):
+        return SimpleNamespace(text=self.store.load(contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        yield from _chunks(self.store.load(contents, config))
+
+    def list(self):
+        return []
+
+
+class AsyncReplayModels:
+    def __init__(self, store):
+        self.store = store
+
+    async def generate_content(self, model, contents, config=None):
+        return SimpleNamespace(text=self.store.load(contents, config))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        return _achunks(self.store.load(contents, config))
+
+
+class ReplayClient:
+    def __init__(self, directory):
+        store = RecordingStore(directory)
+        self.models = ReplayModels(store)
+        self.aio = SimpleNamespace(models=AsyncReplayModels(store))
+
+
+class RecordingModels:
+    def __init__(self, models, store):
+        self._models = models
+        self.store = store
+
+    def generate_content(self, model, contents, config=None):
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        self.store.save(contents, config, response.text)
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        chunks = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(chunk.text or '')
+            yield chunk
+        self.store.save(contents, config, ''.join(chunks))
+
+    def list(self):
+        return self._models.list()
+
+
+class AsyncRecordingModels:
+    def __init__(self, models, store):
+        self._models = models
+        self.store = store
+
+    async def generate_content(self, model, contents, config=None):
+        response = await self._models.generate_content(model=model, contents=contents, config=config)
+        self.store.save(contents, config, response.text)
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None):
+        stream = await self._models.generate_content_stream(model=model, contents=contents, config=config)
+
+        async def recorded():
+            chunks = []
+            async for chunk in stream:
+                chunks.append(chunk.text or '')
+                yield chunk
+            self.store.save(contents, config, ''.join(chunks))
+        return recorded()
+
+
+class RecordingClient:
+    """Wraps a real client and saves each response for ``ReplayClient``."""
+
+    def __init__(self, client, directory):
+        store = RecordingStore(directory)
+        self.models = RecordingModels(client.models, store)
+        self.aio = SimpleNamespace(models=AsyncRecordingModels(client.aio.models, store))
@@ -0,0 +1,139 @@
+"""
+Booking creation with double-booking protection.
+
+The overlap check and the insert run in one transaction that first locks the
+bike: a ``SELECT ... FOR UPDATE`` row lock on PostgreSQL, and on SQLite the
+``IMMEDIATE`` transaction mode configured in settings, which takes the database
+write lock at ``BEGIN``. Either way concurrent attempts for the same bike are
+serialized, so only one of two overlapping requests can win.
+
+A new booking holds its window while the rider pays: a ``pending`` booking
+blocks the bike for ``BOOKING_PAYMENT_HOLD`` seconds after it is created.
+Payment and admin approval check the window again under the same lock
+(``confirm_payment``/``confirm_approval``), so a booking whose hold ran out
+can't be confirmed over one made in the meantime.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Booking, EBike
+
+# Bookings in these states hold the bike for their whole window
+BLOCKING_STATUSES = ('approved', 'awaiting_approval')
+
+
+class BookingConflictError(Exception):
+    """Raised when a bike already has an overlapping approved, paid or payment-held booking."""
+
+    def __init__(self, ebike, conflicting_booking):
+        self.ebike = ebike
+        self.conflicting_booking = conflicting_booking
+        super().__init__(
+            f"{ebike.name} is already booked from "
+            f"{conflicting_booking.start_date} {conflicting_booking.start_time:%H:%M} to "
+            f"{conflicting_booking.end_date} {conflicting_booking.end_time:%H:%M}. "
+            f"Please choose different dates."
+        )
+
+
+def blocking_bookings(now=None):
+    """Bookings that make their bike unavailable to other riders, including unexpired payment holds."""
+    now = now or timezone.now()
+    hold = timedelta(seconds=getattr(settings, 'BOOKING_PAYMENT_HOLD', 30 * 60))
+    return Booking.objects.filter(
+        Q(status__in=BLOCKING_STATUSES) | Q(status='pending', created_at__gt=now - hold)
+    )
+
+
+def _conflicting_booking(ebike, booking):
+    """The earliest blocking booking overlapping ``booking``'s window, other than itself."""
+    start_at = Booking.combine_datetime(booking.start_date, booking.start_time)
+    end_at = Booking.combine_datetime(booking.end_date, booking.end_time)
+    return (
+        blocking_bookings()
+        .filter(ebike=ebike)
+        .exclude(pk=booking.pk)
+        .overlapping(start_at, end_at)
+        .order_by('start_at')
+        .first()
+    )
+
+
+def create_booking(booking):
+    """
+    Save a new booking unless its bike has an overlapping blocking booking.
+
+    Args:
+        booking: Unsaved Booking instance with ebike, rider, dates and price set
+
+    Returns:
+        The saved booking
+
+    Raises:
+        BookingConflictError: If the bike is already booked for an overlapping window
+    """
+    with transaction.atomic():
+        # Row lock on PostgreSQL; ignored on SQLite, where BEGIN IMMEDIATE already serializes writers
+        ebike = EBike.objects.select_for_update().get(pk=booking.ebike_id)
+
+        conflicting_booking = _conflicting_booking(ebike, booking)
+        if conflicting_booking is not None:
+            raise BookingConflictError(ebike, conflicting_booking)
+
+        booking.save()
+
+    return booking
+
+
+def confirm_payment(booking, order_id, payment_id=None):
+    """
+    Record a captured payment and move the booking to ``awaiting_approval``.
+
+    The money has already been taken, so the payment is recorded either way.
+    If another booking took the window after this one's payment hold ran out,
+    the booking is cancelled instead so staff can refund it.
+
+    Raises:
+        BookingConflictError: If the booking was cancelled because of a conflict
+    """
+    with transaction.atomic():
+        ebike = EBike.objects.select_for_update().get(pk=booking.ebike_id)
+
+        conflicting_booking = _conflicting_booking(ebike, booking)
+        booking.is_paid = True
+        booking.status = 'cancelled' if conflicting_booking is not None else 'awaiting_approval'
+        booking.razorpay_order_id = order_id
+        update_fields = ['is_paid', 'status', 'razorpay_order_id']
+        if payment_id:
+            booking.razorpay_payment_id = payment_id
+            update_fields.append('razorpay_payment_id')
+        booking.save(update_fields=update_fields)
+
+    if conflicting_booking is not None:
+        raise BookingConflictError(ebike, conflicting_booking)
+    return booking
+
+
+def confirm_approval(booking):
+    """
+    Approve a booking unless its bike is already booked for an overlapping window.
+
+    Raises:
+        BookingConflictError: If another blocking booking overlaps this one
+    """
+    with transaction.atomic():
+        ebike = EBike.objects.select_for_update().get(pk=booking.ebike_id)
+
+        conflicting_booking = _conflicting_booking(ebike, booking)
+        if conflicting_booking is not None:
+            raise BookingConflictError(ebike, conflicting_booking)
+
+        booking.status = 'approved'
+        booking.save()
+
+    return booking
@@ -0,0 +1,103 @@
+"""
+In-process cache for chatbot answers.
+
+FAQ-style questions ("what are your hours?") are asked over and over; caching
+the answer keyed on the normalized question, the chat context and the user's
+role turns a multi-second Gemini call into a dictionary lookup. Entries are
+evicted least-recently-used first once the cache is full, and expire after a
+TTL so edits to the prompt or business info show up without a restart.
+
+Answers generated for a specific user (the prompt includes their name) are
+never stored in the shared tier; they go in a per-user namespace instead.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key."""
+    message = re.sub(r'[^\w\s]', ' ', message.lower())
+    return ' '.join(message.split())
+
+
+class AnswerCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries=500, ttl=60 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=getattr(settings, 'CHATBOT_CACHE_MAX_ENTRIES', 500),
+    ttl=getattr(settings, 'CHATBOT_CACHE_TTL', 60 * 60),
+)
+
+
+def user_role(user):
+    """Role string used in cache keys (matches core.views.get_user_role)."""
+    if not user or not user.is_authenticated:
+        return 'guest'
+    if getattr(user, 'is_rider', False):
+        return 'rider'
+    if getattr(user, 'is_vehicle_provider', False):
+        return 'provider'
+    if user.is_staff:
+        return 'admin'
+    return 'user'
+
+
+def answer_cache_key(message, context, user=None):
+    """
+    Build the cache key for a chatbot answer.
+
+    Anonymous questions share the key across all visitors; answers for a
+    logged-in user are personalized, so their key is namespaced by user ID
+    and never served to anyone else.
+    """
+    tier = f'user:{user.pk}' if user is not None and user.is_authenticated else 'shared'
+    return (tier, context, user_role(user), normalize_message(message))
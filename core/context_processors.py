@@ -1,18 +1,25 @@
-from django.apps import apps
 from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
 
 def unread_notification_count(request):
-    try:
-        Notification = apps.get_model('core', 'Notification')
-        public_count = Notification.objects.filter(is_public=True).count()
-        if request.user.is_authenticated:
-            user_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-            count = public_count + user_count
-        else:
-            count = public_count
-    except Exception:
-        count = 0
-    return {'unread_notification_count': count} 
+    """
+    Expose the unread notification count to templates.
+
+    The value is lazy, so nothing is counted unless a template actually uses
+    it, and both parts come from the cache (see core.notifications).
+    """
+    def count():
+        from core.notifications import public_notification_count, user_unread_count
+        try:
+            total = public_notification_count()
+            if request.user.is_authenticated:
+                total += user_unread_count(request.user)
+        except Exception:
+            total = 0
+        return total
+
+    return {'unread_notification_count': SimpleLazyObject(count)}
 
 
 def availability_sync_info(request):
@@ -0,0 +1,113 @@
+"""
+Bounded per-session memory for the chatbot.
+
+Each browser session keeps a ring buffer of its last ``CHATBOT_HISTORY_TURNS``
+question/answer pairs plus a short rolling summary of everything older. When
+the buffer overflows, the oldest half is folded into the summary (see
+``core.utils.summarize_conversation``), so the prompt stays the same size no
+matter how long the chat runs while follow-up questions keep their context.
+
+Conversations live in the cache under the session key, one compact entry per
+session, and expire after ``CHATBOT_HISTORY_TTL`` of inactivity. The cache is
+used rather than the session itself because streamed answers finish after the
+session middleware has already saved the session.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+MAX_TURNS = getattr(settings, 'CHATBOT_HISTORY_TURNS', 6)
+HISTORY_TTL = getattr(settings, 'CHATBOT_HISTORY_TTL', 2 * 60 * 60)
+# Long messages are clipped before they are stored
+MAX_TURN_CHARS = 500
+MAX_SUMMARY_CHARS = 1000
+
+CACHE_KEY = 'chatbot:conversation:{session_key}'
+
+
+def _clip(text, limit):
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class Conversation:
+    """Last few turns of a chat plus a summary of the ones before them."""
+
+    def __init__(self, turns=None, summary=''):
+        self.turns = [tuple(turn) for turn in turns or []]
+        self.summary = summary
+
+    def __bool__(self):
+        return bool(self.turns or self.summary)
+
+    def add_turn(self, question, answer, max_turns=None):
+        """
+        Append a turn; if the buffer overflows, remove and return the oldest half.
+
+        The caller folds the returned turns into ``summary``. Folding half the
+        buffer at a time means a summary is regenerated every few turns rather
+        than on every message once the buffer is full.
+        """
+        max_turns = max_turns or MAX_TURNS
+        self.turns.append((_clip(question, MAX_TURN_CHARS), _clip(answer, MAX_TURN_CHARS)))
+        if len(self.turns) <= max_turns:
+            return []
+        keep = max(max_turns // 2, 1)
+        overflow, self.turns = self.turns[:-keep], self.turns[-keep:]
+        return overflow
+
+    def prompt_block(self):
+        """The conversation so far, formatted for the chatbot prompt."""
+        if not self:
+            return ''
+        lines = ['CONVERSATION SO FAR:']
+        if self.summary:
+            lines.append(f'Earlier in this chat: {self.summary}')
+        for question, answer in self.turns:
+            lines.append(f'User: {question}')
+            lines.append(f'Assistant: {answer}')
+        return '\n'.join(lines)
+
+    def to_data(self):
+        return {'turns': [list(turn) for turn in self.turns], 'summary': self.summary}
+
+    @classmethod
+    def from_data(cls, data):
+        data = data or {}
+        return cls(data.get('turns'), data.get('summary', ''))
+
+
+def fallback_summary(summary, turns):
+    """Summary built without the model: the questions asked, most recent kept."""
+    asked = '; '.join(question for question, _ in turns)
+    combined = f'{summary} The user also asked: {asked}.' if summary else f'The user asked: {asked}.'
+    return combined if len(combined) <= MAX_SUMMARY_CHARS else '…' + combined[-(MAX_SUMMARY_CHARS - 1):]
+
+
+def _session_cache_key(session):
+    return CACHE_KEY.format(session_key=session.session_key)
+
+
+def load_conversation(session):
+    if not session.session_key:
+        return Conversation()
+    return Conversation.from_data(cache.get(_session_cache_key(session)))
+
+
+def save_conversation(session, conversation):
+    if not session.session_key:
+        # Anonymous visitors get a session on their first chat message
+        session.create()
+    cache.set(_session_cache_key(session), conversation.to_data(), timeout=HISTORY_TTL)
+
+
+async def aload_conversation(session):
+    if not session.session_key:
+        return Conversation()
+    return Conversation.from_data(await cache.aget(_session_cache_key(session)))
+
+
+async def asave_conversation(session, conversation):
+    if not session.session_key:
+        await session.acreate()
+    await cache.aset(_session_cache_key(session), conversation.to_data(), timeout=HISTORY_TTL)
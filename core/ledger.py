@@ -0,0 +1,184 @@
+"""
+Provider earnings and balance ledger.
+
+``ProviderLedger`` rows hold each provider's running totals and are adjusted
+incrementally by the Booking/Withdrawal signals in core.signals. The grouped
+aggregate queries below compute the same totals from scratch; they are used to
+build missing rows and by the ``reconcile_provider_ledgers`` command to detect
+and repair drift.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from core.models import Booking, ProviderLedger, User, Withdrawal
+
+# Platform keeps 10% of every approved booking
+PLATFORM_CHARGE_RATE = ProviderLedger.PLATFORM_CHARGE_RATE
+
+# Which ledger column each withdrawal status is counted in (rejected ones aren't counted)
+WITHDRAWAL_LEDGER_FIELDS = {
+    'pending': 'pending_withdrawals',
+    'approved': 'approved_withdrawals',
+    'completed': 'completed_withdrawals',
+}
+
+LEDGER_FIELDS = ('total_earnings',) + tuple(WITHDRAWAL_LEDGER_FIELDS.values())
+
+CENTS = Decimal('0.01')
+
+
+def earnings_by_provider(provider_ids=None):
+    """Map provider ID -> sum of earning booking totals (one grouped query)."""
+    bookings = Booking.objects.filter(Booking.EARNING_FILTER)
+    if provider_ids is not None:
+        bookings = bookings.filter(ebike__provider_id__in=provider_ids)
+    return dict(
+        bookings.order_by()
+        .values_list('ebike__provider_id')
+        .annotate(total=Sum('total_price'))
+    )
+
+
+def compute_ledger_totals(provider_ids=None):
+    """
+    Compute ledger totals from scratch for the given providers (or all of them).
+
+    Returns:
+        Dict mapping provider ID -> dict of LEDGER_FIELDS values
+    """
+    def empty():
+        return {field: Decimal('0.00') for field in LEDGER_FIELDS}
+
+    totals = {}
+    for provider_id, amount in earnings_by_provider(provider_ids).items():
+        totals.setdefault(provider_id, empty())['total_earnings'] = Decimal(amount or 0).quantize(CENTS)
+
+    withdrawals = Withdrawal.objects.filter(status__in=WITHDRAWAL_LEDGER_FIELDS)
+    if provider_ids is not None:
+        withdrawals = withdrawals.filter(provider_id__in=provider_ids)
+    grouped = (
+        withdrawals.order_by()
+        .values_list('provider_id', 'status')
+        .annotate(total=Sum('amount'))
+    )
+    for provider_id, status, amount in grouped:
+        totals.setdefault(provider_id, empty())[WITHDRAWAL_LEDGER_FIELDS[status]] = Decimal(amount or 0).quantize(CENTS)
+
+    if provider_ids is not None:
+        for provider_id in provider_ids:
+            totals.setdefault(provider_id, empty())
+    return totals
+
+
+def rebuild_provider_ledgers(provider_ids=None, dry_run=False):
+    """
+    Recompute ledgers from bookings and withdrawals and report drift.
+
+    Args:
+        provider_ids: Optional list of provider IDs (defaults to every vehicle provider)
+        dry_run: Only report drift, don't write anything
+
+    Returns:
+        List of (provider_id, field, stored_value, expected_value) tuples for every
+        column that didn't match, including all columns of missing rows
+    """
+    if provider_ids is None:
+        provider_ids = list(User.objects.filter(is_vehicle_provider=True).values_list('id', flat=True))
+
+    expected = compute_ledger_totals(provider_ids)
+    existing = ProviderLedger.objects.in_bulk(provider_ids, field_name='provider_id')
+
+    drift = []
+    to_create = []
+    to_update = []
+    for provider_id, values in expected.items():
+        ledger = existing.get(provider_id)
+        if ledger is None:
+            drift.extend((provider_id, field, None, value) for field, value in values.items())
+            to_create.append(ProviderLedger(provider_id=provider_id, **values))
+            continue
+
+        changed = False
+        for field, value in values.items():
+            stored = getattr(ledger, field)
+            if stored != value:
+                drift.append((provider_id, field, stored, value))
+                setattr(ledger, field, value)
+                changed = True
+        if changed:
+            to_update.append(ledger)
+
+    if not dry_run:
+        with transaction.atomic():
+            ProviderLedger.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+            ProviderLedger.objects.bulk_update(to_update, LEDGER_FIELDS, batch_size=500)
+    return drift
+
+
+def get_provider_ledger(provider):
+    """Return the provider's ledger row, building it from scratch if it doesn't exist yet."""
+    try:
+        return ProviderLedger.objects.get(provider=provider)
+    except ProviderLedger.DoesNotExist:
+        rebuild_provider_ledgers([provider.pk])
+        return ProviderLedger.objects.get(provider=provider)
+
+
+def apply_ledger_delta(provider_id, **deltas):
+    """
+    Add the given amounts to a provider's ledger columns in a single UPDATE.
+
+    Providers without a row yet are skipped; their row is built from scratch
+    (including this change) the first time it is read.
+    """
+    deltas = {field: amount for field, amount in deltas.items() if amount}
+    if not deltas or provider_id is None:
+        return
+    ProviderLedger.objects.filter(provider_id=provider_id).update(
+        **{field: F(field) + amount for field, amount in deltas.items()}
+    )
+
+
+def provider_ledgers(providers=None):
+    """
+    Build earnings and balance rows for many providers at once.
+
+    Reads the materialized ledger rows, so the whole table costs two queries
+    (providers joined with their ledger, plus one prefetch for bikes).
+
+    Args:
+        providers: Optional queryset of provider users (defaults to all vehicle providers)
+
+    Returns:
+        List of dicts with provider, username, profile_image, bikes, total_earnings,
+        platform_charges, pending_withdrawals and available_balance
+    """
+    if providers is None:
+        providers = User.objects.filter(is_vehicle_provider=True)
+    providers = list(providers.select_related('ledger').prefetch_related('ebikes'))
+
+    missing = [provider.pk for provider in providers if not hasattr(provider, 'ledger')]
+    if missing:
+        rebuild_provider_ledgers(missing)
+        ledgers = ProviderLedger.objects.in_bulk(missing, field_name='provider_id')
+        for provider in providers:
+            if provider.pk in ledgers:
+                provider.ledger = ledgers[provider.pk]
+
+    rows = []
+    for provider in providers:
+        ledger = provider.ledger
+        rows.append({
+            'provider': provider,
+            'username': provider.username,
+            'profile_image': provider.profile_image,
+            'bikes': list(provider.ebikes.all()),
+            'total_earnings': ledger.total_earnings,
+            'platform_charges': ledger.platform_charges,
+            'pending_withdrawals': ledger.reserved_withdrawals,
+            'available_balance': ledger.available_balance,
+        })
+    return rows
@@ -0,0 +1,203 @@
+"""
+Outbound email queue.
+
+Views call ``queue_email`` which only inserts an OutboundEmail row, so request
+latency no longer depends on the SMTP server. The ``send_queued_emails``
+management command calls ``deliver_queued_emails`` to drain the outbox over a
+single reused connection, retrying failed messages with exponential backoff.
+
+``send_batch`` sends a prepared batch straight away over one connection for
+admin actions that need to report per-recipient results.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Retry delay doubles after every failure (EMAIL_OUTBOX_RETRY_DELAY, then twice
+# that, and so on), capped at 1 hour
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+# Messages claimed by a worker that died mid-send are picked up again after this
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_email(subject, message, recipient_list, from_email=None, html_message=None):
+    """
+    Add an email to the outbox (same arguments as ``send_mail``).
+
+    Returns:
+        The OutboundEmail row, or None if there are no recipients
+    """
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=recipients,
+    )
+
+
+def max_attempts():
+    """Failed attempts after which a message is given up on (read per call so overrides apply)."""
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after ``attempts`` failures."""
+    base_delay = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60))
+    return min(base_delay * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+
+
+def claim_due_emails(limit=100):
+    """
+    Mark up to ``limit`` due messages as being sent by this worker.
+
+    The claim is a conditional UPDATE, so two workers never pick up the same row.
+    Due messages that have already used up their attempts (for example after
+    the limit was lowered) are marked failed instead of being sent again.
+    """
+    now = timezone.now()
+    due = Q(status='queued', next_attempt_at__lte=now) | Q(status='sending', locked_at__lt=now - CLAIM_TIMEOUT)
+    with transaction.atomic():
+        OutboundEmail.objects.filter(due, attempts__gte=max_attempts()).update(status='failed', locked_at=None)
+        ids = list(OutboundEmail.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+        OutboundEmail.objects.filter(due, id__in=ids).update(status='sending', locked_at=now)
+    return list(OutboundEmail.objects.filter(id__in=ids, status='sending', locked_at=now))
+
+
+def build_message(email, connection=None):
+    """Turn an outbox row into an EmailMultiAlternatives bound to ``connection``."""
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _mark_failed_attempt(email, error, attempt_limit):
+    email.attempts += 1
+    email.last_error = str(error)
+    email.locked_at = None
+    if email.attempts >= attempt_limit:
+        email.status = 'failed'
+        logger.error(f"Giving up on email #{email.id} to {email.recipients} after {email.attempts} attempts: {error}")
+    else:
+        email.status = 'queued'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning(f"Email #{email.id} to {email.recipients} failed (attempt {email.attempts}), retrying: {error}")
+    email.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'next_attempt_at'])
+
+
+def queue_message(message):
+    """Add an already built EmailMessage (e.g. one that failed to send) to the outbox."""
+    html_message = next(
+        (content for content, mimetype in getattr(message, 'alternatives', []) if mimetype == 'text/html'),
+        None,
+    )
+    return queue_email(message.subject, message.body, message.to, message.from_email, html_message)
+
+
+def send_batch(messages, connection=None):
+    """
+    Send prepared messages over a single connection, one at a time.
+
+    Sending individually on the open connection keeps the per-recipient
+    outcome: one rejected address doesn't fail the rest of the batch.
+
+    Args:
+        messages: Iterable of EmailMessage objects
+        connection: Optional email backend connection (defaults to get_connection())
+
+    Returns:
+        List of (message, error) tuples; error is None for messages that were sent
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.error(f"Could not open email connection for {len(messages)} message(s): {e}")
+        return [(message, e) for message in messages]
+
+    results = []
+    try:
+        for message in messages:
+            message.connection = connection
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                logger.warning(f"Failed to send '{message.subject}' to {message.to}: {e}")
+                results.append((message, e))
+            else:
+                results.append((message, None))
+    finally:
+        connection.close()
+    return results
+
+
+def deliver_queued_emails(limit=100, connection=None):
+    """
+    Send due outbox messages over one SMTP connection.
+
+    Args:
+        limit: Maximum number of messages to send in this batch
+        connection: Optional email backend connection (defaults to get_connection())
+
+    Returns:
+        Dict with counts of 'sent', 'retrying' and 'failed' messages
+    """
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    emails = claim_due_emails(limit)
+    if not emails:
+        return counts
+    attempt_limit = max_attempts()
+
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # Server unreachable: every claimed message counts as a failed attempt
+        for email in emails:
+            _mark_failed_attempt(email, e, attempt_limit)
+            counts['failed' if email.status == 'failed' else 'retrying'] += 1
+        return counts
+
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([build_message(email, connection)])
+            except Exception as e:
+                _mark_failed_attempt(email, e, attempt_limit)
+                counts['failed' if email.status == 'failed' else 'retrying'] += 1
+                continue
+            email.status = 'sent'
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.locked_at = None
+            email.last_error = ''
+            email.save(update_fields=['status', 'attempts', 'sent_at', 'locked_at', 'last_error'])
+            counts['sent'] += 1
+    finally:
+        connection.close()
+    return counts
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+
+from core import ai
+from core.chat_cache import answer_cache
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent chatbot throughput under WSGI (thread pool) and ASGI (one event loop) with the fake AI backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of concurrent chat requests (default: 200)',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=1.0,
+            help='Injected model latency in seconds (default: 1.0)',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Share of model calls that fail, 0.0-1.0 (default: 0.0)',
+        )
+        parser.add_argument(
+            '--wsgi-threads',
+            type=int,
+            default=8,
+            help='Worker threads for the WSGI run, e.g. gunicorn --threads (default: 8)',
+        )
+
+    def payload(self, i):
+        # Unique messages so the answer cache doesn't short-circuit the model call
+        return json.dumps({'message': f'benchmark question {i}', 'context': 'general'})
+
+    def run_wsgi(self, url, count, threads):
+        def chat(i):
+            return Client().post(url, data=self.payload(i), content_type='application/json').status_code
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(chat, range(count)))
+
+    async def run_asgi(self, url, count):
+        client = AsyncClient()
+        responses = await asyncio.gather(*(
+            client.post(url, data=self.payload(i), content_type='application/json') for i in range(count)
+        ))
+        return [response.status_code for response in responses]
+
+    def report(self, label, statuses, elapsed):
+        ok = sum(1 for status in statuses if status == 200)
+        self.stdout.write(f'  {label}: {elapsed:.2f}s, {ok / elapsed:.1f} chats/s ({ok}/{len(statuses)} OK)')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        count, latency, threads = options['requests'], options['latency'], options['wsgi_threads']
+        url = reverse('chatbot')
+
+        self.stdout.write(f"{count} concurrent chats, {latency}s model latency, {options['error_rate']:.0%} errors")
+        # Every request comes from one test client, which the rate limiter would throttle
+        with override_settings(AI_BACKEND='fake', AI_FAKE_LATENCY=latency, AI_FAKE_ERROR_RATE=options['error_rate'],
+                               RATE_LIMITS={'chatbot': {'default': None}}):
+            ai.reset()
+            ai.breaker.reset()
+            answer_cache.clear()
+            started = time.perf_counter()
+            statuses = self.run_wsgi(url, count, threads)
+            self.report(f'WSGI, {threads} threads', statuses, time.perf_counter() - started)
+
+            answer_cache.clear()
+            ai.breaker.reset()
+            started = time.perf_counter()
+            statuses = asyncio.run(self.run_asgi(url, count))
+            self.report('ASGI, 1 event loop', statuses, time.perf_counter() - started)
+            self.stdout.write(f"Circuit breaker after the ASGI run: {ai.breaker.metrics()}")
+        ai.reset()
+        answer_cache.clear()
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: counts outbound connection attempts made while
+# booting Django and importing the modules that used to probe Gemini at import.
+STARTUP_SCRIPT = r'''
+import json, socket, sys, time
+
+connections = []
+_connect = socket.socket.connect
+_getaddrinfo = socket.getaddrinfo
+def counting_connect(self, address):
+    connections.append(str(address))
+    return _connect(self, address)
+def counting_getaddrinfo(host, *args, **kwargs):
+    # Count lookups too: without network access the attempt fails before connect()
+    connections.append(str(host))
+    return _getaddrinfo(host, *args, **kwargs)
+socket.socket.connect = counting_connect
+socket.getaddrinfo = counting_getaddrinfo
+
+started = time.perf_counter()
+import django
+django.setup()
+import core.middleware, core.views
+startup = time.perf_counter() - started
+startup_connections = len(connections)
+
+result = {'startup_seconds': startup, 'startup_connections': startup_connections}
+if '--probe' in sys.argv:
+    from core.ai import get_working_model, reset
+    reset()
+    started = time.perf_counter()
+    result['model'] = get_working_model()
+    result['probe_seconds'] = time.perf_counter() - started
+    result['probe_connections'] = len(connections) - startup_connections
+print(json.dumps(result))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure process startup time and outbound connections made before the first AI request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=3,
+            help='Number of fresh interpreters to start (default: 3)',
+        )
+        parser.add_argument(
+            '--probe',
+            action='store_true',
+            help='Also time the first-use model probe (makes real API calls)',
+        )
+
+    def run_once(self, probe):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'ais_ebike_rental.settings'))
+        args = [sys.executable, '-c', STARTUP_SCRIPT] + (['--probe'] if probe else [])
+        output = subprocess.run(args, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        results = [self.run_once(options['probe']) for _ in range(options['runs'])]
+
+        startup = sorted(result['startup_seconds'] for result in results)
+        self.stdout.write(f"Startup (django.setup + import core.middleware/core.views), {len(results)} run(s):")
+        self.stdout.write(f"  median {startup[len(startup) // 2]:.3f}s, min {startup[0]:.3f}s, max {startup[-1]:.3f}s")
+        self.stdout.write(f"  outbound connection attempts: {max(result['startup_connections'] for result in results)}")
+
+        if options['probe']:
+            probe = sorted(result['probe_seconds'] for result in results)
+            self.stdout.write(f"First AI use (model probe, model={results[0]['model']}):")
+            self.stdout.write(f"  median {probe[len(probe) // 2]:.3f}s, "
+                              f"outbound connection attempts: {max(result['probe_connections'] for result in results)}")
+            self.stdout.write('Later requests and other workers reuse the model cached in the shared cache.')
+
+        if all(result['startup_connections'] == 0 for result in results):
+            self.stdout.write(self.style.SUCCESS('Startup made no outbound calls'))
+        else:
+            self.stdout.write(self.style.WARNING('Startup made outbound calls'))
@@ -0,0 +1,116 @@
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management.base import BaseCommand
+
+from core.mail import send_batch
+
+
+class SimulatedSMTPBackend(LocmemEmailBackend):
+    """
+    Locmem backend that behaves like SMTP: opening a connection costs a
+    handshake delay and send_messages opens/closes its own connection when
+    the caller hasn't opened one.
+    """
+
+    def __init__(self, *args, connect_latency=0.0, send_latency=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connect_latency = connect_latency
+        self.send_latency = send_latency
+        self.connection = None
+        self.connections_opened = 0
+
+    def open(self):
+        if self.connection:
+            return False
+        time.sleep(self.connect_latency)
+        self.connection = True
+        self.connections_opened += 1
+        return True
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, messages):
+        new_conn_created = self.open()
+        try:
+            time.sleep(self.send_latency * len(messages))
+            return super().send_messages(messages)
+        finally:
+            if new_conn_created:
+                self.close()
+
+
+class Command(BaseCommand):
+    help = 'Compare one send_mail per message against a single-connection batch (locmem backend, simulated SMTP latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=200,
+            help='Number of approval emails to send (default: 200)',
+        )
+        parser.add_argument(
+            '--connect-latency',
+            type=float,
+            default=0.05,
+            help='Simulated SMTP connect + TLS + login time in seconds (default: 0.05)',
+        )
+        parser.add_argument(
+            '--send-latency',
+            type=float,
+            default=0.005,
+            help='Simulated time to transmit one message in seconds (default: 0.005)',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        latency = {
+            'connect_latency': options['connect_latency'],
+            'send_latency': options['send_latency'],
+        }
+        backend = f'{__name__}.SimulatedSMTPBackend'
+
+        self.stdout.write(f'Sending {count} emails, connect latency {latency["connect_latency"]}s, '
+                          f'send latency {latency["send_latency"]}s per message')
+
+        # One send_mail per booking: every call opens and closes its own connection
+        connections = 0
+        started = time.perf_counter()
+        for i in range(count):
+            connection = get_connection(backend, **latency)
+            send_mail(
+                subject=f'Booking Confirmed #{i}',
+                message='Your booking has been approved.',
+                from_email='noreply@example.com',
+                recipient_list=[f'rider{i}@example.com'],
+                html_message='<p>Your booking has been approved.</p>',
+                connection=connection,
+            )
+            connections += connection.connections_opened
+        per_message = time.perf_counter() - started
+        self.stdout.write(f'  send_mail per message: {per_message:.3f}s ({connections} connections)')
+
+        # Render everything first, then send over a single connection
+        started = time.perf_counter()
+        emails = []
+        for i in range(count):
+            email = EmailMultiAlternatives(
+                subject=f'Booking Confirmed #{i}',
+                body='Your booking has been approved.',
+                from_email='noreply@example.com',
+                to=[f'rider{i}@example.com'],
+            )
+            email.attach_alternative('<p>Your booking has been approved.</p>', 'text/html')
+            emails.append(email)
+        connection = get_connection(backend, **latency)
+        results = send_batch(emails, connection=connection)
+        batched = time.perf_counter() - started
+        failures = sum(1 for _, error in results if error is not None)
+        self.stdout.write(f'  single connection:     {batched:.3f}s ({connection.connections_opened} connection, '
+                          f'{failures} failure(s))')
+
+        if batched > 0:
+            self.stdout.write(self.style.SUCCESS(f'Single connection is {per_message / batched:.1f}x faster'))
@@ -0,0 +1,106 @@
+import datetime
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image
+
+from core import pdf
+from core.models import Booking, EBike, User, Withdrawal
+from core.receipts import render_receipt_pdf
+from vehicle_providers.documents import render_statement_pdf, render_withdrawal_receipt_pdf, render_withdrawal_slip_pdf
+
+
+class Rollback(Exception):
+    pass
+
+
+def png(size):
+    buffer = BytesIO()
+    Image.new('RGB', (size, size), (0, 191, 166)).save(buffer, format='PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = 'Measure PDFs rendered per second for each document type, with a warm and a cold image cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Documents rendered per type and cache state (default: 50)',
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=10,
+            help="Bookings on the provider's statement (default: 10)",
+        )
+        parser.add_argument(
+            '--image-size',
+            type=int,
+            default=800,
+            help='Width and height in pixels of the sample bike and profile photos (default: 800)',
+        )
+
+    def sample_documents(self, bookings, image_size):
+        """Provider, rider, bike, bookings and a withdrawal, with real image files."""
+        provider = User.objects.create_user(username='pdf_benchmark_provider', is_vehicle_provider=True)
+        rider = User.objects.create_user(username='pdf_benchmark_rider', first_name='Bench', last_name='Rider',
+                                         email='rider@example.com', is_rider=True)
+        rider.profile_image.save('pdf_benchmark_rider.png', png(image_size))
+        ebike = EBike(name='Benchmark Bike', description='PDF benchmark bike', price_per_day=500,
+                      price_per_week=3000, provider=provider)
+        ebike.image.save('pdf_benchmark_bike.png', png(image_size))
+
+        start = datetime.date.today()
+        Booking.objects.bulk_create([
+            Booking(rider=rider, ebike=ebike, start_date=start, end_date=start + datetime.timedelta(days=1),
+                    total_price=Decimal('500.00'), status='approved', is_approved=True, is_paid=True)
+            for _ in range(bookings)
+        ])
+        booking = Booking.objects.select_related('rider', 'ebike').filter(ebike=ebike).first()
+        withdrawal = Withdrawal.objects.create(
+            provider=provider, amount=Decimal('250.00'), account_holder_name='Bench Provider',
+            account_number='123456789012', bank_name='Test Bank', ifsc_code='TEST0001234',
+            status='completed', transaction_id='TXN-BENCHMARK',
+        )
+        return {
+            'Booking receipt': lambda: render_receipt_pdf(booking),
+            'Provider statement': lambda: render_statement_pdf(provider),
+            'Withdrawal slip': lambda: render_withdrawal_slip_pdf(withdrawal),
+            'Withdrawal receipt': lambda: render_withdrawal_receipt_pdf(withdrawal),
+        }
+
+    def measure(self, render, iterations, cold):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            if cold:
+                pdf.image_cache.clear()
+            render()
+        return iterations / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(f"{iterations} PDFs per document type, {options['bookings']} bookings on the statement")
+
+        # Sample rows and images are thrown away afterwards
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            try:
+                with transaction.atomic():
+                    documents = self.sample_documents(options['bookings'], options['image_size'])
+                    for name, render in documents.items():
+                        render()  # warm up fonts and the image cache
+                        cold = self.measure(render, iterations, cold=True)
+                        warm = self.measure(render, iterations, cold=False)
+                        self.stdout.write(f'  {name}: {warm:.1f} PDFs/s cached images, {cold:.1f} PDFs/s uncached')
+                    raise Rollback
+            except Rollback:
+                pass
+        pdf.image_cache.clear()
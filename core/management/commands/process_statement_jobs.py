@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vehicle_providers.statement_jobs import expire_statement_jobs, process_statement_jobs
+
+
+class Command(BaseCommand):
+    help = 'Render queued provider statements into private storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='Maximum number of statements to render per pass (default: 1)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll for new jobs instead of exiting after one pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when running with --loop (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        loop = options.get('loop', False)
+
+        while True:
+            counts = process_statement_jobs(limit=batch_size)
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Rendered {counts['done']} statement(s), {counts['failed']} failed, "
+                    f"{counts['lost']} taken over by another worker"
+                )
+            expired = expire_statement_jobs()
+            if expired:
+                self.stdout.write(f"Deleted {expired} expired statement(s)")
+
+            if not loop:
+                break
+            # Work through a backlog straight away, otherwise wait for new jobs
+            if sum(counts.values()) < batch_size:
+                time.sleep(options['interval'])
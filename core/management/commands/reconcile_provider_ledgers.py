@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from core.ledger import rebuild_provider_ledgers
+
+
+class Command(BaseCommand):
+    help = 'Rebuild provider balance ledgers from bookings and withdrawals and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drift, do not rewrite the ledgers',
+        )
+        parser.add_argument(
+            '--provider',
+            type=int,
+            action='append',
+            dest='provider_ids',
+            help='Only reconcile this provider ID (can be given more than once)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options.get('dry_run', False)
+        drift = rebuild_provider_ledgers(options.get('provider_ids'), dry_run=dry_run)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All provider ledgers are in sync'))
+            return
+
+        providers = sorted({provider_id for provider_id, _, _, _ in drift})
+        for provider_id, field, stored, expected in drift:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Provider #{provider_id}: {field} was {"missing" if stored is None else stored}, expected {expected}'
+                )
+            )
+
+        action = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{action} drift in {len(providers)} provider ledger(s)'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.mail import deliver_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send emails waiting in the outbox over a single SMTP connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Maximum number of emails to send per batch (default: 100)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll the outbox instead of exiting after one pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when running with --loop (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        loop = options.get('loop', False)
+
+        while True:
+            counts = deliver_queued_emails(limit=batch_size)
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Sent {counts['sent']} email(s), {counts['retrying']} will be retried, "
+                    f"{counts['failed']} failed permanently"
+                )
+
+            if not loop:
+                break
+            # Drain a full backlog straight away, otherwise wait for new mail
+            if sum(counts.values()) < batch_size:
+                time.sleep(options['interval'])
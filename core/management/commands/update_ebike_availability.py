@@ -19,7 +19,7 @@ class Command(BaseCommand):
         if not silent:
             self.stdout.write('Starting real-time bike availability sync...')
 
-        # Use the improved sync function that handles both date AND time
+        # Set-based sync: one query for occupied bikes, two bulk UPDATEs to flip availability
         updated_count = sync_bike_availability()
 
         if updated_count > 0:
@@ -39,56 +39,19 @@ class Command(BaseCommand):
         if not silent:
             self.stdout.write('Bike availability sync completed.')
 =======
-from django.utils import timezone
-from datetime import datetime, date
-from core.models import Booking, EBike
+from core.utils import sync_bike_availability
 
 
 class Command(BaseCommand):
     help = 'Update e-bike availability based on booking end times'
 
     def handle(self, *args, **options):
-        now = timezone.now()
-
-        # Get all approved bookings
-        expired_bookings = Booking.objects.filter(
-            status='approved',
-            ebike__is_available=False
-        ).select_related('ebike')
-
-        updated_count = 0
-        for booking in expired_bookings:
-            # Combine date and time to create datetime objects
-            try:
-                if booking.end_date and booking.end_time:
-                    # Check if booking has ended
-                    end_datetime = datetime.combine(
-                        booking.end_date,
-                        booking.end_time
-                    )
-                    end_datetime = timezone.make_aware(end_datetime)
-
-                    if now > end_datetime:
-                        # Booking has ended, make e-bike available
-                        booking.ebike.is_available = True
-                        booking.ebike.save(update_fields=['is_available'])
-                        updated_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'Made e-bike "{booking.ebike.name}" (ID: {booking.ebike.id}) available - '
-                                f'Booking #{booking.id} ended at {end_datetime}'
-                            )
-                        )
-            except (AttributeError, TypeError, ValueError) as e:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f'Could not process booking #{booking.id}: {e}'
-                    )
-                )
+        # Set-based sync: one query for occupied bikes, two bulk UPDATEs to flip availability
+        updated_count = sync_bike_availability()
 
         if updated_count > 0:
             self.stdout.write(
-                self.style.SUCCESS(f'Successfully updated {updated_count} e-bikes to available status')
+                self.style.SUCCESS(f'Successfully updated {updated_count} e-bike(s) availability status')
             )
         else:
             self.stdout.write(
@@ -1,32 +1,105 @@
+import logging
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connections
 from django.utils import timezone
 
 from core.utils import sync_bike_availability
 
+logger = logging.getLogger(__name__)
+
 
 class DailyAvailabilitySyncMiddleware:
-    """Runs a lightweight availability sync once per day on the first incoming request.
+    """Schedules a lightweight availability sync once per day on the first incoming request.
 
     This is a safety net to ensure bikes become available when bookings expire,
     even if no Booking save event occurs that day. For production-grade scheduling,
-    also schedule the management command `sync_bike_availability` daily.
+    also schedule the management command `update_ebike_availability` daily.
+
+    The request never waits for the sync: a cache lock (``cache.add``) lets exactly
+    one worker claim the day's run, which then executes in a background thread.
+    With ``AVAILABILITY_SYNC_MODE = 'command'`` the middleware does nothing and the
+    management command is the only scheduler.
+
+    Supports both sync and async request handling, so it doesn't force async
+    views onto a worker thread under ASGI.
     """
 
+    sync_capable = True
+    async_capable = True
+
     CACHE_KEY = "bike_availability_last_sync_date"
+    LOCK_KEY = "bike_availability_sync_lock:{date}"
+    LOCK_TIMEOUT = 15 * 60  # a crashed run can be retried after this
     _LAST_SYNC_DATE = None  # in-process fallback for environments without a real cache
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.enabled = getattr(settings, 'AVAILABILITY_SYNC_MODE', 'thread') == 'thread'
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.enabled:
+            self.schedule_sync()
+        response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        if self.enabled:
+            await self.aschedule_sync()
+        return await self.get_response(request)
+
+    def schedule_sync(self):
         today = timezone.localdate().isoformat()
-        last_sync = cache.get(self.CACHE_KEY)
         # If cache backend is DummyCache, use in-process fallback to avoid syncing every request
-        effective_last_sync = last_sync or self._LAST_SYNC_DATE
-        if effective_last_sync != today:
-            # Best-effort: avoid blocking for too long; the operation is lightweight
+        if self._LAST_SYNC_DATE == today or cache.get(self.CACHE_KEY) == today:
+            return
+
+        # Only the worker that adds the lock runs the sync; everyone else moves on
+        lock_key = self.LOCK_KEY.format(date=today)
+        if not cache.add(lock_key, True, timeout=self.LOCK_TIMEOUT):
+            return
+        return self.start_sync(today, lock_key)
+
+    async def aschedule_sync(self):
+        """``schedule_sync`` for the async path, using the async cache API so the event loop never blocks."""
+        today = timezone.localdate().isoformat()
+        if self._LAST_SYNC_DATE == today or await cache.aget(self.CACHE_KEY) == today:
+            return
+
+        lock_key = self.LOCK_KEY.format(date=today)
+        if not await cache.aadd(lock_key, True, timeout=self.LOCK_TIMEOUT):
+            return
+        return self.start_sync(today, lock_key)
+
+    def start_sync(self, today, lock_key):
+        DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = today
+        thread = threading.Thread(target=self.run_sync_in_thread, args=(today, lock_key), daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def run_sync(cls, today, lock_key):
+        try:
+            # Set-based sync: a fixed handful of queries regardless of fleet size
             sync_bike_availability()
-            cache.set(self.CACHE_KEY, today, timeout=24 * 60 * 60)
-            DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = today
-        response = self.get_response(request)
-        return response
+            cache.set(cls.CACHE_KEY, today, timeout=24 * 60 * 60)
+        except Exception:
+            logger.exception("Daily availability sync failed")
+            # Let the next request try again
+            cache.delete(lock_key)
+            DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = None
+
+    @classmethod
+    def run_sync_in_thread(cls, today, lock_key):
+        try:
+            cls.run_sync(today, lock_key)
+        finally:
+            # The thread opened its own database connection
+            connections.close_all()
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:45
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _combine(day, at):
+    return timezone.make_aware(datetime.combine(day, at or time.min))
+
+
+def populate_booking_intervals(apps, schema_editor):
+    Booking = apps.get_model('core', 'Booking')
+    batch = []
+    for booking in Booking.objects.only('start_date', 'start_time', 'end_date', 'end_time').iterator(chunk_size=500):
+        booking.start_at = _combine(booking.start_date, booking.start_time)
+        booking.end_at = _combine(booking.end_date, booking.end_time)
+        batch.append(booking)
+        if len(batch) >= 500:
+            Booking.objects.bulk_update(batch, ['start_at', 'end_at'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['start_at', 'end_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_booking_end_time_booking_start_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='end_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Return datetime (derived from end_date and end_time)', null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='start_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Pickup datetime (derived from start_date and start_time)', null=True),
+        ),
+        migrations.RunPython(populate_booking_intervals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['ebike', 'status', 'start_at', 'end_at'], name='booking_occupancy_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:30
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+WITHDRAWAL_LEDGER_FIELDS = {
+    'pending': 'pending_withdrawals',
+    'approved': 'approved_withdrawals',
+    'completed': 'completed_withdrawals',
+}
+
+
+def populate_provider_ledgers(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Booking = apps.get_model('core', 'Booking')
+    Withdrawal = apps.get_model('core', 'Withdrawal')
+    ProviderLedger = apps.get_model('core', 'ProviderLedger')
+
+    totals = {
+        provider_id: {'total_earnings': Decimal('0.00')}
+        for provider_id in User.objects.filter(is_vehicle_provider=True).values_list('id', flat=True)
+    }
+    earnings = (
+        Booking.objects.filter(is_approved=True).order_by()
+        .values_list('ebike__provider_id').annotate(total=Sum('total_price'))
+    )
+    for provider_id, amount in earnings:
+        totals.setdefault(provider_id, {})['total_earnings'] = amount or Decimal('0.00')
+    withdrawals = (
+        Withdrawal.objects.filter(status__in=WITHDRAWAL_LEDGER_FIELDS).order_by()
+        .values_list('provider_id', 'status').annotate(total=Sum('amount'))
+    )
+    for provider_id, status, amount in withdrawals:
+        totals.setdefault(provider_id, {})[WITHDRAWAL_LEDGER_FIELDS[status]] = amount or Decimal('0.00')
+
+    ProviderLedger.objects.bulk_create(
+        [ProviderLedger(provider_id=provider_id, **values) for provider_id, values in totals.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_booking_start_at_end_at_booking_occupancy_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0, help_text='Sum of approved booking totals', max_digits=12)),
+                ('pending_withdrawals', models.DecimalField(decimal_places=2, default=0, help_text='Sum of pending withdrawal amounts', max_digits=12)),
+                ('approved_withdrawals', models.DecimalField(decimal_places=2, default=0, help_text='Sum of approved (not yet paid) withdrawal amounts', max_digits=12)),
+                ('completed_withdrawals', models.DecimalField(decimal_places=2, default=0, help_text='Sum of completed withdrawal amounts', max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(populate_provider_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_staff_broadcast',
+            field=models.BooleanField(default=False, help_text="Show to every staff user. One shared row; each admin's read state is kept in NotificationRead."),
+        ),
+        migrations.CreateModel(
+            name='NotificationRead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(auto_now_add=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reads', to='core.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_reads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'user'), name='notification_read_once')],
+            },
+        ),
+    ]
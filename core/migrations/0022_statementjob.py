@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:00
+
+import core.models
+import core.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_notification_is_staff_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('dedupe_key', models.CharField(help_text='Provider and date range; identical in-flight jobs share it', max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('total_bookings', models.PositiveIntegerField(default=0)),
+                ('processed_bookings', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, storage=core.storage.PrivateMediaStorage(), upload_to=core.models.statement_upload_to)),
+                ('error', models.TextField(blank=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statement_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='statement_job_due_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('dedupe_key',), name='statement_job_in_flight_unique')],
+            },
+        ),
+    ]
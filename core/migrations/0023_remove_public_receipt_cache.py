@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:00
+
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+def delete_public_receipt_cache(apps, schema_editor):
+    """Receipts are cached in private storage now; drop the copies left in public media."""
+    def delete_tree(directory):
+        try:
+            directories, files = default_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for filename in files:
+            default_storage.delete(f'{directory}/{filename}')
+        for subdirectory in directories:
+            delete_tree(f'{directory}/{subdirectory}')
+
+    delete_tree('receipts/cache')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_statementjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_public_receipt_cache, migrations.RunPython.noop),
+    ]
@@ -3,9 +3,15 @@ Models for the core application of the AisEbikeRental system.
 """
 
 from django.db import models
+from django.db.models import Avg, Count, Q
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import uuid
+
+from .storage import private_storage
 
 
 class User(AbstractUser):
@@ -27,6 +33,23 @@ class User(AbstractUser):
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
 
 
+class EBikeQuerySet(models.QuerySet):
+    """QuerySet helpers for e-bike listings and recommendations."""
+
+    def with_review_stats(self):
+        """
+        Bikes with their provider joined in and ``review_count``/``avg_rating`` annotated.
+
+        Everything a listing or recommendation prompt needs comes back in a single
+        query instead of two review queries and a provider lookup per bike.
+        ``avg_rating`` is None for bikes without reviews.
+        """
+        return self.select_related('provider').annotate(
+            review_count=Count('reviews'),
+            avg_rating=Avg('reviews__rating'),
+        )
+
+
 class EBike(models.Model):
     """
     Model representing an electric bike available for rental.
@@ -42,10 +65,42 @@ class EBike(models.Model):
     provider = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ebikes')
     is_available = models.BooleanField(default=True)
 
+    objects = EBikeQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.provider.username}"
 
 
+class BookingQuerySet(models.QuerySet):
+    """
+    QuerySet helpers for booking occupancy checks.
+
+    All interval logic runs against the materialized ``start_at``/``end_at``
+    columns so it can be served by the ``booking_occupancy_idx`` index.
+    """
+
+    def overlapping(self, start, end):
+        """Bookings whose [start_at, end_at) window intersects [start, end)."""
+        return self.filter(start_at__lt=end, end_at__gt=start)
+
+    def active(self):
+        """Approved, paid and not rejected bookings."""
+        return self.filter(status='approved', is_rejected=False, is_paid=True)
+
+    def occupying(self, now=None):
+        """
+        Active bookings that keep a bike busy right now.
+
+        A booking occupies its bike from now until the end of today if it hasn't
+        ended yet and starts before midnight, so bikes that are picked up later
+        today are not offered to other riders in the meantime.
+        """
+        now = now or timezone.now()
+        tomorrow = timezone.localtime(now).date() + timedelta(days=1)
+        end_of_today = timezone.make_aware(datetime.combine(tomorrow, time.min))
+        return self.active().overlapping(now, end_of_today)
+
+
 class Booking(models.Model):
     """
     Model for booking e-bike rentals.
@@ -82,11 +137,30 @@ class Booking(models.Model):
     is_paid = models.BooleanField(default=False)
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
+    start_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="Pickup datetime (derived from start_date and start_time)")
+    end_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="Return datetime (derived from end_date and end_time)")
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    objects = BookingQuerySet.as_manager()
+
+    # Bookings whose price counts towards the provider's earnings. The ledger
+    # signals, the ledger rebuild and statements all use this same predicate.
+    EARNING_FILTER = Q(is_approved=True)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['ebike', 'status', 'start_at', 'end_at'], name='booking_occupancy_idx'),
+        ]
+
+    @staticmethod
+    def combine_datetime(day, at):
+        """Combine a booking date and time into an aware datetime."""
+        from django.utils.dateparse import parse_time
+        if isinstance(at, str):
+            at = parse_time(at)
+        return timezone.make_aware(datetime.combine(day, at or time.min))
 
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -148,6 +222,13 @@ class Booking(models.Model):
         
         # Run full validation before saving
         self.full_clean()
+
+        # Keep the materialized interval columns in sync with the date/time fields
+        self.start_at = self.combine_datetime(self.start_date, self.start_time)
+        self.end_at = self.combine_datetime(self.end_date, self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_date', 'start_time', 'end_date', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'start_at', 'end_at'}
         
         # Set timestamps if not set
         if not self.id and not self.created_at:
@@ -167,6 +248,11 @@ class Booking(models.Model):
             
         super().save(*args, **kwargs)
 
+    @property
+    def counts_as_earning(self):
+        """Whether this booking matches ``EARNING_FILTER``."""
+        return bool(self.is_approved)
+
     @property
     def days(self):
         """Calculate the number of days for the booking."""
@@ -322,12 +408,35 @@ class Testimonial(models.Model):
 
 =======
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
+class NotificationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Personal notifications for ``user``, plus staff broadcasts if they are staff."""
+        visible = Q(recipient=user)
+        if user.is_staff:
+            visible |= Q(is_staff_broadcast=True)
+        return self.filter(visible)
+
+    def unread_for(self, user):
+        """
+        Notifications ``user`` hasn't read.
+
+        Personal rows carry their own ``is_read`` flag; a staff broadcast is
+        shared by every admin, so it counts as read once the admin has a
+        NotificationRead row for it.
+        """
+        unread = Q(recipient=user, is_read=False)
+        if user.is_staff:
+            read = NotificationRead.objects.filter(user=user, notification=models.OuterRef('pk'))
+            unread |= Q(is_staff_broadcast=True) & ~Q(models.Exists(read))
+        return self.filter(unread)
+
+
 class Notification(models.Model):
     """
     Model for in-app notifications sent to users.
 
-    Supports both personal notifications to specific users and
-    public announcements visible to all users.
+    Supports personal notifications to specific users, broadcasts shown
+    to every staff user and public announcements visible to all users.
     """
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     message = models.CharField(max_length=255)
@@ -335,13 +444,36 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.URLField(blank=True, null=True)
     is_public = models.BooleanField(default=False, help_text="Show to all users, including guests.")
+    is_staff_broadcast = models.BooleanField(
+        default=False,
+        help_text="Show to every staff user. One shared row; each admin's read state is kept in NotificationRead."
+    )
+
+    objects = NotificationQuerySet.as_manager()
 
     def __str__(self):
         if self.is_public:
             return f"Public: {self.message[:30]}..."
+        if self.is_staff_broadcast:
+            return f"Staff: {self.message[:30]}..."
         return f"To {self.recipient.username if self.recipient else 'Public'}: {self.message[:30]}..."
 
 
+class NotificationRead(models.Model):
+    """One admin having read one staff broadcast."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='reads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_reads')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='notification_read_once'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} read #{self.notification_id}"
+
+
 class ContactMessage(models.Model):
     """
     Model for contact form submissions.
@@ -396,3 +528,144 @@ class Withdrawal(models.Model):
     
     def __str__(self):
         return f"Withdrawal #{self.id} - {self.provider.username} - ₹{self.amount} ({self.get_status_display()})"
+
+
+
+class ProviderLedger(models.Model):
+    """
+    Materialized earnings and withdrawal totals for a vehicle provider.
+
+    Kept up to date incrementally by signals on Booking and Withdrawal (see
+    core.signals), so dashboards and withdrawal checks read one row instead of
+    re-summing the provider's whole booking history. The
+    ``reconcile_provider_ledgers`` management command rebuilds it from scratch.
+    """
+    provider = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger')
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of approved booking totals")
+    pending_withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of pending withdrawal amounts")
+    approved_withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of approved (not yet paid) withdrawal amounts")
+    completed_withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of completed withdrawal amounts")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    PLATFORM_CHARGE_RATE = Decimal('0.10')
+
+    @property
+    def platform_charges(self):
+        """Platform fee (10%) on total earnings."""
+        return self.total_earnings * self.PLATFORM_CHARGE_RATE
+
+    @property
+    def net_earnings(self):
+        """Earnings after the platform fee."""
+        return self.total_earnings - self.platform_charges
+
+    @property
+    def reserved_withdrawals(self):
+        """Withdrawals requested or approved but not paid out yet."""
+        return self.pending_withdrawals + self.approved_withdrawals
+
+    @property
+    def available_balance(self):
+        """Net earnings minus withdrawals still in flight, never below zero."""
+        return max(self.net_earnings - self.reserved_withdrawals, Decimal('0.0'))
+
+    def __str__(self):
+        return f"Ledger for {self.provider.username} - ₹{self.total_earnings}"
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting in the outbox to be sent.
+
+    Views queue messages here instead of talking to SMTP during the request;
+    the ``send_queued_emails`` command delivers them (see core.mail).
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list, help_text="List of recipient addresses")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.get_status_display()})"
+
+
+def statement_upload_to(instance, filename):
+    # Random names, so one statement's name says nothing about another's
+    return f'statements/provider_{instance.provider_id}/{uuid.uuid4().hex}.pdf'
+
+
+class StatementJob(models.Model):
+    """
+    Provider statement rendered in the background.
+
+    ``download_statement`` queues a job instead of rendering when asked to run
+    asynchronously; the ``process_statement_jobs`` command renders it into
+    private storage and records progress as it goes (see
+    vehicle_providers.statement_jobs). At most one job per provider and date
+    range is queued or running at a time.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    IN_FLIGHT_STATUSES = ('queued', 'running')
+
+    provider = models.ForeignKey(User, on_delete=models.CASCADE, related_name='statement_jobs')
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    dedupe_key = models.CharField(max_length=64, help_text="Provider and date range; identical in-flight jobs share it")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total_bookings = models.PositiveIntegerField(default=0)
+    processed_bookings = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to=statement_upload_to, storage=private_storage, blank=True)
+    error = models.TextField(blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='statement_job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status__in=['queued', 'running']),
+                name='statement_job_in_flight_unique',
+            ),
+        ]
+
+    @property
+    def progress(self):
+        """Percentage of bookings drawn so far."""
+        if self.status == 'done':
+            return 100
+        if not self.total_bookings:
+            return 0
+        return min(99, self.processed_bookings * 100 // self.total_bookings)
+
+    def __str__(self):
+        return f"Statement #{self.id} for {self.provider.username} ({self.get_status_display()})"
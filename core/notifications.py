@@ -0,0 +1,171 @@
+"""
+In-app notification dispatch and unread counts.
+
+Fan-out goes through ``notify``/``send_notifications`` so that notifying many
+users costs a handful of batched INSERTs instead of one query per row.
+Admin-wide announcements use ``notify_staff``, which writes a single
+broadcast row that every staff user sees; each admin marking it read adds a
+NotificationRead row, so read state stays per admin.
+
+Unread counts are cached. Each user's count lives under a key that embeds
+their version token (and the staff broadcast version for staff users);
+invalidating means writing a new token, so stale counts are never read and
+simply expire. Public announcements share one cached count.
+"""
+
+import uuid
+
+from django.core.cache import cache
+
+from core.models import Notification, NotificationRead
+
+# Rows per INSERT when fanning out notifications
+NOTIFICATION_BATCH_SIZE = 500
+
+# How long a cached count may live before being recomputed anyway
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+PUBLIC_COUNT_KEY = 'notifications:public_count'
+STAFF_VERSION_KEY = 'notifications:staff_version'
+
+
+def _user_version_key(user_id):
+    return f'notifications:version:{user_id}'
+
+
+def invalidate_notification_counts(user_ids=(), public=False, staff=False):
+    """
+    Invalidate cached unread counts by writing fresh version tokens.
+
+    Args:
+        user_ids: IDs of users whose personal count changed
+        public: Public announcements changed
+        staff: Staff broadcasts changed
+    """
+    new_versions = {_user_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids) if user_id}
+    if staff:
+        new_versions[STAFF_VERSION_KEY] = uuid.uuid4().hex
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+    if public:
+        cache.delete(PUBLIC_COUNT_KEY)
+
+
+def invalidate_for_notification(notification):
+    """Invalidate whichever cached counts include ``notification``."""
+    invalidate_notification_counts(
+        user_ids=[notification.recipient_id],
+        public=notification.is_public,
+        staff=notification.is_staff_broadcast,
+    )
+
+
+def public_notification_count():
+    """Number of public announcements (shared by every visitor)."""
+    count = cache.get(PUBLIC_COUNT_KEY)
+    if count is None:
+        count = Notification.objects.filter(is_public=True).count()
+        cache.set(PUBLIC_COUNT_KEY, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def user_unread_count(user):
+    """Number of unread notifications addressed to ``user`` (including staff broadcasts)."""
+    version_key = _user_version_key(user.pk)
+    versions = cache.get_many([version_key, STAFF_VERSION_KEY])
+    missing = {key: uuid.uuid4().hex for key in (version_key, STAFF_VERSION_KEY) if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+
+    key = f'notifications:unread:{user.pk}:{versions[version_key]}'
+    if user.is_staff:
+        key += f':{versions[STAFF_VERSION_KEY]}'
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.unread_for(user).count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def mark_notifications_read(user, notification_ids=None):
+    """
+    Mark a user's notifications (all, or the given IDs) as read.
+
+    Personal rows are flagged read; staff broadcasts get a NotificationRead
+    row for this admin, leaving them unread for everyone else.
+
+    Returns:
+        Number of notifications marked read
+    """
+    notifications = Notification.objects.unread_for(user)
+    if notification_ids is not None:
+        notifications = notifications.filter(id__in=notification_ids)
+    updated = notifications.filter(is_staff_broadcast=False).update(is_read=True)
+    if user.is_staff:
+        broadcast_ids = notifications.filter(is_staff_broadcast=True).values_list('id', flat=True)
+        reads = NotificationRead.objects.bulk_create(
+            [NotificationRead(notification_id=notification_id, user=user) for notification_id in broadcast_ids],
+            ignore_conflicts=True,
+        )
+        updated += len(reads)
+    # Queryset updates bypass the post_save signal, so invalidate here
+    if updated:
+        invalidate_notification_counts(user_ids=[user.pk])
+    return updated
+
+
+def _render(template, recipient):
+    if template is None:
+        return None
+    if callable(template):
+        return template(recipient)
+    return template.format(recipient=recipient)
+
+
+def send_notifications(notifications, batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Save unsaved Notification instances with batched bulk_create.
+
+    Returns:
+        List of created notifications
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return []
+    created = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    # bulk_create doesn't send post_save, so invalidate the affected counts here
+    invalidate_notification_counts(
+        user_ids=[notification.recipient_id for notification in notifications],
+        public=any(notification.is_public for notification in notifications),
+        staff=any(notification.is_staff_broadcast for notification in notifications),
+    )
+    return created
+
+
+def notify(recipients, message, link=None, batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Send the same notification to many users.
+
+    Args:
+        recipients: Iterable or queryset of users
+        message: Message text; may use ``{recipient}`` placeholders or be a
+            callable taking the recipient and returning the text
+        link: Optional link, formatted the same way as ``message``
+        batch_size: Rows per INSERT
+
+    Returns:
+        List of created notifications
+    """
+    return send_notifications(
+        (
+            Notification(recipient=recipient, message=_render(message, recipient), link=_render(link, recipient))
+            for recipient in recipients
+        ),
+        batch_size=batch_size,
+    )
+
+
+def notify_staff(message, link=None):
+    """Broadcast one notification to every staff user as a single shared row."""
+    return Notification.objects.create(message=message, link=link, is_staff_broadcast=True)
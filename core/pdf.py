@@ -0,0 +1,269 @@
+"""
+Shared building blocks for the PDFs the site hands out: booking receipts,
+provider statements, withdrawal slips and withdrawal receipts.
+
+The documents draw with the same handful of components (page background,
+rounded cards, header band, label/amount rows, footers, QR codes and images),
+so a layout tweak is made once here rather than in four copies.
+
+Decoded images are kept in a process-wide cache. The brand logo, bike photos
+and profile pictures are read, decoded and shrunk to a thumbnail for the size
+they are drawn at once per worker instead of on every download, so each PDF
+only compresses a few kilobytes of pixels rather than a full-size photo.
+Entries are keyed by path, modification time and size, so replacing a file on
+disk is picked up without a restart.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+try:
+    import qrcode
+except ImportError:  # QR codes are optional; documents render without them
+    qrcode = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = A4
+BRAND_LOGO_PATH = os.path.join('media', 'brand_logo.png')
+IMAGE_CACHE_SIZE = getattr(settings, 'PDF_IMAGE_CACHE_SIZE', 128)
+# Thumbnail pixels per point of drawn size (4 is about 300 DPI)
+THUMBNAIL_SCALE = 4
+
+COMPANY_FOOTER = "AIS E-Bike Rental | GSTIN: 29ABCDE1234F1Z5 | CIN: U12345KA2023PTC123456 | Contact: support@aisebike.com"
+
+
+class ImageCache:
+    """Thread-safe LRU cache of decoded ``ImageReader`` thumbnails keyed by (path, mtime, size)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._readers = OrderedDict()
+
+    def __len__(self):
+        return len(self._readers)
+
+    @staticmethod
+    def _load(path, size):
+        image = Image.open(path)
+        if size:
+            pixels = int(size * THUMBNAIL_SCALE)
+            image.thumbnail((pixels, pixels))
+        else:
+            image.load()
+        reader = ImageReader(image)
+        # Decode now, so documents sharing the reader only read it
+        reader.getRGBData()
+        return reader
+
+    def get(self, path, size=None):
+        """
+        The decoded image at ``path``, or None if it is missing or unreadable.
+
+        ``size`` is the largest dimension, in points, the image is drawn at;
+        the cached copy is shrunk to match. None keeps the full resolution.
+        """
+        try:
+            key = (path, os.path.getmtime(path), size)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            reader = self._readers.get(key)
+            if reader is not None:
+                self._readers.move_to_end(key)
+                return reader
+
+        try:
+            reader = self._load(path, size)
+        except Exception as e:
+            logger.warning(f"Could not load image {path} for PDF: {str(e)}")
+            return None
+
+        with self._lock:
+            self._readers[key] = reader
+            self._readers.move_to_end(key)
+            while len(self._readers) > self.max_size:
+                self._readers.popitem(last=False)
+        return reader
+
+    def clear(self):
+        with self._lock:
+            self._readers.clear()
+
+
+image_cache = ImageCache(IMAGE_CACHE_SIZE)
+
+
+def image_reader(path, size=None):
+    return image_cache.get(path, size) if path else None
+
+
+def field_image(field, size=None):
+    """Cached image for an ImageField value, or None if it is empty or the file is gone."""
+    if not field:
+        return None
+    try:
+        path = field.path
+    except (ValueError, AttributeError, NotImplementedError):
+        return None
+    return image_reader(path, size)
+
+
+def brand_logo(size=None):
+    return image_reader(BRAND_LOGO_PATH, size)
+
+
+def qr_image(data, **options):
+    """
+    QR code for ``data`` as an ``ImageReader``, or None if it can't be made.
+
+    ``options`` are passed to ``qrcode.QRCode`` (version, box_size, border...).
+    The mask pattern is fixed unless given: any mask scans, and trying all
+    eight to pick the "best" one is most of the cost of making the code.
+    """
+    if qrcode is None:
+        return None
+    options.setdefault('mask_pattern', 0)
+    try:
+        qr = qrcode.QRCode(**options)
+        qr.add_data(data)
+        qr.make(fit=True)
+        buffer = BytesIO()
+        qr.make_image(fill_color='black', back_color='white').save(buffer, format='PNG')
+        buffer.seek(0)
+        return ImageReader(buffer)
+    except Exception as e:
+        logger.error(f"Error generating QR code: {str(e)}")
+        return None
+
+
+# --- Canvas documents ---
+
+def start_document():
+    """A fresh A4 canvas and the buffer it writes to."""
+    buffer = BytesIO()
+    return buffer, canvas.Canvas(buffer, pagesize=PAGE_SIZE)
+
+
+def finish_document(p, buffer):
+    """Close the last page and return the PDF bytes."""
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def page_background(p, color):
+    width, height = PAGE_SIZE
+    p.setFillColor(color)
+    p.rect(0, 0, width, height, fill=1, stroke=0)
+
+
+def card(p, x, y, width, height, fill, radius=10, stroke=None, line_width=1):
+    """Rounded rectangle with its bottom-left corner at (x, y), optionally outlined."""
+    p.setFillColor(fill)
+    if stroke is not None:
+        p.setStrokeColor(stroke)
+        p.setLineWidth(line_width)
+    p.roundRect(x, y, width, height, radius, fill=1, stroke=stroke is not None)
+
+
+def header_band(p, x, bottom, width, height, color, title, subtitle, text_x=None,
+                title_size=24, subtitle_size=12, title_offset=35, subtitle_offset=15,
+                subtitle_font='Helvetica', radius=20, centred=False):
+    """
+    Coloured band with a white title and subtitle.
+
+    Text starts at ``text_x`` (defaults to 20pt inside the band), or is centred
+    on the band if ``centred`` is set. Offsets are measured up from ``bottom``.
+    """
+    card(p, x, bottom, width, height, color, radius=radius)
+    p.setFillColor(colors.white)
+    if centred:
+        centre = x + width / 2
+        p.setFont('Helvetica-Bold', title_size)
+        p.drawCentredString(centre, bottom + title_offset, title)
+        p.setFont(subtitle_font, subtitle_size)
+        p.drawCentredString(centre, bottom + subtitle_offset, subtitle)
+        return
+    text_x = x + 20 if text_x is None else text_x
+    p.setFont('Helvetica-Bold', title_size)
+    p.drawString(text_x, bottom + title_offset, title)
+    p.setFont(subtitle_font, subtitle_size)
+    p.drawString(text_x, bottom + subtitle_offset, subtitle)
+
+
+def brand_logo_or_placeholder(p, x, y, size):
+    """Draw the brand logo, or a grey "No Logo" square if the file is missing."""
+    logo = brand_logo(size)
+    if logo is not None:
+        p.drawImage(logo, x, y, size, size, mask='auto')
+        return
+    p.setFillColor(colors.HexColor('#cccccc'))
+    p.rect(x, y, size, size, fill=1, stroke=0)
+    p.setFillColor(colors.black)
+    p.setFont('Helvetica', 8)
+    p.drawString(x + 5, y + size / 2, 'No Logo')
+
+
+def draw_image(p, reader, x, y, width, height=None):
+    """Draw a cached image if there is one; returns whether anything was drawn."""
+    if reader is None:
+        return False
+    p.drawImage(reader, x, y, width, height or width, mask='auto')
+    return True
+
+
+def section_title(p, x, y, text, color, size=14):
+    p.setFont('Helvetica-Bold', size)
+    p.setFillColor(color)
+    p.drawString(x, y, text)
+
+
+def amount_row(p, left, right, y, label, value, font='Helvetica', size=11, color=colors.black,
+               value_font=None, value_size=None, value_color=None):
+    """Label at ``left`` and a right-aligned value ending at ``right``, on one baseline."""
+    p.setFont(font, size)
+    p.setFillColor(color)
+    p.drawString(left, y, label)
+    p.setFont(value_font or font, value_size or size)
+    p.setFillColor(value_color or color)
+    p.drawRightString(right, y, value)
+
+
+def centred_lines(p, centre, y, lines, color, size=9, leading=12, font='Helvetica'):
+    """Centred lines of small print, the first at ``y`` and the rest below it."""
+    p.setFont(font, size)
+    p.setFillColor(color)
+    for line in lines:
+        p.drawCentredString(centre, y, line)
+        y -= leading
+
+
+# --- Flowable documents ---
+
+def key_value_table(rows, col_widths=(120, 250), styles=(), font='Helvetica', size=11):
+    """Two-column label/value table in the style used by the withdrawal slip."""
+    table = Table(rows, colWidths=list(col_widths))
+    table.setStyle(TableStyle([
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, -1), size),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        *styles,
+    ]))
+    return table
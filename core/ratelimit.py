@@ -0,0 +1,153 @@
+"""
+Cache-backed rate limiting for the AI endpoints.
+
+Each client gets a bucket of ``limit`` tokens per route that refills every
+``period`` seconds. Buckets are keyed by user ID for logged-in users and by IP
+address otherwise (see ``client_ip``), and limits can differ per role (see ``RATE_LIMITS`` in
+settings). A request spends a token with a single atomic ``cache.incr()``; the
+key is only created (``cache.add()``) on the first request of each period.
+Throttled requests get a 429 with ``Retry-After``.
+"""
+
+import functools
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from core.chat_cache import user_role
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# Used for routes missing from settings.RATE_LIMITS
+DEFAULT_RATE = '30/m'
+
+
+def parse_rate(rate):
+    """
+    Turn "10/m" into (10, 60). None means unlimited.
+
+    Raises:
+        ValueError: If the rate isn't "<count>/<s|m|h|d>"
+    """
+    if rate is None:
+        return None
+    count, _, unit = rate.partition('/')
+    if unit not in PERIODS or not count.isdigit():
+        raise ValueError(f"Invalid rate {rate!r}, expected e.g. '10/m'")
+    return int(count), PERIODS[unit]
+
+
+def get_rate(route, role):
+    """The (limit, period) for a role on a route, falling back to the route's default."""
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(route, {})
+    return parse_rate(limits.get(role, limits.get('default', DEFAULT_RATE)))
+
+
+def client_ip(request):
+    """
+    The address anonymous clients are limited by.
+
+    ``REMOTE_ADDR`` unless ``RATE_LIMIT_CLIENT_IP_HEADER`` names another META
+    key. Behind a reverse proxy every request comes from the proxy, so set it
+    to the forwarding header (e.g. ``HTTP_X_FORWARDED_FOR``). Each proxy appends
+    the address it received the request from, so the client is the entry
+    ``RATE_LIMIT_TRUSTED_PROXIES`` from the end; anything before that was sent
+    by the client and can be forged.
+    """
+    header = getattr(settings, 'RATE_LIMIT_CLIENT_IP_HEADER', None)
+    if header:
+        hops = [hop.strip() for hop in request.META.get(header, '').split(',') if hop.strip()]
+        trusted = max(getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 1), 1)
+        if hops:
+            return hops[-min(trusted, len(hops))]
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+def client_identity(request, user):
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def bucket_key(route, identity, period, now):
+    """The cache key for the bucket in use at ``now``, and seconds until it refills."""
+    window = int(now // period)
+    return f'ratelimit:{route}:{identity}:{window}', math.ceil((window + 1) * period - now)
+
+
+def throttled_response(request, retry_after):
+    message = 'Too many requests. Please wait a moment and try again.'
+    if 'text/html' in request.headers.get('Accept', ''):
+        response = HttpResponse(message, status=429, content_type='text/plain')
+    else:
+        response = JsonResponse({'error': message}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _spend(key, period):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # First request of the period; add() so a concurrent first request isn't lost
+        if cache.add(key, 1, timeout=period + 1):
+            return 1
+        return cache.incr(key)
+
+
+async def _aspend(key, period):
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        if await cache.aadd(key, 1, timeout=period + 1):
+            return 1
+        return await cache.aincr(key)
+
+
+def rate_limit(route, methods=None):
+    """
+    Limit how often one client may call the decorated view.
+
+    Args:
+        route: Name of the limit in ``settings.RATE_LIMITS``
+        methods: HTTP methods to count (all methods if None)
+
+    Works on both sync and async views.
+    """
+    def decorator(view):
+        def check(request, user):
+            if methods is not None and request.method not in methods:
+                return None
+            rate = get_rate(route, user_role(user))
+            if rate is None:
+                return None
+            limit, period = rate
+            key, retry_after = bucket_key(route, client_identity(request, user), period, time.time())
+            return key, limit, period, retry_after
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                bucket = check(request, await request.auser())
+                if bucket is not None:
+                    key, limit, period, retry_after = bucket
+                    if await _aspend(key, period) > limit:
+                        return throttled_response(request, retry_after)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            bucket = check(request, request.user)
+            if bucket is not None:
+                key, limit, period, retry_after = bucket
+                if _spend(key, period) > limit:
+                    return throttled_response(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
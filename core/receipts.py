@@ -0,0 +1,236 @@
+"""
+Booking receipt PDFs and their on-disk cache.
+
+An approved booking's receipt only changes when the booking, the rider's
+details, the bike or an image drawn on it do, so each rendered PDF is stored in
+private storage (outside MEDIA_ROOT, so only ``download_receipt`` serves it,
+after checking the rider) under a digest of exactly those inputs plus
+``RECEIPT_TEMPLATE_VERSION``. Images count by modification time and size as
+well as name, so replacing a file in place is picked up too. Repeat
+downloads stream the stored file; any change to the inputs produces a new
+digest, so stale receipts are never served and are cleaned up on the next
+render. Bump ``RECEIPT_TEMPLATE_VERSION`` whenever the layout changes.
+"""
+
+import hashlib
+import logging
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.core.files.base import ContentFile
+from reportlab.lib import colors
+
+from core import pdf
+from core.storage import private_storage
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_TEMPLATE_VERSION = 2
+RECEIPT_CACHE_DIR = 'receipts/cache'
+
+
+def file_version(path):
+    """Modification time and size of a file, or '' if it is missing."""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return ''
+    return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def image_version(field):
+    """Name, modification time and size of an ImageField's file ('' if empty)."""
+    if not field:
+        return ''
+    try:
+        path = field.path
+    except (ValueError, AttributeError, NotImplementedError):
+        return field.name
+    return f'{field.name}:{file_version(path)}'
+
+
+def receipt_digest(booking):
+    """Content address of a booking's receipt: changes whenever anything printed on it does."""
+    rider, ebike = booking.rider, booking.ebike
+    parts = [
+        RECEIPT_TEMPLATE_VERSION, booking.id, booking.updated_at, booking.status,
+        booking.start_date, booking.end_date, booking.total_price,
+        rider.username, rider.get_full_name(), rider.email, getattr(rider, 'mobile_number', ''),
+        image_version(getattr(rider, 'profile_image', None)), ebike.name, image_version(ebike.image),
+        file_version(pdf.BRAND_LOGO_PATH),
+    ]
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def receipt_cache_dir(booking_id):
+    return f'{RECEIPT_CACHE_DIR}/booking_{booking_id}'
+
+
+def cached_receipt(booking, digest=None):
+    """
+    Storage name of the booking's receipt PDF, rendering and storing it on a miss.
+
+    Earlier versions of the receipt for the same booking are deleted when a
+    new one is stored.
+    """
+    digest = digest or receipt_digest(booking)
+    directory = receipt_cache_dir(booking.id)
+    name = f'{directory}/{digest}.pdf'
+    if private_storage.exists(name):
+        return name
+
+    saved = private_storage.save(name, ContentFile(render_receipt_pdf(booking)))
+    if saved != name:
+        # Another request stored the same receipt first; keep theirs
+        private_storage.delete(saved)
+    clear_cached_receipts(booking.id, keep=name)
+    return name
+
+
+def clear_cached_receipts(booking_id, keep=None):
+    """Delete stored receipts for a booking (except ``keep``)."""
+    directory = receipt_cache_dir(booking_id)
+    try:
+        _, files = private_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        name = f'{directory}/{filename}'
+        if name != keep:
+            private_storage.delete(name)
+
+
+def render_receipt_pdf(booking):
+    """
+    Draw the receipt for an approved booking.
+
+    Returns:
+        PDF bytes
+
+    Raises:
+        ValueError: If the booking's dates or price are invalid
+    """
+    # Validate dates
+    if not all([hasattr(booking, 'start_date'), hasattr(booking, 'end_date')]):
+        raise ValueError("Booking is missing required date information")
+
+    if booking.start_date > booking.end_date:
+        raise ValueError("Start date cannot be after end date")
+
+    # Validate price
+    try:
+        total_price = Decimal(str(booking.total_price))
+        if total_price < 0:
+            raise ValueError("Total price cannot be negative")
+    except (TypeError, InvalidOperation):
+        raise ValueError("Invalid price format")
+
+    buffer, p = pdf.start_document()
+    width, height = pdf.PAGE_SIZE
+
+    # --- Styling constants ---
+    card_x = 12
+    top_margin = 12
+    card_width = width - 2 * card_x
+    card_height = 650  # Optimized compact height for all content
+    card_y = height - card_height - top_margin
+    padding = 32
+    section_gap = 40
+    line_height = 24
+    label_font = "Helvetica-Bold"
+    value_font = "Helvetica-Bold"  # Made bold for currency visibility
+    highlight_color = colors.HexColor('#00D4AA')  # Modern teal
+    header_color = colors.HexColor('#1a202c')     # Dark slate
+    success_color = colors.HexColor('#38a169')    # Green
+    meta_color = colors.HexColor('#718096')       # Gray
+    bg_color = colors.HexColor('#f8fafc')         # Off-white bg
+    platform_charge = Decimal('20.00')
+    left, right = card_x + padding, card_x + card_width - padding
+
+    # --- Card background with border ---
+    pdf.page_background(p, bg_color)
+    pdf.card(p, card_x, card_y, card_width, card_height, colors.white, radius=20, stroke=highlight_color, line_width=2)
+
+    # --- All content inside the card ---
+    y = card_y + card_height - padding
+
+    # Header with brand logo and title (inside card)
+    header_height = 70
+    pdf.header_band(p, card_x, y - header_height, card_width, header_height, header_color,
+                    "AIS E-BIKE RENTAL", "Booking Receipt", text_x=left + 60)
+    pdf.brand_logo_or_placeholder(p, left, y - header_height + 10, 50)
+    y -= header_height + section_gap
+
+    # Billing to with user logo
+    pdf.section_title(p, left, y, "Billing to", header_color)
+    if pdf.draw_image(p, pdf.field_image(getattr(booking.rider, 'profile_image', None), 32), left + 90, y - 10, 32):
+        text_x = left + 130
+    else:
+        text_x = left + 90
+
+    p.setFont(value_font, 12)
+    p.setFillColor(colors.black)
+    p.drawString(text_x, y, booking.rider.get_full_name() or booking.rider.username)
+    p.setFont(value_font, 10)
+    p.setFillColor(meta_color)
+    p.drawString(text_x, y - line_height, f" {booking.rider.email}")
+    p.drawString(text_x, y - 2 * line_height, f" {getattr(booking.rider, 'mobile_number', '')}")
+    y -= (section_gap + 2 * line_height)
+
+    # Booking Details Section
+    pdf.section_title(p, left, y, "Booking Details", header_color)
+    y -= (line_height + 10)
+    pdf.card(p, left, y - 90, card_width - 2 * padding, 90, colors.white, radius=12)
+    pdf.draw_image(p, pdf.field_image(getattr(booking.ebike, 'image', None), 70), left + 10, y - 80, 70)
+
+    p.setFont(label_font, 12)
+    p.setFillColor(colors.black)
+    p.drawString(left + 90, y - 30, f" {booking.ebike.name}")
+    p.setFont(value_font, 11)
+    p.setFillColor(meta_color)
+
+    # Format dates safely
+    try:
+        date_fmt = lambda d: d.strftime('%d %b %Y') if d else 'N/A'
+        date_range = f"{date_fmt(booking.start_date)} to {date_fmt(booking.end_date)}"
+    except (AttributeError, ValueError):
+        date_range = "Date information not available"
+
+    p.drawString(left + 90, y - 50, f" {date_range}")
+    p.setFillColor(colors.black)
+    p.drawString(left + 90, y - 70, f"RS.{total_price:.2f}")
+
+    # Payment status - Approved by Admin badge
+    badge_x = card_x + card_width - 2 * padding
+    p.setFillColor(success_color)
+    p.roundRect(badge_x - 80, y - 40, 70, 24, 12, fill=1, stroke=1)
+    p.setFillColor(colors.white)
+    p.setFont(label_font, 10)
+    p.drawCentredString(badge_x - 45, y - 27, "APPROVED BY")
+    p.drawCentredString(badge_x - 45, y - 35, "ADMIN")
+
+    qr_data = (
+        f"BookingID:{booking.id}|User:{booking.rider.username}|"
+        f"Bike:{booking.ebike.name}|From:{date_fmt(booking.start_date)}|"
+        f"To:{date_fmt(booking.end_date)}|Amount:{(total_price + platform_charge):.2f}"
+    )
+    pdf.draw_image(p, pdf.qr_image(qr_data), badge_x - 70, y - 80, 50)
+    y -= (100 + section_gap)
+
+    # Payment Section
+    pdf.section_title(p, left, y, "Payment Received", header_color, size=13)
+    y -= (line_height + 5)
+    pdf.amount_row(p, left, right, y, "Rental amount", f" RS.{total_price:.2f}", font=value_font)
+    y -= line_height
+    pdf.amount_row(p, left, right, y, "Platform charges", f" RS.{platform_charge:.2f}", font=value_font, color=meta_color)
+    y -= line_height
+    pdf.amount_row(p, left, right, y, "Total", f" RS.{(total_price + platform_charge):.2f}", font=label_font, size=12,
+                   color=highlight_color, value_color=colors.black)
+
+    # Footer (inside card)
+    pdf.centred_lines(p, card_x + card_width / 2, card_y + 20, [
+        pdf.COMPANY_FOOTER,
+        "This is a computer-generated receipt. No signature required.",
+    ], meta_color, font=value_font)
+
+    return pdf.finish_document(p, buffer)
@@ -0,0 +1,235 @@
+"""
+In-process BM25 index over e-bike names and descriptions.
+
+Smart search used to put every available bike into the Gemini prompt, so the
+prompt grew with the fleet. The index ranks bikes against the query locally;
+only the top few candidates go to the model, and when the model is unavailable
+the ranking itself is the answer.
+
+Each process builds the index from the database once, on first use
+(``warm_index``), and the EBike ``post_save``/``post_delete`` signals then
+re-tokenize (or drop) just the one bike that changed, so ranking only reads
+postings. Every change also increments a version counter in the shared cache;
+an index that missed a change made by another process sees that its version
+is behind and is rebuilt on its next use.
+"""
+
+import heapq
+import math
+import random
+import re
+import threading
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+# Name terms count this many times as much as description terms
+NAME_WEIGHT = 2
+
+SHORTLIST_SIZE = getattr(settings, 'SMART_SEARCH_SHORTLIST_SIZE', 10)
+
+VERSION_KEY = 'search_index:version'
+
+STOP_WORDS = frozenset("""
+    a an and are as at be bike bikes by e for from i in is it me my need of on or
+    the to want with
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens with stop words removed."""
+    return [token for token in re.findall(r'\w+', (text or '').lower()) if token not in STOP_WORDS]
+
+
+class BikeIndex:
+    """Thread-safe BM25 index keyed by bike ID, updated one document at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # term -> {bike_id: term frequency}
+        self._documents = {}  # bike_id -> (document length, terms)
+        self._total_length = 0
+        # Shared version this index is current with, or None if it needs a (re)build
+        self.version = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    @staticmethod
+    def _text(bike):
+        return (bike.name or '', bike.description or '')
+
+    def _add(self, bike_id, text):
+        name, description = text
+        counts = Counter(tokenize(description))
+        for term in tokenize(name):
+            counts[term] += NAME_WEIGHT
+        for term, frequency in counts.items():
+            self._postings[term][bike_id] = frequency
+        length = sum(counts.values())
+        self._documents[bike_id] = (length, tuple(counts))
+        self._total_length += length
+
+    def _remove(self, bike_id):
+        document = self._documents.pop(bike_id, None)
+        if document is None:
+            return
+        length, terms = document
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(bike_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= length
+
+    def _advance(self, version):
+        # Still current only if this change is the one right after the version it had
+        if self.version is None or version is None or version != self.version + 1:
+            self.version = None
+        else:
+            self.version = version
+
+    def update(self, bike, version=None):
+        """(Re-)index one bike; ``version`` is the shared version the change produced."""
+        with self._lock:
+            self._remove(bike.pk)
+            self._add(bike.pk, self._text(bike))
+            self._advance(version)
+
+    def remove(self, bike_id, version=None):
+        with self._lock:
+            self._remove(bike_id)
+            self._advance(version)
+
+    def build(self, bikes, version=None):
+        """Replace the whole index with ``bikes``, current as of ``version``."""
+        documents = [(bike.pk, self._text(bike)) for bike in bikes]
+        with self._lock:
+            self._clear()
+            for bike_id, text in documents:
+                self._add(bike_id, text)
+            self.version = version
+
+    def _clear(self):
+        self._postings.clear()
+        self._documents.clear()
+        self._total_length = 0
+        self.version = None
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def rank(self, query, bikes, limit, matches_only=False):
+        """
+        Rank ``bikes`` against ``query`` and return the best ``limit`` of them.
+
+        Only the postings of the query terms are read, so the cost depends on
+        how many bikes mention those terms, not on the fleet size or the
+        description lengths. Bikes are looked up by ID in the index as it
+        stands (see ``warm_index``). Bikes with no matching term keep their
+        original order after the matches, unless ``matches_only`` is set.
+
+        Returns:
+            List of (bike, score, matched terms) tuples, best first
+        """
+        bikes = list(bikes)
+        terms = list(dict.fromkeys(tokenize(query)))
+        by_id = {bike.pk: bike for bike in bikes}
+        scores = defaultdict(float)
+        matched = defaultdict(list)
+
+        with self._lock:
+            count = len(self._documents)
+            average_length = self._total_length / count if count else 0
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for bike_id, frequency in postings.items():
+                    if bike_id not in by_id:
+                        continue
+                    length = self._documents[bike_id][0]
+                    norm = K1 * (1 - B + B * length / average_length) if average_length else K1
+                    scores[bike_id] += idf * frequency * (K1 + 1) / (frequency + norm)
+                    matched[bike_id].append(term)
+
+        position = {bike.pk: i for i, bike in enumerate(bikes)}
+        best = heapq.nsmallest(limit, scores, key=lambda bike_id: (-scores[bike_id], position[bike_id]))
+        ranked = [(by_id[bike_id], scores[bike_id], matched[bike_id]) for bike_id in best]
+        if not matches_only and len(ranked) < limit:
+            ranked.extend(
+                (bike, 0.0, []) for bike in bikes if bike.pk not in scores
+            )
+            ranked = ranked[:limit]
+        return ranked
+
+
+bike_index = BikeIndex()
+
+
+def _start_version():
+    # A random starting point, so a counter recreated after eviction can't
+    # land back on a version some process's index already has
+    cache.add(VERSION_KEY, random.randrange(1 << 48), timeout=None)
+
+
+def publish_index_change():
+    """
+    Increment the shared index version for a change to a bike's indexed text.
+
+    Returns:
+        The new version, or None if the counter was lost from the cache meanwhile
+    """
+    _start_version()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return None
+
+
+def warm_index(version=None):
+    """
+    Build this process's index from the database unless it is already current.
+
+    Costs one cache read when the index is current, which is every call after
+    the first one unless another process has changed a bike.
+    """
+    from core.models import EBike
+
+    if version is None:
+        version = cache.get(VERSION_KEY)
+    if version is None:
+        _start_version()
+        version = cache.get(VERSION_KEY)
+    if version is None or version != bike_index.version:
+        bike_index.build(EBike.objects.only('id', 'name', 'description'), version)
+
+
+async def awarm_index():
+    """``warm_index`` for async callers: only hops to a thread when a build is needed."""
+    version = await cache.aget(VERSION_KEY)
+    if version is None or version != bike_index.version:
+        await sync_to_async(warm_index)(version)
+
+
+def shortlist_bikes(query, bikes, limit=None):
+    """The ``limit`` bikes most relevant to ``query``, to be sent to the model."""
+    return [bike for bike, _, _ in bike_index.rank(query, bikes, limit or SHORTLIST_SIZE)]
+
+
+def offline_recommendations(query, bikes, limit=3):
+    """Recommendations from the local ranking alone, for when Gemini is unavailable."""
+    return [
+        {
+            'bike': bike,
+            'explanation': f"Matches your search for: {', '.join(terms)}",
+        }
+        for bike, _, terms in bike_index.rank(query, bikes, limit, matches_only=True)
+    ]
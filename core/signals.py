@@ -1,20 +1,17 @@
-from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.utils import timezone
 
-from core.models import Booking, EBike
+from core.models import Booking, EBike, Notification, Withdrawal
+from core.ledger import WITHDRAWAL_LEDGER_FIELDS, apply_ledger_delta
+from core.notifications import invalidate_for_notification
+from core.receipts import clear_cached_receipts
+from core.search_index import bike_index, publish_index_change
 
 
 def _recompute_bike_availability(bike: EBike):
-    today = timezone.localdate()
-    has_active_booking = Booking.objects.filter(
-        ebike=bike,
-        is_approved=True,
-        is_rejected=False,
-        is_paid=True,
-        start_date__lte=today,
-        end_date__gte=today,
-    ).exists()
+    has_active_booking = Booking.objects.filter(ebike=bike).occupying().exists()
     new_available = not has_active_booking
     if bike.is_available != new_available:
         bike.is_available = new_available
@@ -29,3 +26,116 @@ def update_bike_availability_on_booking_save(sender, instance: Booking, **kwargs
 @receiver(post_delete, sender=Booking)
 def update_bike_availability_on_booking_delete(sender, instance: Booking, **kwargs):
     _recompute_bike_availability(instance.ebike)
+
+
+# --- Provider ledger maintenance ---
+# Each handler works out what the row contributed to the ledger before and after
+# the change and applies only the difference. Queryset .update() calls bypass
+# these signals; `manage.py reconcile_provider_ledgers` repairs any drift.
+
+def _booking_earnings(counts_as_earning, total_price):
+    return Decimal(str(total_price or 0)) if counts_as_earning else Decimal('0')
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_ledger_state(sender, instance: Booking, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Booking.objects.filter(pk=instance.pk).values('is_approved', 'total_price', 'ebike__provider_id').first()
+    instance._ledger_previous = previous
+
+
+@receiver(post_save, sender=Booking)
+def update_provider_ledger_on_booking_save(sender, instance: Booking, **kwargs):
+    previous = getattr(instance, '_ledger_previous', None)
+    provider_id = instance.ebike.provider_id
+    counts_as_earning = instance.counts_as_earning
+    update_fields = kwargs.get('update_fields')
+    if previous and update_fields is not None and 'is_approved' not in update_fields:
+        # The stored flag wasn't written, so the row still counts as it did before
+        counts_as_earning = previous['is_approved']
+    new_earnings = _booking_earnings(counts_as_earning, instance.total_price)
+
+    if previous and previous['ebike__provider_id'] != provider_id:
+        apply_ledger_delta(previous['ebike__provider_id'], total_earnings=-_booking_earnings(previous['is_approved'], previous['total_price']))
+        old_earnings = Decimal('0')
+    elif previous:
+        old_earnings = _booking_earnings(previous['is_approved'], previous['total_price'])
+    else:
+        old_earnings = Decimal('0')
+
+    apply_ledger_delta(provider_id, total_earnings=new_earnings - old_earnings)
+
+
+@receiver(post_delete, sender=Booking)
+def update_provider_ledger_on_booking_delete(sender, instance: Booking, **kwargs):
+    apply_ledger_delta(instance.ebike.provider_id, total_earnings=-_booking_earnings(instance.counts_as_earning, instance.total_price))
+
+
+def _withdrawal_deltas(status, amount, sign=1):
+    field = WITHDRAWAL_LEDGER_FIELDS.get(status)
+    if not field:
+        return {}
+    return {field: sign * Decimal(str(amount or 0))}
+
+
+@receiver(pre_save, sender=Withdrawal)
+def remember_withdrawal_ledger_state(sender, instance: Withdrawal, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Withdrawal.objects.filter(pk=instance.pk).values('status', 'amount', 'provider_id').first()
+    instance._ledger_previous = previous
+
+
+@receiver(post_save, sender=Withdrawal)
+def update_provider_ledger_on_withdrawal_save(sender, instance: Withdrawal, **kwargs):
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous and previous['provider_id'] != instance.provider_id:
+        apply_ledger_delta(previous['provider_id'], **_withdrawal_deltas(previous['status'], previous['amount'], sign=-1))
+        previous = None
+
+    deltas = _withdrawal_deltas(instance.status, instance.amount)
+    if previous:
+        for field, amount in _withdrawal_deltas(previous['status'], previous['amount'], sign=-1).items():
+            deltas[field] = deltas.get(field, Decimal('0')) + amount
+    apply_ledger_delta(instance.provider_id, **deltas)
+
+
+@receiver(post_delete, sender=Withdrawal)
+def update_provider_ledger_on_withdrawal_delete(sender, instance: Withdrawal, **kwargs):
+    apply_ledger_delta(instance.provider_id, **_withdrawal_deltas(instance.status, instance.amount, sign=-1))
+
+
+# --- Cached unread notification counts ---
+# bulk_create and queryset .update() don't send these signals; core.notifications
+# invalidates explicitly on those paths.
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_notification_counts_on_change(sender, instance: Notification, **kwargs):
+    invalidate_for_notification(instance)
+
+
+# --- Smart search index ---
+# Re-tokenize only the bike that changed; the rest of the index is untouched.
+# The shared version bump tells other processes' indexes to rebuild.
+
+@receiver(post_save, sender=EBike)
+def update_search_index_on_ebike_save(sender, instance: EBike, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return  # e.g. availability flips, which don't change the indexed text
+    bike_index.update(instance, version=publish_index_change())
+
+
+@receiver(post_delete, sender=EBike)
+def remove_from_search_index_on_ebike_delete(sender, instance: EBike, **kwargs):
+    bike_index.remove(instance.pk, version=publish_index_change())
+
+
+# --- Cached receipt PDFs ---
+# Edits need nothing here: the receipt digest changes and the next download
+# re-renders. Deleted bookings would otherwise leave their files behind.
+
+@receiver(post_delete, sender=Booking)
+def delete_cached_receipts_on_booking_delete(sender, instance: Booking, **kwargs):
+    clear_cached_receipts(instance.pk)
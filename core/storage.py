@@ -0,0 +1,32 @@
+"""
+Storage for files that only their owner may download.
+
+Anything under MEDIA_ROOT can be fetched from MEDIA_URL by whoever knows (or
+guesses) its name. Files such as provider statements are kept under
+``PRIVATE_MEDIA_ROOT`` instead, which no URL maps to, and are streamed by a
+view that checks who is asking.
+"""
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import cached_property
+
+
+class PrivateMediaStorage(FileSystemStorage):
+    """FileSystemStorage rooted at ``settings.PRIVATE_MEDIA_ROOT``, with no public URLs."""
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    def url(self, name):
+        raise ValueError("Private files have no public URL; serve them through a view that checks access.")
+
+
+private_storage = PrivateMediaStorage()
@@ -1,8 +1,9 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.db.models import Sum
 from decimal import Decimal
+import json
 
 from .models import EBike, Booking, Withdrawal
 
@@ -276,3 +277,2327 @@ class WithdrawalTestCase(TestCase):
         # Check error message
         messages = list(response.wsgi_request._messages)
         self.assertTrue(any('Receipt is only available for completed withdrawals' in str(msg) for msg in messages))
+
+
+class AvailabilitySyncTestCase(TestCase):
+    """
+    Test cases for the set-based bike availability sync
+    """
+
+    def setUp(self):
+        """Set up a provider, a rider and a small fleet"""
+        import datetime
+
+        self.provider = User.objects.create_user(
+            username='sync_provider',
+            email='sync_provider@test.com',
+            password='testpass123',
+            is_vehicle_provider=True,
+            is_verified_provider=True
+        )
+        self.rider = User.objects.create_user(
+            username='sync_rider',
+            email='sync_rider@test.com',
+            password='testpass123',
+            is_rider=True
+        )
+
+        self.booked_bike = EBike.objects.create(
+            name='Booked EBike',
+            description='Has an active booking',
+            price_per_day=500.00,
+            price_per_week=3000.00,
+            provider=self.provider
+        )
+        self.free_bike = EBike.objects.create(
+            name='Free EBike',
+            description='Has no bookings',
+            price_per_day=500.00,
+            price_per_week=3000.00,
+            provider=self.provider
+        )
+
+        today = datetime.date.today()
+        Booking.objects.create(
+            rider=self.rider,
+            ebike=self.booked_bike,
+            start_date=today,
+            start_time=datetime.time(0, 0),
+            end_date=today + datetime.timedelta(days=2),
+            total_price=1000.00,
+            status='approved',
+            is_approved=True,
+            is_paid=True
+        )
+
+    def test_sync_flips_stale_availability(self):
+        """Stale flags on both bikes are corrected and counted"""
+        from .utils import sync_bike_availability
+
+        # Put both bikes in the wrong state
+        EBike.objects.filter(id=self.booked_bike.id).update(is_available=True)
+        EBike.objects.filter(id=self.free_bike.id).update(is_available=False)
+
+        self.assertEqual(sync_bike_availability(), 2)
+
+        self.booked_bike.refresh_from_db()
+        self.free_bike.refresh_from_db()
+        self.assertFalse(self.booked_bike.is_available)
+        self.assertTrue(self.free_bike.is_available)
+
+    def test_sync_is_noop_when_up_to_date(self):
+        """A second sync has nothing left to update"""
+        from .utils import sync_bike_availability
+
+        sync_bike_availability()
+        self.assertEqual(sync_bike_availability(), 0)
+
+
+class BookingIntervalTestCase(TestCase):
+    """
+    Test cases for the materialized booking interval columns
+    """
+
+    def setUp(self):
+        """Set up a bike with one booking"""
+        import datetime
+
+        self.provider = User.objects.create_user(
+            username='interval_provider',
+            password='testpass123',
+            is_vehicle_provider=True
+        )
+        self.rider = User.objects.create_user(
+            username='interval_rider',
+            password='testpass123',
+            is_rider=True
+        )
+        self.ebike = EBike.objects.create(
+            name='Interval EBike',
+            description='Interval test bike',
+            price_per_day=500.00,
+            price_per_week=3000.00,
+            provider=self.provider
+        )
+        self.start = datetime.date.today() + datetime.timedelta(days=5)
+        self.booking = Booking.objects.create(
+            rider=self.rider,
+            ebike=self.ebike,
+            start_date=self.start,
+            start_time=datetime.time(9, 0),
+            end_date=self.start + datetime.timedelta(days=2),
+            end_time=datetime.time(18, 0),
+            total_price=1000.00,
+        )
+
+    def test_save_populates_start_at_and_end_at(self):
+        """start_at/end_at mirror the date and time columns"""
+        import datetime
+
+        self.assertEqual(self.booking.start_at, Booking.combine_datetime(self.start, datetime.time(9, 0)))
+        self.assertEqual(
+            self.booking.end_at,
+            Booking.combine_datetime(self.start + datetime.timedelta(days=2), datetime.time(18, 0))
+        )
+
+    def test_overlapping(self):
+        """Half-open interval overlap against the booking window"""
+        import datetime
+
+        start_at = self.booking.start_at
+        end_at = self.booking.end_at
+        hour = datetime.timedelta(hours=1)
+
+        self.assertTrue(Booking.objects.overlapping(start_at - hour, start_at + hour).exists())
+        self.assertTrue(Booking.objects.overlapping(end_at - hour, end_at + hour).exists())
+        # Touching windows do not overlap
+        self.assertFalse(Booking.objects.overlapping(end_at, end_at + hour).exists())
+        self.assertFalse(Booking.objects.overlapping(start_at - hour, start_at).exists())
+
+
+class BookingConflictTestCase(TransactionTestCase):
+    """
+    Test cases for double-booking prevention in core.bookings
+    """
+
+    def setUp(self):
+        """Set up one bike and a handful of riders"""
+        import datetime
+
+        self.provider = User.objects.create_user(
+            username='conflict_provider',
+            password='testpass123',
+            is_vehicle_provider=True
+        )
+        self.riders = [
+            User.objects.create_user(username=f'conflict_rider_{i}', password='testpass123', is_rider=True)
+            for i in range(8)
+        ]
+        self.ebike = EBike.objects.create(
+            name='Popular EBike',
+            description='Everyone wants this one',
+            price_per_day=500.00,
+            price_per_week=3000.00,
+            provider=self.provider
+        )
+        self.start = datetime.date.today() + datetime.timedelta(days=3)
+
+    def _booking(self, rider, start_offset=0, days=2, status='awaiting_approval'):
+        import datetime
+
+        start = self.start + datetime.timedelta(days=start_offset)
+        return Booking(
+            rider=rider,
+            ebike=self.ebike,
+            start_date=start,
+            end_date=start + datetime.timedelta(days=days),
+            total_price=1000.00,
+            status=status,
+        )
+
+    def test_overlapping_booking_is_rejected(self):
+        """A second booking over the same window raises a conflict"""
+        from .bookings import BookingConflictError, create_booking
+
+        create_booking(self._booking(self.riders[0]))
+        with self.assertRaises(BookingConflictError):
+            create_booking(self._booking(self.riders[1], start_offset=1))
+
+    def test_non_overlapping_and_non_blocking_bookings_are_allowed(self):
+        """Back-to-back dates and expired payment holds don't block the bike"""
+        import datetime
+        from django.utils import timezone
+        from .bookings import BookingConflictError, create_booking
+
+        # A fresh payment-pending booking holds the bike until its hold runs out
+        abandoned = create_booking(self._booking(self.riders[0], status='pending'))
+        with self.assertRaises(BookingConflictError):
+            create_booking(self._booking(self.riders[1], status='pending'))
+        Booking.objects.filter(pk=abandoned.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+
+        create_booking(self._booking(self.riders[1], status='pending'))
+        Booking.objects.filter(rider=self.riders[1]).update(status='cancelled')
+        create_booking(self._booking(self.riders[2], days=1))
+        create_booking(self._booking(self.riders[3], start_offset=2, days=1))
+        self.assertEqual(Booking.objects.filter(ebike=self.ebike).count(), 4)
+
+    def test_book_and_pay_flow_never_double_books(self):
+        """Paying for a booking whose hold expired can't confirm it over a newer one"""
+        import datetime
+        from unittest import mock
+        from django.test import override_settings
+        from django.utils import timezone
+
+        def book(rider):
+            client = Client()
+            client.force_login(rider)
+            response = client.post(reverse('book_ebike', args=[self.ebike.id]), {
+                'start_date': self.start.isoformat(),
+                'start_time': '09:00',
+                'end_date': (self.start + datetime.timedelta(days=2)).isoformat(),
+                'end_time': '18:00',
+            })
+            return client, response
+
+        def pay(client, booking):
+            return client.post(
+                reverse('verify_razorpay_payment', args=[booking.id]),
+                data=json.dumps({
+                    'razorpay_payment_id': f'pay_{booking.id}',
+                    'razorpay_order_id': f'order_{booking.id}',
+                    'razorpay_signature': 'signature',
+                }),
+                content_type='application/json',
+            )
+
+        first_client, response = book(self.riders[0])
+        self.assertEqual(response.status_code, 302)
+        first = Booking.objects.get(rider=self.riders[0])
+
+        # The first rider's unpaid booking holds the window
+        from .bookings import BookingConflictError, confirm_approval, create_booking
+        with self.assertRaises(BookingConflictError):
+            create_booking(self._booking(self.riders[1], status='pending'))
+
+        # Once the hold has expired another rider can book and pay
+        Booking.objects.filter(pk=first.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        second_client, response = book(self.riders[1])
+        self.assertEqual(response.status_code, 302)
+        second = Booking.objects.get(rider=self.riders[1])
+
+        with override_settings(RAZORPAY_KEY_ID='key', RAZORPAY_KEY_SECRET='secret'), \
+                mock.patch('riders.views.razorpay.Client'), \
+                mock.patch('riders.views.send_payment_confirmation_email'):
+            self.assertEqual(pay(second_client, second).status_code, 200)
+            late = pay(first_client, first)
+
+        self.assertEqual(late.status_code, 409)
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(second.status, 'awaiting_approval')
+        self.assertEqual(first.status, 'cancelled')
+        self.assertTrue(first.is_paid)
+        self.assertEqual(Booking.objects.filter(ebike=self.ebike, status__in=['awaiting_approval', 'approved']).count(), 1)
+
+        # Approval re-checks the window too
+        with self.assertRaises(BookingConflictError):
+            confirm_approval(first)
+        confirm_approval(second)
+        self.assertEqual(Booking.objects.filter(ebike=self.ebike, status='approved').count(), 1)
+
+    def test_parallel_booking_attempts(self):
+        """Parallel attempts for the same window never produce a double booking"""
+        import threading
+        from django.db import OperationalError, connection
+        from .bookings import BookingConflictError, create_booking
+
+        barrier = threading.Barrier(len(self.riders))
+        outcomes = []
+        lock = threading.Lock()
+
+        def attempt(rider):
+            try:
+                barrier.wait()
+                create_booking(self._booking(rider))
+                outcome = 'booked'
+            except BookingConflictError:
+                outcome = 'conflict'
+            except OperationalError:
+                # Lock wait gave up (SQLite busy timeout); the attempt wrote nothing
+                outcome = 'locked'
+            finally:
+                connection.close()
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=attempt, args=(rider,)) for rider in self.riders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        persisted = Booking.objects.filter(ebike=self.ebike, status='awaiting_approval').count()
+        self.assertEqual(len(outcomes), len(self.riders))
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(persisted, 1)
+
+
+class ProviderLedgerQueryTestCase(TestCase):
+    """
+    Test cases for the provider ledger in core.ledger and its signal handlers
+    """
+
+    def setUp(self):
+        """Set up several providers with bikes, bookings and withdrawals"""
+        import datetime
+
+        rider = User.objects.create_user(username='ledger_rider', password='testpass123', is_rider=True)
+        start = datetime.date.today() + datetime.timedelta(days=1)
+
+        for i in range(3):
+            provider = User.objects.create_user(
+                username=f'ledger_provider_{i}',
+                password='testpass123',
+                is_vehicle_provider=True
+            )
+            for j in range(2):
+                ebike = EBike.objects.create(
+                    name=f'Ledger EBike {i}-{j}',
+                    description='Ledger test bike',
+                    price_per_day=500.00,
+                    price_per_week=3000.00,
+                    provider=provider
+                )
+                Booking.objects.create(
+                    rider=rider,
+                    ebike=ebike,
+                    start_date=start,
+                    end_date=start + datetime.timedelta(days=1),
+                    total_price=500.00,
+                    status='approved',
+                    is_paid=True
+                )
+            Withdrawal.objects.create(
+                provider=provider,
+                amount=100.00,
+                account_holder_name='Test Account',
+                account_number='1234567890',
+                status='pending'
+            )
+
+    def test_provider_ledgers_values(self):
+        """Each provider row carries earnings, charges and balance"""
+        from .ledger import provider_ledgers
+
+        rows = {row['username']: row for row in provider_ledgers()}
+        row = rows['ledger_provider_0']
+        self.assertEqual(row['total_earnings'], Decimal('1000.00'))
+        self.assertEqual(row['platform_charges'], Decimal('100.00'))
+        self.assertEqual(row['pending_withdrawals'], Decimal('100.00'))
+        self.assertEqual(row['available_balance'], Decimal('800.00'))
+        self.assertEqual(len(row['bikes']), 2)
+
+    def test_provider_ledgers_query_count_is_constant(self):
+        """Once ledgers exist, providers with their ledgers and bikes take two queries"""
+        from .ledger import provider_ledgers
+
+        provider_ledgers()
+        with self.assertNumQueries(2):
+            provider_ledgers()
+
+    def test_ledger_follows_booking_status_changes(self):
+        """Approving and rejecting a booking adjusts the provider's earnings"""
+        import datetime
+        from .ledger import get_provider_ledger
+
+        provider = User.objects.get(username='ledger_provider_0')
+        ledger = get_provider_ledger(provider)
+        booking = Booking.objects.create(
+            rider=User.objects.get(username='ledger_rider'),
+            ebike=provider.ebikes.first(),
+            start_date=datetime.date.today() + datetime.timedelta(days=10),
+            end_date=datetime.date.today() + datetime.timedelta(days=11),
+            total_price=250.00,
+            status='pending'
+        )
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.total_earnings, Decimal('1000.00'))
+
+        booking.status = 'approved'
+        booking.save()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.total_earnings, Decimal('1250.00'))
+
+        booking.status = 'rejected'
+        booking.save()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.total_earnings, Decimal('1000.00'))
+
+    def test_ledger_follows_withdrawal_status_changes(self):
+        """Completing a withdrawal moves it out of the reserved balance"""
+        from .ledger import get_provider_ledger
+
+        provider = User.objects.get(username='ledger_provider_0')
+        ledger = get_provider_ledger(provider)
+        withdrawal = Withdrawal.objects.get(provider=provider)
+
+        withdrawal.status = 'completed'
+        withdrawal.save()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.pending_withdrawals, Decimal('0.00'))
+        self.assertEqual(ledger.completed_withdrawals, Decimal('100.00'))
+        self.assertEqual(ledger.available_balance, Decimal('900.00'))
+
+        withdrawal.delete()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.completed_withdrawals, Decimal('0.00'))
+
+    def test_reconcile_command_reports_and_repairs_drift(self):
+        """Queryset updates bypass the signals; the reconcile command fixes the ledger"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .ledger import get_provider_ledger
+
+        provider = User.objects.get(username='ledger_provider_0')
+        ledger = get_provider_ledger(provider)
+        Booking.objects.filter(ebike__provider=provider).update(total_price=Decimal('600.00'))
+
+        out = StringIO()
+        call_command('reconcile_provider_ledgers', '--dry-run', '--provider', str(provider.pk), stdout=out)
+        self.assertIn('total_earnings was 1000.00, expected 1200.00', out.getvalue())
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.total_earnings, Decimal('1000.00'))
+
+        call_command('reconcile_provider_ledgers', stdout=StringIO())
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.total_earnings, Decimal('1200.00'))
+
+        out = StringIO()
+        call_command('reconcile_provider_ledgers', stdout=out)
+        self.assertIn('All provider ledgers are in sync', out.getvalue())
+
+    def test_signals_and_rebuild_count_the_same_bookings(self):
+        """A booking whose status and is_approved disagree is counted the same by both paths"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        provider = User.objects.get(username='ledger_provider_0')
+        booking = Booking.objects.filter(ebike__provider=provider).first()
+        Booking.objects.filter(pk=booking.pk).update(is_approved=False)
+        call_command('reconcile_provider_ledgers', stdout=StringIO())
+
+        # status is still 'approved' on the instance; only total_price is written
+        booking.total_price = Decimal('700.00')
+        booking.save(update_fields=['total_price'])
+
+        out = StringIO()
+        call_command('reconcile_provider_ledgers', '--dry-run', stdout=out)
+        self.assertIn('All provider ledgers are in sync', out.getvalue())
+
+
+class EmailOutboxTestCase(TestCase):
+    """
+    Test cases for the outbound email queue in core.mail
+    """
+
+    class FailingConnection:
+        """Email backend stand-in whose server rejects every message"""
+
+        def open(self):
+            return True
+
+        def close(self):
+            pass
+
+        def send_messages(self, messages):
+            raise ConnectionError('SMTP server unavailable')
+
+    def test_queue_email_does_not_send(self):
+        """Queueing only stores the message"""
+        from django.core import mail
+        from .mail import queue_email
+        from .models import OutboundEmail
+
+        email = queue_email('Hello', 'Body', ['rider@example.com'], html_message='<p>Body</p>')
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(email.status, 'queued')
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertIsNone(queue_email('Hello', 'Body', ['']))
+
+    def test_worker_sends_queued_emails(self):
+        """The worker sends every due message and marks it sent"""
+        from django.core import mail
+        from .mail import deliver_queued_emails, queue_email
+        from .models import OutboundEmail
+
+        for i in range(3):
+            queue_email(f'Message {i}', 'Body', [f'rider{i}@example.com'], html_message='<p>Body</p>')
+
+        counts = deliver_queued_emails()
+
+        self.assertEqual(counts, {'sent': 3, 'retrying': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        self.assertEqual(deliver_queued_emails(), {'sent': 0, 'retrying': 0, 'failed': 0})
+
+    def test_failed_email_is_retried_with_backoff_then_given_up(self):
+        """Failures are rescheduled with backoff until the attempt limit is reached"""
+        from django.utils import timezone
+        from .mail import deliver_queued_emails, max_attempts, queue_email
+
+        email = queue_email('Hello', 'Body', ['rider@example.com'])
+
+        counts = deliver_queued_emails(connection=self.FailingConnection())
+        email.refresh_from_db()
+        self.assertEqual(counts['retrying'], 1)
+        self.assertEqual(email.status, 'queued')
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('SMTP server unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing is picked up
+        self.assertEqual(deliver_queued_emails(connection=self.FailingConnection())['retrying'], 0)
+
+        email.attempts = max_attempts() - 1
+        email.next_attempt_at = timezone.now()
+        email.save()
+        counts = deliver_queued_emails(connection=self.FailingConnection())
+        email.refresh_from_db()
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual(email.status, 'failed')
+
+    def test_attempt_limit_setting_is_read_at_send_time(self):
+        """Overriding EMAIL_OUTBOX_MAX_ATTEMPTS applies to messages already queued"""
+        from django.test import override_settings
+        from django.utils import timezone
+        from .mail import deliver_queued_emails, queue_email
+
+        first = queue_email('Hello', 'Body', ['rider@example.com'])
+        with override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1):
+            counts = deliver_queued_emails(connection=self.FailingConnection())
+        first.refresh_from_db()
+        self.assertEqual(counts['failed'], 1)
+        self.assertEqual(first.status, 'failed')
+
+        # A message that already used up a lowered limit is given up on, not retried
+        second = queue_email('Hello', 'Body', ['rider@example.com'])
+        second.attempts = 2
+        second.next_attempt_at = timezone.now()
+        second.save()
+        with override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2):
+            self.assertEqual(deliver_queued_emails(), {'sent': 0, 'retrying': 0, 'failed': 0})
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'failed')
+
+    def test_contact_form_only_queues_emails(self):
+        """Submitting the contact form doesn't talk to the mail server"""
+        from django.core import mail
+        from django.test import override_settings
+        from .models import OutboundEmail
+
+        with override_settings(CONTACT_RECEIVER_EMAIL='owner@example.com'):
+            response = Client().post(reverse('contact'), {
+                'name': 'Visitor',
+                'email': 'visitor@example.com',
+                'subject': 'Question',
+                'message': 'Do you deliver bikes?',
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        recipients = sorted(email.recipients[0] for email in OutboundEmail.objects.all())
+        self.assertEqual(recipients, ['owner@example.com', 'visitor@example.com'])
+
+
+class BulkApprovalEmailTestCase(TestCase):
+    """
+    Test cases for sending bulk booking approval emails over one connection
+    """
+
+    class RejectingConnection:
+        """Email backend stand-in that rejects one address and records the rest"""
+
+        def __init__(self, rejected):
+            self.rejected = rejected
+            self.opened = 0
+            self.sent = []
+
+        def open(self):
+            self.opened += 1
+            return True
+
+        def close(self):
+            pass
+
+        def send_messages(self, messages):
+            for message in messages:
+                if self.rejected in message.to:
+                    raise ValueError('Recipient address rejected')
+                self.sent.append(message)
+            return len(messages)
+
+    def _message(self, address):
+        from django.core.mail import EmailMultiAlternatives
+        return EmailMultiAlternatives('Booking Confirmed', 'Body', 'noreply@example.com', [address])
+
+    def test_send_batch_reports_each_recipient(self):
+        """One failed recipient doesn't stop the rest of the batch"""
+        from .mail import send_batch
+
+        connection = self.RejectingConnection('bad@example.com')
+        results = send_batch(
+            [self._message(address) for address in ('a@example.com', 'bad@example.com', 'b@example.com')],
+            connection=connection,
+        )
+
+        self.assertEqual(connection.opened, 1)
+        self.assertEqual([message.to[0] for message in connection.sent], ['a@example.com', 'b@example.com'])
+        self.assertEqual([error is None for _, error in results], [True, False, True])
+
+    def _approve_pending_bookings(self):
+        """Create three pending bookings for different riders and bulk approve them as an admin"""
+        import datetime
+
+        admin = User.objects.create_user(username='bulk_admin', password='testpass123', is_staff=True)
+        provider = User.objects.create_user(username='bulk_provider', password='testpass123', is_vehicle_provider=True)
+        ebike = EBike.objects.create(
+            name='Bulk EBike', description='Bulk test bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=provider
+        )
+        booking_ids = []
+        for i in range(3):
+            rider = User.objects.create_user(
+                username=f'bulk_rider_{i}', email=f'rider{i}@example.com', password='testpass123', is_rider=True
+            )
+            start = datetime.date.today() + datetime.timedelta(days=1 + 2 * i)
+            booking_ids.append(Booking.objects.create(
+                rider=rider, ebike=ebike, start_date=start, end_date=start, total_price=500.00
+            ).id)
+
+        client = Client()
+        client.force_login(admin)
+        return booking_ids, client.post(reverse('bulk_approve_bookings'), {'booking_ids': booking_ids})
+
+    def test_bulk_approve_bookings_sends_emails_in_one_batch(self):
+        """Bulk approval emails every rider and reports how many were emailed"""
+        from django.contrib.messages import get_messages
+        from django.core import mail
+
+        booking_ids, response = self._approve_pending_bookings()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(id__in=booking_ids, status='approved').count(), 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['rider0@example.com', 'rider1@example.com', 'rider2@example.com'])
+        notes = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertTrue(any('Approval email sent to 3 rider(s)' in note for note in notes))
+        self.assertFalse(any('@example.com' in note for note in notes))
+
+    def test_bulk_approve_names_bookings_whose_email_failed(self):
+        """The warning lists the bookings whose rider wasn't emailed, and their emails stay queued"""
+        from unittest import mock
+        from django.contrib.messages import get_messages
+        from .models import OutboundEmail
+
+        connection = self.RejectingConnection('rider1@example.com')
+        with mock.patch('core.mail.get_connection', return_value=connection):
+            booking_ids, response = self._approve_pending_bookings()
+
+        notes = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertIn(
+            f"Approval email could not be sent for 1 booking(s): #{booking_ids[1]}. "
+            "Those emails stay queued in the outbox for retry.",
+            notes,
+        )
+        self.assertTrue(any('Approval email sent to 2 rider(s)' in note for note in notes))
+        self.assertEqual(list(OutboundEmail.objects.values_list('recipients', flat=True)), [['rider1@example.com']])
+
+
+class NotificationDispatchTestCase(TestCase):
+    """
+    Test cases for the notification dispatch API in core.notifications
+    """
+
+    def setUp(self):
+        """Set up riders and staff users"""
+        self.riders = [
+            User.objects.create_user(username=f'notify_rider_{i}', password='testpass123', is_rider=True)
+            for i in range(5)
+        ]
+        self.admins = [
+            User.objects.create_user(username=f'notify_admin_{i}', password='testpass123', is_staff=True)
+            for i in range(3)
+        ]
+
+    def test_notify_formats_per_recipient_in_batches(self):
+        """Fan-out renders the template per user and inserts in batches"""
+        from .models import Notification
+        from .notifications import notify
+
+        with self.assertNumQueries(3):
+            notify(self.riders, 'Hello {recipient.username}', link='/rider/dashboard/', batch_size=2)
+
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(
+            Notification.objects.get(recipient=self.riders[0]).message,
+            'Hello notify_rider_0'
+        )
+
+    def test_staff_notification_has_read_state_per_admin(self):
+        """Staff get one shared row, but one admin reading it doesn't clear it for the rest"""
+        from .models import Notification, NotificationRead
+        from .notifications import mark_notifications_read, notify_staff, user_unread_count
+
+        notify_staff('New booking by rider for EBike.', link='/admin-dashboard/#bookings')
+
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(Notification.objects.for_user(self.riders[0]).count(), 0)
+        self.assertEqual(user_unread_count(self.riders[0]), 0)
+        for admin in self.admins:
+            self.assertEqual(user_unread_count(admin), 1)
+
+        self.assertEqual(mark_notifications_read(self.admins[0]), 1)
+        self.assertEqual(mark_notifications_read(self.admins[0]), 0)
+        self.assertEqual(NotificationRead.objects.count(), 1)
+        self.assertEqual(Notification.objects.unread_for(self.admins[0]).count(), 0)
+        self.assertEqual(user_unread_count(self.admins[0]), 0)
+        self.assertFalse(Notification.objects.get().is_read)
+        for admin in self.admins[1:]:
+            self.assertEqual(Notification.objects.unread_for(admin).count(), 1)
+            self.assertEqual(user_unread_count(admin), 1)
+
+    def test_new_booking_notifies_staff(self):
+        """Booking a bike sends every admin a notification"""
+        import datetime
+        from .models import Notification
+
+        provider = User.objects.create_user(username='notify_booking_provider', password='testpass123', is_vehicle_provider=True)
+        ebike = EBike.objects.create(
+            name='Notify Booking EBike', description='Notification test bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=provider
+        )
+        start = datetime.date.today() + datetime.timedelta(days=2)
+
+        client = Client()
+        client.force_login(self.riders[0])
+        response = client.post(reverse('book_ebike', args=[ebike.id]), {
+            'start_date': start.isoformat(),
+            'start_time': '09:00',
+            'end_date': (start + datetime.timedelta(days=1)).isoformat(),
+            'end_time': '18:00',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        for admin in self.admins:
+            self.assertTrue(Notification.objects.for_user(admin).filter(message__contains='Notify Booking EBike').exists())
+
+    def test_bulk_reject_bookings_notifies_with_one_insert(self):
+        """Bulk rejection writes every rider notification together"""
+        import datetime
+        from .models import Notification
+
+        provider = User.objects.create_user(username='notify_provider', password='testpass123', is_vehicle_provider=True)
+        ebike = EBike.objects.create(
+            name='Notify EBike', description='Notification test bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=provider
+        )
+        booking_ids = [
+            Booking.objects.create(
+                rider=rider, ebike=ebike, total_price=500.00,
+                start_date=datetime.date.today() + datetime.timedelta(days=1 + 2 * i),
+                end_date=datetime.date.today() + datetime.timedelta(days=1 + 2 * i),
+            ).id
+            for i, rider in enumerate(self.riders)
+        ]
+
+        client = Client()
+        client.force_login(self.admins[0])
+        client.post(reverse('bulk_reject_bookings'), {'booking_ids': booking_ids, 'rejection_reason': 'Maintenance'})
+
+        self.assertEqual(Notification.objects.filter(recipient__in=self.riders).count(), 5)
+        self.assertTrue(Notification.objects.get(recipient=self.riders[0]).message.endswith('Reason: Maintenance'))
+
+
+class NotificationCountCacheTestCase(TestCase):
+    """
+    Test cases for the cached, lazy unread notification count
+    """
+
+    def setUp(self):
+        """Set up a rider, an admin and a clean cache"""
+        from django.core.cache import cache
+        cache.clear()
+        self.rider = User.objects.create_user(username='count_rider', password='testpass123', is_rider=True)
+        self.admin = User.objects.create_user(username='count_admin', password='testpass123', is_staff=True)
+
+    def _count(self, user=None):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from .context_processors import unread_notification_count
+
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        return unread_notification_count(request)['unread_notification_count']
+
+    def test_count_is_lazy_and_cached(self):
+        """No queries until the value is used, none on the second use"""
+        from .models import Notification
+
+        Notification.objects.create(recipient=self.rider, message='Personal')
+        Notification.objects.create(message='Announcement', is_public=True)
+
+        with self.assertNumQueries(0):
+            lazy_count = self._count(self.rider)
+        with self.assertNumQueries(2):
+            self.assertEqual(lazy_count, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._count(self.rider), 2)
+
+    def test_signals_and_bulk_dispatch_invalidate(self):
+        """Creating notifications, one by one or in bulk, refreshes the count"""
+        from .models import Notification
+        from .notifications import notify, notify_staff
+
+        self.assertEqual(self._count(self.rider), 0)
+        Notification.objects.create(recipient=self.rider, message='Personal')
+        self.assertEqual(self._count(self.rider), 1)
+        notify([self.rider], 'Bulk message')
+        self.assertEqual(self._count(self.rider), 2)
+
+        self.assertEqual(self._count(self.admin), 0)
+        notify_staff('New booking')
+        self.assertEqual(self._count(self.admin), 1)
+        self.assertEqual(self._count(self.rider), 2)
+
+        Notification.objects.create(message='Announcement', is_public=True)
+        self.assertEqual(self._count(), 1)
+
+    def test_mark_read_action_invalidates(self):
+        """Marking notifications read through the view refreshes the count"""
+        from .models import Notification
+
+        first = Notification.objects.create(recipient=self.rider, message='First')
+        Notification.objects.create(recipient=self.rider, message='Second')
+        self.assertEqual(self._count(self.rider), 2)
+
+        client = Client()
+        client.force_login(self.rider)
+        response = client.post(reverse('mark_notification_read', args=[first.id]))
+        self.assertEqual(response.json()['unread_count'], 1)
+        self.assertEqual(self._count(self.rider), 1)
+
+        client.post(reverse('mark_all_notifications_read'))
+        self.assertEqual(self._count(self.rider), 0)
+
+
+class DailyAvailabilitySyncMiddlewareTestCase(TestCase):
+    """
+    Test cases for scheduling the daily availability sync outside the request
+    """
+
+    def setUp(self):
+        """Start every test with no recorded sync, in thread mode (tests default to 'command')"""
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .middleware import DailyAvailabilitySyncMiddleware
+        cache.clear()
+        DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = None
+        self.settings_override = override_settings(AVAILABILITY_SYNC_MODE='thread')
+        self.settings_override.enable()
+
+    def tearDown(self):
+        from .middleware import DailyAvailabilitySyncMiddleware
+        self.settings_override.disable()
+        DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = None
+
+    def test_thread_mode_runs_the_sync_in_a_daemon_thread(self):
+        """The first request of the day hands the sync to a background thread and returns"""
+        from unittest import mock
+        from django.http import HttpResponse
+        from django.utils import timezone
+        from .middleware import DailyAvailabilitySyncMiddleware
+
+        today = timezone.localdate().isoformat()
+        middleware = DailyAvailabilitySyncMiddleware(lambda request: HttpResponse())
+        with mock.patch('core.middleware.threading.Thread') as thread:
+            self.assertEqual(middleware(None).status_code, 200)
+
+        thread.assert_called_once_with(
+            target=DailyAvailabilitySyncMiddleware.run_sync_in_thread,
+            args=(today, DailyAvailabilitySyncMiddleware.LOCK_KEY.format(date=today)),
+            daemon=True,
+        )
+        thread.return_value.start.assert_called_once()
+
+    def test_command_mode_never_schedules(self):
+        """With AVAILABILITY_SYNC_MODE='command' requests leave the sync to the management command"""
+        from unittest import mock
+        from django.http import HttpResponse
+        from django.test import override_settings
+        from .middleware import DailyAvailabilitySyncMiddleware
+
+        with override_settings(AVAILABILITY_SYNC_MODE='command'):
+            middleware = DailyAvailabilitySyncMiddleware(lambda request: HttpResponse())
+        with mock.patch('core.middleware.threading.Thread') as thread:
+            self.assertEqual(middleware(None).status_code, 200)
+
+        thread.assert_not_called()
+
+    def test_only_one_worker_claims_the_daily_run(self):
+        """The cache lock lets one middleware instance start the sync thread"""
+        from unittest import mock
+        from django.http import HttpResponse
+        from .middleware import DailyAvailabilitySyncMiddleware
+
+        workers = [DailyAvailabilitySyncMiddleware(lambda request: HttpResponse()) for _ in range(3)]
+        with mock.patch('core.middleware.threading.Thread') as thread:
+            for worker in workers:
+                # Simulate separate processes: no shared in-process marker
+                DailyAvailabilitySyncMiddleware._LAST_SYNC_DATE = None
+                self.assertEqual(worker(None).status_code, 200)
+
+        self.assertEqual(thread.call_count, 1)
+        thread.return_value.start.assert_called_once()
+
+    def test_run_sync_records_the_date(self):
+        """A finished run records today's date so later requests skip scheduling"""
+        from unittest import mock
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .middleware import DailyAvailabilitySyncMiddleware
+
+        today = timezone.localdate().isoformat()
+        DailyAvailabilitySyncMiddleware.run_sync(today, 'test-lock')
+        self.assertEqual(cache.get(DailyAvailabilitySyncMiddleware.CACHE_KEY), today)
+
+        with mock.patch('core.middleware.threading.Thread') as thread:
+            DailyAvailabilitySyncMiddleware(lambda request: None).schedule_sync()
+        thread.assert_not_called()
+
+    def test_async_path_uses_the_async_cache_api(self):
+        """Under ASGI the claim goes through cache.aget/aadd, not blocking calls"""
+        import asyncio
+        from unittest import mock
+        from django.http import HttpResponse
+        from .middleware import DailyAvailabilitySyncMiddleware
+
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = DailyAvailabilitySyncMiddleware(get_response)
+        # Patching threading.Thread here would also stop the event loop's own threads
+        with mock.patch.object(DailyAvailabilitySyncMiddleware, 'start_sync') as start_sync, \
+                mock.patch('core.middleware.cache') as cache:
+            cache.aget = mock.AsyncMock(return_value=None)
+            cache.aadd = mock.AsyncMock(return_value=True)
+            response = asyncio.run(middleware(None))
+
+        self.assertEqual(response.status_code, 200)
+        cache.aadd.assert_awaited_once()
+        cache.get.assert_not_called()
+        cache.add.assert_not_called()
+        start_sync.assert_called_once()
+
+
+class LazyAIClientTestCase(TestCase):
+    """
+    Test cases for the lazily initialized Gemini client in core.ai
+    """
+
+    class FakeModels:
+        def __init__(self, available, broken=()):
+            self.available = available
+            self.broken = broken
+            self.list_calls = 0
+            self.generate_calls = 0
+
+        def list(self):
+            from types import SimpleNamespace
+            self.list_calls += 1
+            return [SimpleNamespace(name=f'models/{name}') for name in self.available]
+
+        def generate_content(self, model, contents):
+            self.generate_calls += 1
+            if model in self.broken:
+                raise RuntimeError('model unavailable')
+            return None
+
+    def setUp(self):
+        from .ai import reset
+        reset()
+
+    def tearDown(self):
+        from .ai import reset
+        reset()
+
+    def test_probe_runs_once_and_is_cached(self):
+        """The first call probes, later calls read the cached model"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from django.core.cache import cache
+        from .ai import WORKING_MODEL_CACHE_KEY, get_working_model
+
+        models = self.FakeModels(['gemini-2.5-pro', 'gemini-2.5-flash'], broken=['gemini-2.5-flash'])
+        with mock.patch('core.ai.get_client', return_value=SimpleNamespace(models=models)):
+            self.assertEqual(get_working_model(), 'gemini-2.5-pro')
+            self.assertEqual(get_working_model(), 'gemini-2.5-pro')
+
+        self.assertEqual(models.list_calls, 1)
+        self.assertEqual(models.generate_calls, 2)
+        self.assertEqual(cache.get(WORKING_MODEL_CACHE_KEY), 'gemini-2.5-pro')
+
+    def test_unreachable_api_falls_back_to_default_model(self):
+        """A failed probe doesn't raise and uses the default model"""
+        from unittest import mock
+        from .ai import DEFAULT_MODEL, get_working_model
+
+        with mock.patch('core.ai.get_client', side_effect=RuntimeError('no network')):
+            self.assertEqual(get_working_model(), DEFAULT_MODEL)
+
+    def test_importing_utils_creates_no_client(self):
+        """Importing core.utils doesn't build the client or talk to the API"""
+        import importlib
+        from unittest import mock
+        from . import ai, utils
+
+        with mock.patch('core.ai.get_client') as get_client:
+            importlib.reload(utils)
+        get_client.assert_not_called()
+        self.assertIsNone(ai._client)
+
+
+class ChatbotAnswerCacheTestCase(TestCase):
+    """
+    Test cases for the chatbot answer cache in core.chat_cache
+    """
+
+    def setUp(self):
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+        self.rider = User.objects.create_user(username='chat_rider', password='testpass123', is_rider=True)
+
+    def tearDown(self):
+        from .ai import breaker
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+        breaker.reset()
+
+    def _fake_client(self, text='We are open 9 AM to 6 PM.', error=None):
+        from types import SimpleNamespace
+        from unittest import mock
+
+        generate = mock.Mock(side_effect=error, return_value=SimpleNamespace(text=text))
+        return SimpleNamespace(models=SimpleNamespace(generate_content=generate)), generate
+
+    def test_normalized_questions_share_one_answer(self):
+        """Case, punctuation and spacing variants hit the cached answer"""
+        from unittest import mock
+        from .chat_cache import answer_cache
+        from .utils import chatbot_response
+
+        client, generate = self._fake_client()
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            self.assertEqual(chatbot_response('What are your hours?'), 'We are open 9 AM to 6 PM.')
+            self.assertEqual(chatbot_response('  what ARE your hours '), 'We are open 9 AM to 6 PM.')
+            chatbot_response('What are your hours?', context='booking')
+
+        self.assertEqual(generate.call_count, 2)
+        stats = answer_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_personalized_answers_bypass_shared_tier(self):
+        """An answer generated for a user is never served to other visitors"""
+        from unittest import mock
+        from .utils import chatbot_response
+
+        client, generate = self._fake_client(text='Hi chat_rider, we open at 9.')
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            chatbot_response('What are your hours?', user=self.rider)
+            generate.return_value.text = 'We open at 9.'
+            self.assertEqual(chatbot_response('What are your hours?'), 'We open at 9.')
+            self.assertEqual(chatbot_response('What are your hours?', user=self.rider), 'Hi chat_rider, we open at 9.')
+
+        self.assertEqual(generate.call_count, 2)
+
+    def test_errors_are_not_cached(self):
+        """A failed API call returns the apology and is retried next time"""
+        from unittest import mock
+        from .utils import CHATBOT_ERROR_MESSAGE, chatbot_response
+
+        client, generate = self._fake_client(error=RuntimeError('timeout'))
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'), \
+                mock.patch('core.ai.CALL_RETRIES', 0):
+            self.assertEqual(chatbot_response('How do I cancel?'), CHATBOT_ERROR_MESSAGE)
+            chatbot_response('How do I cancel?')
+
+        self.assertEqual(generate.call_count, 2)
+
+    def test_lru_and_ttl_eviction(self):
+        """Least recently used entries go first and entries expire after the TTL"""
+        from unittest import mock
+        from .chat_cache import AnswerCache
+
+        cache = AnswerCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+        with mock.patch('core.chat_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 1)
+
+
+class ChatbotStreamTestCase(TestCase):
+    """
+    Test cases for the Server-Sent Events chatbot endpoint
+    """
+
+    def setUp(self):
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+
+    def tearDown(self):
+        from .ai import breaker
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+        breaker.reset()
+
+    async def _body(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def _stream(self):
+        from django.test import AsyncClient
+
+        response = await AsyncClient().post(
+            reverse('chatbot_stream'),
+            data='{"message": "What are your hours?"}',
+            content_type='application/json',
+        )
+        return await self._body(response)
+
+    def _streaming_client(self, texts):
+        from types import SimpleNamespace
+        from unittest import mock
+
+        async def chunks():
+            for text in texts:
+                yield SimpleNamespace(text=text)
+
+        stream = mock.AsyncMock(side_effect=lambda **kwargs: chunks())
+        return SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+            generate_content_stream=stream,
+            generate_content=mock.AsyncMock(),
+        )))
+
+    async def test_cached_opening_question_is_recorded_in_the_conversation(self):
+        """A fresh session's first question can come from the cache and still becomes its first turn"""
+        from unittest import mock
+        from .chat_cache import answer_cache, answer_cache_key
+        from .conversation import Conversation
+        from .utils import astream_chatbot_response
+
+        answer_cache.set(answer_cache_key('What are your hours?', 'general'), 'We are open 9 AM to 6 PM.')
+        conversation = Conversation()
+        with mock.patch('core.utils.get_client') as get_client:
+            chunks = [chunk async for chunk in astream_chatbot_response('What are your hours?', conversation=conversation)]
+
+        self.assertEqual(chunks, ['We are open 9 AM to 6 PM.'])
+        self.assertEqual(conversation.turns, [('What are your hours?', 'We are open 9 AM to 6 PM.')])
+        get_client.assert_not_called()
+
+    async def test_chunks_are_relayed_as_events_and_cached(self):
+        """Each generated chunk becomes one SSE message and the full answer is cached"""
+        from unittest import mock
+        from django.test import AsyncClient
+        from .chat_cache import answer_cache, answer_cache_key
+
+        client = self._streaming_client(['We are open ', '9 AM to 6 PM.'])
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            response = await AsyncClient().post(
+                reverse('chatbot_stream'),
+                data='{"message": "What are your hours?"}',
+                content_type='application/json',
+            )
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            self.assertTrue(response.is_async)
+            body = await self._body(response)
+
+        self.assertIn('data: {"text": "We are open "}', body)
+        self.assertIn('data: {"text": "9 AM to 6 PM."}', body)
+        self.assertIn('event: done', body)
+        self.assertEqual(answer_cache.get(answer_cache_key('what are your hours', 'general', None)),
+                         'We are open 9 AM to 6 PM.')
+        client.aio.models.generate_content_stream.assert_awaited_once()
+        client.aio.models.generate_content.assert_not_called()
+
+    async def test_eventsource_get_streams(self):
+        """EventSource clients stream with GET and query parameters"""
+        from unittest import mock
+        from django.test import AsyncClient
+
+        client = self._streaming_client(['Hello!'])
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            response = await AsyncClient().get(reverse('chatbot_stream'), {'message': 'Hi'})
+            body = await self._body(response)
+
+        self.assertIn('data: {"text": "Hello!"}', body)
+        self.assertIn('event: done', body)
+
+    async def test_stream_error_sends_apology(self):
+        """A failing stream ends with the apology message instead of breaking the connection"""
+        from unittest import mock
+        from .utils import CHATBOT_ERROR_MESSAGE
+
+        with mock.patch('core.utils.get_client', side_effect=RuntimeError('offline')), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            body = await self._stream()
+
+        self.assertIn(CHATBOT_ERROR_MESSAGE.split(',')[0], body)
+        self.assertIn('event: done', body)
+
+    def test_empty_message_is_rejected(self):
+        response = Client().post(reverse('chatbot_stream'), data='{"message": ""}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncAIViewsTestCase(TestCase):
+    """
+    Test cases for the async chatbot, initial question and smart search code paths
+    """
+
+    def setUp(self):
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+
+    def tearDown(self):
+        from .ai import breaker
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+        breaker.reset()
+
+    def _async_client(self, text):
+        from types import SimpleNamespace
+        from unittest import mock
+
+        generate = mock.AsyncMock(return_value=SimpleNamespace(text=text))
+        return SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate))), generate
+
+    async def test_chatbot_view_uses_async_client(self):
+        """The chatbot endpoint awaits the async SDK client"""
+        from unittest import mock
+        from django.test import AsyncClient
+
+        client, generate = self._async_client('We are open 9 AM to 6 PM.')
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            response = await AsyncClient().post(
+                reverse('chatbot'), data='{"message": "What are your hours?"}', content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'We are open 9 AM to 6 PM.')
+        generate.assert_awaited_once()
+
+    async def test_initial_questions_for_guest(self):
+        from django.test import AsyncClient
+
+        response = await AsyncClient().get(reverse('initial_questions'))
+        self.assertEqual(response.json()['user_role'], 'guest')
+
+    def test_async_recommendations_pick_mentioned_bikes(self):
+        """aget_bike_recommendations reads bikes with the async ORM and parses the answer"""
+        from asgiref.sync import async_to_sync
+        from unittest import mock
+        from .utils import aget_bike_recommendations
+
+        provider = User.objects.create_user(username='async_provider', password='testpass123', is_vehicle_provider=True)
+        bikes = [
+            EBike.objects.create(
+                name=name, description='Async test bike', price_per_day=500.00,
+                price_per_week=3000.00, provider=provider
+            )
+            for name in ('City Cruiser', 'Mountain Climber')
+        ]
+
+        answer = json.dumps({'recommendations': [{'bike_id': bikes[1].id, 'reason': 'great for hills'}]})
+        client, generate = self._async_client(answer)
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            recommendations = async_to_sync(aget_bike_recommendations)('hilly commute', EBike.objects.all())
+
+        self.assertEqual([rec['bike'].name for rec in recommendations], ['Mountain Climber'])
+
+
+class RecommendationContextQueryTestCase(TestCase):
+    """Test that the recommendation prompt is built from one annotated query"""
+
+    def setUp(self):
+        from .models import Review
+
+        self.provider = User.objects.create_user(username='stats_provider', password='testpass123', is_vehicle_provider=True)
+        self.bikes = [
+            EBike.objects.create(
+                name=f'Stats Bike {i}', description='Review stats test bike', price_per_day=500.00,
+                price_per_week=3000.00, provider=self.provider
+            )
+            for i in range(5)
+        ]
+        for rating in (4, 5):
+            Review.objects.create(ebike=self.bikes[0], name='Rider', rating=rating, message='Nice')
+
+    def test_prompt_context_uses_single_query(self):
+        """Loading bikes and building the prompt costs one query regardless of fleet size"""
+        from .utils import build_recommendation_prompt
+
+        with self.assertNumQueries(1):
+            bikes = list(EBike.objects.with_review_stats())
+            prompt = build_recommendation_prompt('city commute', bikes)
+
+        self.assertIn('Provider: stats_provider', prompt)
+        self.assertIn('Reviews: 2 reviews, 4.5 stars', prompt)
+        self.assertIn('Reviews: 0 reviews, 0.0 stars', prompt)
+
+    def test_recommendations_use_annotated_queryset(self):
+        """get_bike_recommendations issues one query before calling the model"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from .search_index import warm_index
+        from .utils import get_bike_recommendations
+
+        # The search index is built once per process; afterwards ranking reads no rows
+        warm_index()
+        client = SimpleNamespace(models=SimpleNamespace(
+            generate_content=mock.Mock(return_value=SimpleNamespace(text=json.dumps(
+                {'recommendations': [{'bike_id': self.bikes[0].id, 'reason': 'best rated'}]}
+            )))
+        ))
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'), \
+                self.assertNumQueries(1):
+            recommendations = get_bike_recommendations('city commute', EBike.objects.filter(is_available=True))
+
+        self.assertEqual([rec['bike'] for rec in recommendations], [self.bikes[0]])
+
+
+class SmartSearchIndexTestCase(TestCase):
+    """Test the local BM25 shortlist and offline fallback for smart search"""
+
+    def setUp(self):
+        from .ai import breaker
+        from .search_index import bike_index
+
+        bike_index.clear()
+        breaker.reset()
+        self.provider = User.objects.create_user(username='index_provider', password='testpass123', is_vehicle_provider=True)
+        self.climber = self._bike('Mountain Climber', 'Torque-heavy motor for steep hills and trails')
+        self.cruiser = self._bike('City Cruiser', 'Light frame for the daily city commute')
+        for i in range(20):
+            self._bike(f'Fleet Bike {i}', 'Standard rental with a comfortable seat')
+
+    def _bike(self, name, description):
+        return EBike.objects.create(
+            name=name, description=description, price_per_day=500.00,
+            price_per_week=3000.00, provider=self.provider
+        )
+
+    def test_prompt_only_contains_shortlist(self):
+        """Only the top-ranked bikes are sent to the model, matches first"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from .utils import get_bike_recommendations
+
+        answer = json.dumps({'recommendations': [{'bike_id': self.climber.id, 'reason': 'hills'}]})
+        generate = mock.Mock(return_value=SimpleNamespace(text=answer))
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate))
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'), \
+                mock.patch('core.search_index.SHORTLIST_SIZE', 3):
+            recommendations = get_bike_recommendations('steep hills', EBike.objects.all())
+
+        prompt = generate.call_args.kwargs['contents']
+        self.assertEqual(prompt.count('Bike Name:'), 3)
+        self.assertLess(prompt.index('Mountain Climber'), prompt.index('Bike Name: Fleet Bike'))
+        self.assertEqual([rec['bike'] for rec in recommendations], [self.climber])
+
+    def test_offline_ranking_when_gemini_fails(self):
+        """A model error falls back to the local ranking instead of an empty result"""
+        from unittest import mock
+        from .utils import get_bike_recommendations
+
+        with mock.patch('core.utils.get_client', side_effect=RuntimeError('offline')):
+            recommendations = get_bike_recommendations('city commute', EBike.objects.all())
+
+        self.assertEqual([rec['bike'] for rec in recommendations], [self.cruiser])
+        self.assertIn('city', recommendations[0]['explanation'])
+
+    def test_index_follows_saves_and_deletes(self):
+        """Editing or deleting a bike updates only that bike's entry"""
+        from .search_index import bike_index
+
+        bikes = list(EBike.objects.all())
+        self.assertEqual(bike_index.rank('gravel', bikes, 3, matches_only=True), [])
+
+        self.cruiser.description = 'Gravel-ready tyres'
+        self.cruiser.save()
+        ranked = bike_index.rank('gravel', list(EBike.objects.all()), 3, matches_only=True)
+        self.assertEqual([bike for bike, _, _ in ranked], [self.cruiser])
+
+        size = len(bike_index)
+        self.cruiser.delete()
+        self.assertEqual(len(bike_index), size - 1)
+
+    def test_index_is_built_once_and_ranking_only_reads_it(self):
+        """After the first build, queries tokenize nothing and local edits don't force a rebuild"""
+        from unittest import mock
+        from .search_index import BikeIndex, bike_index, warm_index
+
+        warm_index()
+        bikes = list(EBike.objects.all())
+        with mock.patch.object(BikeIndex, 'build') as build, mock.patch.object(BikeIndex, '_add') as add:
+            warm_index()
+            bike_index.rank('steep hills', bikes, 3)
+        build.assert_not_called()
+        add.assert_not_called()
+
+        self.climber.description = 'Gravel-ready tyres'
+        self.climber.save()
+        with mock.patch.object(BikeIndex, 'build') as build:
+            warm_index()
+        build.assert_not_called()
+
+    def test_changes_from_another_process_trigger_a_rebuild(self):
+        """A version bump this process didn't apply makes the next warm-up rebuild from the database"""
+        from .search_index import bike_index, publish_index_change, warm_index
+
+        warm_index()
+        # Another worker edits the bike: the row changes and the shared version moves on
+        EBike.objects.filter(pk=self.cruiser.pk).update(description='Gravel-ready tyres')
+        publish_index_change()
+        bikes = list(EBike.objects.all())
+        self.assertEqual(bike_index.rank('gravel', bikes, 3, matches_only=True), [])
+
+        warm_index()
+        ranked = bike_index.rank('gravel', bikes, 3, matches_only=True)
+        self.assertEqual([bike for bike, _, _ in ranked], [self.cruiser])
+
+
+class StructuredRecommendationTestCase(TestCase):
+    """Test that recommendations are resolved from the model's JSON by bike ID"""
+
+    def setUp(self):
+        provider = User.objects.create_user(username='json_provider', password='testpass123', is_vehicle_provider=True)
+        self.base, self.pro = [
+            EBike.objects.create(
+                name=name, description='Scooter-style e-bike', price_per_day=500.00,
+                price_per_week=3000.00, provider=provider
+            )
+            for name in ('Ola S3', 'Ola S3 Pro')
+        ]
+
+    def test_ids_resolve_overlapping_names_and_keep_reasons(self):
+        """A bike whose name contains another's is only picked when its ID is returned"""
+        from .utils import parse_recommendations
+
+        answer = json.dumps({'recommendations': [
+            {'bike_id': self.pro.id, 'reason': 'Longest range for your commute'},
+            {'bike_id': 999999, 'reason': 'Not offered'},
+            {'bike_id': self.pro.id, 'reason': 'Duplicate'},
+        ]})
+        recommendations = parse_recommendations(answer, [self.base, self.pro])
+
+        self.assertEqual(recommendations, [{'bike': self.pro, 'explanation': 'Longest range for your commute'}])
+
+    def test_schema_violations_are_rejected(self):
+        """Answers that don't match the schema raise ValueError"""
+        from .utils import parse_recommendations
+
+        for answer in ('**Ola S3 Pro**', '{"recommendations": [{"bike_id": "1", "reason": "x"}]}', '[]'):
+            with self.subTest(answer=answer), self.assertRaises(ValueError):
+                parse_recommendations(answer, [self.base, self.pro])
+
+    def test_prompt_requests_structured_output(self):
+        """The model is asked for JSON matching the schema and sees bike IDs"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from .utils import RECOMMENDATION_CONFIG, get_bike_recommendations
+
+        generate = mock.Mock(return_value=SimpleNamespace(text='{"recommendations": []}'))
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate))
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            self.assertEqual(get_bike_recommendations('scooter', EBike.objects.all()), [])
+
+        config = generate.call_args.kwargs['config']
+        self.assertEqual(config['response_json_schema'], RECOMMENDATION_CONFIG['response_json_schema'])
+        self.assertIn(f'Bike ID: {self.pro.id}', generate.call_args.kwargs['contents'])
+
+
+class AICircuitBreakerTestCase(TestCase):
+    """Test deadlines, retries and the shared circuit breaker around Gemini calls"""
+
+    def setUp(self):
+        from .ai import breaker
+        from .chat_cache import answer_cache
+        breaker.reset()
+        answer_cache.clear()
+
+    def tearDown(self):
+        from .ai import breaker
+        breaker.reset()
+
+    def test_retries_then_succeeds(self):
+        """Transient errors are retried within the budget, each attempt gets a timeout"""
+        from unittest import mock
+        from . import ai
+
+        request = mock.Mock(side_effect=[ConnectionError('reset'), 'answer'])
+        with mock.patch('core.ai.time.sleep') as sleep:
+            self.assertEqual(ai.call(request, deadline=10, retries=2), 'answer')
+
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertLessEqual(request.call_args.args[0], 10)
+        self.assertEqual(ai.breaker.metrics()['failures'], 0)
+
+    def test_client_errors_are_not_retried(self):
+        """A 4xx other than 408/429 is raised at once and doesn't count as an outage"""
+        from unittest import mock
+        from . import ai
+        from .ai_backends import BackendError
+
+        request = mock.Mock(side_effect=BackendError(400, 'bad request'))
+        with self.assertRaises(BackendError):
+            ai.call(request, retries=2)
+
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(ai.breaker.state(), 'closed')
+
+    def test_unexpected_errors_leave_the_breaker_alone(self):
+        """Only API, timeout and connection errors are retried; anything else is just raised"""
+        from unittest import mock
+        from . import ai
+
+        error = ValueError('bug in the caller')
+        error.code = 503
+        request = mock.Mock(side_effect=error)
+        for _ in range(ai.breaker.threshold):
+            with self.assertRaises(ValueError):
+                ai.call(request, retries=2)
+
+        self.assertEqual(request.call_count, ai.breaker.threshold)
+        self.assertEqual(ai.breaker.metrics()['failures'], 0)
+        self.assertEqual(ai.breaker.state(), 'closed')
+        self.assertTrue(ai.is_retryable(TimeoutError()))
+        self.assertFalse(ai.is_retryable(RuntimeError('offline')))
+
+    async def test_async_calls_use_the_async_breaker(self):
+        """acall() keeps the breaker through the cache's async API, never the blocking one"""
+        from unittest import mock
+        from . import ai
+
+        request = mock.AsyncMock(side_effect=ConnectionError('outage'))
+        blocking = AssertionError('blocking breaker call on the event loop')
+        with mock.patch.object(ai.breaker, 'allow', side_effect=blocking), \
+                mock.patch.object(ai.breaker, 'record_success', side_effect=blocking), \
+                mock.patch.object(ai.breaker, 'record_failure', side_effect=blocking):
+            for _ in range(ai.breaker.threshold):
+                with self.assertRaises(ConnectionError):
+                    await ai.acall(request, retries=0)
+            with self.assertRaises(ai.AIUnavailable):
+                await ai.acall(request)
+
+        self.assertEqual(request.call_count, ai.breaker.threshold)
+        self.assertEqual(await ai.breaker.aallow(), False)
+
+    def test_breaker_opens_serves_degraded_answers_and_recovers(self):
+        """After repeated failures calls are refused instantly until a trial call succeeds"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from django.core.cache import cache
+        from . import ai
+        from .chat_cache import answer_cache, answer_cache_key
+        from .utils import chatbot_response
+
+        generate = mock.Mock(side_effect=ConnectionError('outage'))
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate))
+        answer_cache.set(answer_cache_key('What are your hours?', 'general'), 'We are open 9 AM to 6 PM.')
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'), \
+                mock.patch('core.ai.CALL_RETRIES', 0):
+            for i in range(ai.breaker.threshold):
+                chatbot_response(f'question {i}')
+            self.assertEqual(ai.breaker.state(), 'open')
+
+            calls = generate.call_count
+            rider = User.objects.create_user(username='breaker_rider', password='testpass123', is_rider=True)
+            # The guest answer to the same question is served instead of calling Gemini
+            self.assertEqual(chatbot_response('what are your hours', user=rider), 'We are open 9 AM to 6 PM.')
+            self.assertEqual(generate.call_count, calls)
+
+            # Cooldown over: one trial call goes out and closes the breaker
+            cache.delete(ai.breaker.open_key)
+            generate.side_effect = None
+            generate.return_value = SimpleNamespace(text='Back online')
+            self.assertEqual(chatbot_response('Anything new?'), 'Back online')
+
+        metrics = ai.breaker.metrics()
+        self.assertEqual(metrics['state'], 'closed')
+        self.assertEqual((metrics['opened'], metrics['closed']), (1, 1))
+
+
+class RateLimitTestCase(TestCase):
+    """Test the cache-backed per-client limits on the AI endpoints"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _ask(self, client, ip='203.0.113.7'):
+        return client.post(
+            reverse('chatbot'), data='{"message": "Hi"}', content_type='application/json', REMOTE_ADDR=ip
+        )
+
+    def test_guest_is_throttled_with_retry_after(self):
+        """Requests over the guest limit get a 429 with Retry-After; other IPs are unaffected"""
+        from unittest import mock
+        from django.test import override_settings
+
+        with override_settings(RATE_LIMITS={'chatbot': {'guest': '2/m'}}), \
+                mock.patch('core.views.achatbot_response', new=mock.AsyncMock(return_value='Hello!')):
+            client = Client()
+            statuses = [self._ask(client).status_code for _ in range(3)]
+            throttled = self._ask(client)
+            other_ip = self._ask(client, ip='203.0.113.8')
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(throttled.status_code, 429)
+        self.assertTrue(1 <= int(throttled['Retry-After']) <= 60)
+        self.assertEqual(other_ip.status_code, 200)
+
+    def test_limits_follow_role_and_method(self):
+        """Roles get their own limits (None = unlimited) and only listed methods are counted"""
+        from unittest import mock
+        from django.test import override_settings
+
+        admin = User.objects.create_user(username='limit_admin', password='testpass123', is_staff=True)
+        rider = User.objects.create_user(username='limit_rider', password='testpass123', is_rider=True)
+        limits = {'chatbot': {'default': '1/m', 'admin': None}}
+        with override_settings(RATE_LIMITS=limits), \
+                mock.patch('core.views.achatbot_response', new=mock.AsyncMock(return_value='Hello!')):
+            client = Client()
+            client.force_login(admin)
+            self.assertEqual([self._ask(client).status_code for _ in range(3)], [200, 200, 200])
+
+            client.force_login(rider)
+            self.assertEqual([self._ask(client).status_code for _ in range(2)], [200, 429])
+
+    def test_single_cache_round_trip(self):
+        """After the first request of a period, each request costs one cache incr"""
+        from unittest import mock
+        from django.core.cache import cache
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.contrib.auth.models import AnonymousUser
+        from .ratelimit import rate_limit
+
+        view = rate_limit('chatbot')(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        view(request)
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr, \
+                mock.patch.object(cache, 'add', wraps=cache.add) as add, \
+                mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            view(request)
+
+        self.assertEqual((incr.call_count, add.call_count, get.call_count), (1, 0, 0))
+
+    def test_stream_get_requests_are_counted(self):
+        """EventSource GETs on the stream endpoint spend the same tokens as POSTs"""
+        from unittest import mock
+        from django.test import override_settings
+
+        async def chunks(*args, **kwargs):
+            yield 'Hello!'
+
+        with override_settings(RATE_LIMITS={'chatbot': {'guest': '2/m'}}), \
+                mock.patch('core.views.astream_chatbot_response', new=chunks):
+            client = Client()
+            statuses = [
+                client.get(reverse('chatbot_stream'), {'message': 'Hi'}, REMOTE_ADDR='203.0.113.7').status_code
+                for _ in range(3)
+            ]
+            post = client.post(reverse('chatbot_stream'), data='{"message": "Hi"}',
+                               content_type='application/json', REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(post.status_code, 429)
+
+    def test_client_ip_comes_from_the_configured_header(self):
+        """Behind a proxy, guests are told apart by the forwarded address the trusted proxy added"""
+        from django.test import RequestFactory, override_settings
+        from .ratelimit import client_ip
+
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7, 10.0.0.2')
+        self.assertEqual(client_ip(request), '10.0.0.1')
+        with override_settings(RATE_LIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+            self.assertEqual(client_ip(request), '10.0.0.2')
+            with override_settings(RATE_LIMIT_TRUSTED_PROXIES=2):
+                self.assertEqual(client_ip(request), '203.0.113.7')
+            self.assertEqual(client_ip(RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+
+
+class ChatbotConversationMemoryTestCase(TestCase):
+    """Test the per-session ring buffer and rolling summary for the chatbot"""
+
+    def setUp(self):
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+
+    def tearDown(self):
+        from .chat_cache import answer_cache
+        answer_cache.clear()
+
+    def _client(self, *answers):
+        from types import SimpleNamespace
+        from unittest import mock
+
+        generate = mock.Mock(side_effect=[SimpleNamespace(text=answer) for answer in answers])
+        return SimpleNamespace(models=SimpleNamespace(generate_content=generate)), generate
+
+    def test_follow_up_sees_previous_turn(self):
+        """The second question's prompt carries the first turn and bypasses the answer cache"""
+        from unittest import mock
+        from .conversation import Conversation
+        from .utils import chatbot_response
+
+        conversation = Conversation()
+        client, generate = self._client('The Revolt RV has the longest range.', 'Yes, ₹45 per day.')
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            chatbot_response('Which bike goes furthest?', conversation=conversation)
+            chatbot_response('How much is it?', conversation=conversation)
+            self.assertEqual(conversation.turns[-1], ('How much is it?', 'Yes, ₹45 per day.'))
+
+        prompt = generate.call_args.kwargs['contents']
+        self.assertIn('User: Which bike goes furthest?', prompt)
+        self.assertIn('Assistant: The Revolt RV has the longest range.', prompt)
+
+    def test_overflow_is_folded_into_summary(self):
+        """When the buffer overflows the oldest half is summarized and the prompt stays bounded"""
+        from .conversation import Conversation, fallback_summary
+
+        conversation = Conversation()
+        overflow = []
+        for i in range(5):
+            overflow = conversation.add_turn(f'question {i}', f'answer {i}', max_turns=4)
+        self.assertEqual(overflow, [('question 0', 'answer 0'), ('question 1', 'answer 1'), ('question 2', 'answer 2')])
+        self.assertEqual(len(conversation.turns), 2)
+
+        conversation.summary = fallback_summary('', overflow)
+        self.assertIn('question 2', conversation.summary)
+        self.assertEqual(Conversation.from_data(conversation.to_data()).turns, conversation.turns)
+
+    def test_summary_regenerated_through_gemini(self):
+        """chatbot_response asks the model for a new summary when turns overflow"""
+        from unittest import mock
+        from .conversation import Conversation
+        from .utils import chatbot_response
+
+        conversation = Conversation([(f'q{i}', f'a{i}') for i in range(6)])
+        client, generate = self._client('Latest answer', 'Customer wants a city bike for a week.')
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            chatbot_response('Anything else?', conversation=conversation)
+
+        self.assertEqual(conversation.summary, 'Customer wants a city bike for a week.')
+        self.assertEqual(len(conversation.turns), 3)
+        self.assertIn('User: q0', generate.call_args.kwargs['contents'])
+
+    def test_view_keeps_history_per_session(self):
+        """Consecutive chatbot requests from one browser share history; another browser starts fresh"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from django.core.cache import cache
+
+        cache.clear()
+        generate = mock.AsyncMock(return_value=SimpleNamespace(text='Hello!'))
+        client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate)))
+        with mock.patch('core.utils.get_client', return_value=client), \
+                mock.patch('core.utils.get_working_model', return_value='gemini-2.5-flash'):
+            first = Client()
+            for message in ('My name is Asha', 'What is my name?'):
+                first.post(reverse('chatbot'), data=json.dumps({'message': message}), content_type='application/json')
+            follow_up_prompt = generate.call_args.kwargs['contents']
+            Client().post(reverse('chatbot'), data='{"message": "What is my name?"}', content_type='application/json')
+            fresh_prompt = generate.call_args.kwargs['contents']
+
+        self.assertIn('User: My name is Asha', follow_up_prompt)
+        self.assertNotIn('My name is Asha', fresh_prompt)
+
+
+class AIBackendTestCase(TestCase):
+    """Test the offline AI backends selected with AI_BACKEND"""
+
+    def setUp(self):
+        from .ai import breaker, reset
+        from .chat_cache import answer_cache
+        reset()
+        breaker.reset()
+        answer_cache.clear()
+
+    def tearDown(self):
+        self.setUp()
+
+    def test_fake_backend_serves_chat_and_recommendations_offline(self):
+        """With the fake backend every AI path answers deterministically without the SDK"""
+        from unittest import mock
+        from django.test import override_settings
+        from .ai import reset
+        from .chat_cache import answer_cache
+        from .utils import chatbot_response, generate_smart_content, get_bike_recommendations
+
+        provider = User.objects.create_user(username='fake_provider', password='testpass123', is_vehicle_provider=True)
+        bike = EBike.objects.create(
+            name='Offline Bike', description='Works without network', price_per_day=500.00,
+            price_per_week=3000.00, provider=provider
+        )
+        with override_settings(AI_BACKEND='fake'), mock.patch('google.genai.Client') as sdk:
+            answer = chatbot_response('What are your hours?')
+            answer_cache.clear()
+            self.assertEqual(chatbot_response('What are your hours?'), answer)
+            recommendations = get_bike_recommendations('anything', EBike.objects.all())
+            content = generate_smart_content('support_message')
+            reset()
+
+        sdk.assert_not_called()
+        self.assertIn('fake AI backend', answer)
+        self.assertEqual([rec['bike'] for rec in recommendations], [bike])
+        self.assertIn('fake AI backend', content)
+
+    def test_fake_backend_injects_errors(self):
+        """An error rate of 1 makes every call fail with a retryable 503"""
+        from .ai_backends import BackendError, FakeClient
+
+        client = FakeClient(error_rate=1.0)
+        with self.assertRaises(BackendError) as raised:
+            client.models.generate_content(model='fake', contents='hi')
+        self.assertEqual(raised.exception.code, 503)
+
+    def test_record_then_replay_from_disk(self):
+        """Recorded responses are replayed byte for byte; unknown prompts fail like a 404"""
+        import tempfile
+        from .ai_backends import BackendError, FakeClient, RecordingClient, ReplayClient
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = RecordingClient(FakeClient(), directory)
+            config = {'response_mime_type': 'text/plain', 'http_options': {'timeout': 1000}}
+            recorded = recorder.models.generate_content(model='gemini-2.5-flash', contents='Hours?', config=config).text
+
+            replay = ReplayClient(directory)
+            # The timeout isn't part of the request key
+            replayed = replay.models.generate_content(
+                model='other', contents='Hours?', config={**config, 'http_options': {'timeout': 5}}
+            )
+            streamed = ''.join(chunk.text for chunk in replay.models.generate_content_stream(
+                model='other', contents='Hours?', config=config
+            ))
+            with self.assertRaises(BackendError) as raised:
+                replay.models.generate_content(model='other', contents='Never recorded')
+
+        self.assertEqual(replayed.text, recorded)
+        self.assertEqual(streamed, recorded)
+        self.assertEqual(raised.exception.code, 404)
+
+
+class ReceiptCacheTestCase(TestCase):
+    """Test the content-addressed on-disk cache for booking receipt PDFs"""
+
+    def setUp(self):
+        import datetime
+        import tempfile
+        from django.test import override_settings
+
+        self.media = tempfile.TemporaryDirectory()
+        self.private_media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name, PRIVATE_MEDIA_ROOT=self.private_media.name)
+        self.settings_override.enable()
+
+        self.rider = User.objects.create_user(username='receipt_rider', password='testpass123', is_rider=True)
+        provider = User.objects.create_user(username='receipt_provider', password='testpass123', is_vehicle_provider=True)
+        ebike = EBike.objects.create(
+            name='Receipt Bike', description='Receipt test bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=provider
+        )
+        start = datetime.date.today() + datetime.timedelta(days=3)
+        self.booking = Booking.objects.create(
+            rider=self.rider, ebike=ebike, start_date=start, end_date=start + datetime.timedelta(days=1),
+            total_price=500.00, status='approved', is_approved=True, is_paid=True
+        )
+        self.client = Client()
+        self.client.login(username='receipt_rider', password='testpass123')
+        self.url = reverse('download_receipt', args=[self.booking.id])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+        self.private_media.cleanup()
+
+    def test_repeat_downloads_are_served_from_disk(self):
+        """The PDF is rendered once and streamed from storage afterwards"""
+        from unittest import mock
+        from . import receipts
+
+        with mock.patch('core.receipts.render_receipt_pdf', wraps=receipts.render_receipt_pdf) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        first_body = b''.join(first.streaming_content)
+        self.assertTrue(first_body.startswith(b'%PDF'))
+        self.assertEqual(first_body, b''.join(second.streaming_content))
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        """A client holding the current ETag gets a 304 without rendering"""
+        from unittest import mock
+
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('core.receipts.render_receipt_pdf') as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+
+    def test_booking_change_invalidates_and_cleans_up(self):
+        """Editing the booking yields a new ETag and replaces the stored file"""
+        from .receipts import receipt_cache_dir
+        from .storage import private_storage
+
+        etag = self.client.get(self.url)['ETag']
+        self.booking.total_price = Decimal('650.00')
+        self.booking.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        directory = receipt_cache_dir(self.booking.id)
+        digest = response['ETag'].strip('"')
+        self.assertEqual(private_storage.listdir(directory)[1], [f'{digest}.pdf'])
+
+        self.booking.delete()
+        self.assertEqual(private_storage.listdir(directory)[1], [])
+
+    def test_cached_receipts_are_kept_out_of_public_media(self):
+        """Stored receipts live outside MEDIA_ROOT and have no URL"""
+        import os
+        from .receipts import cached_receipt
+        from .storage import private_storage
+
+        name = cached_receipt(self.booking)
+
+        self.assertTrue(private_storage.exists(name))
+        self.assertEqual(os.listdir(self.media.name), [])
+        with self.assertRaises(ValueError):
+            private_storage.url(name)
+
+    def test_replacing_an_image_file_invalidates_the_receipt(self):
+        """Overwriting the bike photo under the same name yields a new ETag and a fresh render"""
+        import os
+        from io import BytesIO
+        from unittest import mock
+        from django.core.files.base import ContentFile
+        from PIL import Image
+        from . import receipts
+
+        def png(color, size):
+            buffer = BytesIO()
+            Image.new('RGB', (size, size), color).save(buffer, format='PNG')
+            return buffer.getvalue()
+
+        ebike = self.booking.ebike
+        ebike.image.save('receipt_bike.png', ContentFile(png('red', 40)))
+        etag = self.client.get(self.url)['ETag']
+
+        path = ebike.image.path
+        with open(path, 'wb') as image_file:
+            image_file.write(png('blue', 60))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with mock.patch('core.receipts.render_receipt_pdf', wraps=receipts.render_receipt_pdf) as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(render.call_count, 1)
+
+
+class PDFRenderingTestCase(TestCase):
+    """Test the shared PDF components and the provider documents built on them"""
+
+    def setUp(self):
+        import tempfile
+        from . import pdf
+
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.addCleanup(pdf.image_cache.clear)
+        self.provider = User.objects.create_user(
+            username='pdf_provider', password='testpass123', email='pdf@example.com', is_vehicle_provider=True
+        )
+
+    def write_image(self, name, color):
+        import os
+        from PIL import Image
+
+        path = os.path.join(self.media.name, name)
+        Image.new('RGB', (400, 400), color).save(path)
+        return path
+
+    def test_images_are_decoded_once_and_reloaded_when_replaced(self):
+        """Repeat lookups share one thumbnail; a changed file is decoded again"""
+        import os
+        from . import pdf
+
+        path = self.write_image('logo.png', 'red')
+        first = pdf.image_reader(path, 50)
+        self.assertIs(pdf.image_reader(path, 50), first)
+        self.assertEqual(first.getSize(), (200, 200))
+        self.assertIsNone(pdf.image_reader(os.path.join(self.media.name, 'missing.png')))
+
+        self.write_image('logo.png', 'blue')
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+        self.assertIsNot(pdf.image_reader(path, 50), first)
+
+    def test_cached_image_is_embedded_once_per_document(self):
+        """Drawing the same cached thumbnail twice with the stock canvas stores one image"""
+        from . import pdf
+
+        logo = pdf.image_reader(self.write_image('logo.png', 'red'), 50)
+        buffer, p = pdf.start_document()
+        self.assertTrue(pdf.draw_image(p, logo, 10, 10, 50))
+        self.assertTrue(pdf.draw_image(p, logo, 100, 10, 50))
+        document = pdf.finish_document(p, buffer)
+
+        self.assertTrue(document.startswith(b'%PDF'))
+        self.assertEqual(document.count(b'/Subtype /Image'), 1)
+
+    def test_provider_documents_render(self):
+        """Statement, withdrawal slip and withdrawal receipt all produce PDFs"""
+        from vehicle_providers.documents import (
+            render_statement_pdf, render_withdrawal_receipt_pdf, render_withdrawal_slip_pdf,
+        )
+
+        withdrawal = Withdrawal.objects.create(
+            provider=self.provider, amount=Decimal('250.00'), account_holder_name='PDF Provider',
+            account_number='123456789012', bank_name='Test Bank', ifsc_code='TEST0001234',
+            status='completed', transaction_id='TXN-PDF',
+        )
+        for document in (
+            render_statement_pdf(self.provider),
+            render_withdrawal_slip_pdf(withdrawal),
+            render_withdrawal_receipt_pdf(withdrawal),
+        ):
+            self.assertTrue(document.startswith(b'%PDF'))
+
+
+class ProviderStatementTestCase(TestCase):
+    """Test full-history provider statements"""
+
+    def setUp(self):
+        import datetime
+        from django.utils import timezone
+
+        self.provider = User.objects.create_user(username='statement_provider', password='testpass123', is_vehicle_provider=True)
+        rider = User.objects.create_user(username='statement_rider', password='testpass123', is_rider=True)
+        ebike = EBike.objects.create(
+            name='Statement Bike', description='Statement test bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=self.provider
+        )
+        today = datetime.date.today()
+        Booking.objects.bulk_create([
+            Booking(rider=rider, ebike=ebike, start_date=today, end_date=today, total_price=Decimal('100.10'),
+                    status='approved', is_approved=True)
+            for _ in range(120)
+        ] + [
+            Booking(rider=rider, ebike=ebike, start_date=today, end_date=today, total_price=Decimal('50.00'))
+        ])
+        # Backdate a few approved bookings to last year
+        old = Booking.objects.filter(is_approved=True).values_list('pk', flat=True)[:20]
+        Booking.objects.filter(pk__in=list(old)).update(created_at=timezone.now() - datetime.timedelta(days=365))
+
+    def test_statement_lists_every_booking_across_pages(self):
+        """All bookings are listed, not just the latest ten, on as many pages as needed"""
+        from io import BytesIO
+        from unittest import mock
+        from vehicle_providers.documents import write_statement_pdf
+
+        output = BytesIO()
+        with mock.patch('vehicle_providers.documents.STATEMENT_CHUNK_SIZE', 25):
+            count = write_statement_pdf(self.provider, output)
+
+        self.assertEqual(count, 121)
+        self.assertGreater(output.getvalue().count(b'/Type /Page\n'), 2)
+
+    def test_totals_are_summed_by_the_database_for_the_period(self):
+        """Totals cover only the requested dates and stay exact decimals"""
+        import datetime
+        from vehicle_providers.documents import statement_totals
+
+        totals = statement_totals(self.provider)
+        self.assertEqual(totals['total_bookings'], 121)
+        self.assertEqual(totals['completed_bookings'], 120)
+        self.assertEqual(totals['total_earnings'], Decimal('12012.00'))
+        self.assertEqual(totals['net_profit'], Decimal('10810.80'))
+
+        recent = statement_totals(self.provider, start=datetime.date.today() - datetime.timedelta(days=30))
+        self.assertEqual(recent['total_bookings'], 101)
+        self.assertEqual(recent['total_earnings'], Decimal('10010.00'))
+
+    def test_statement_period_validation(self):
+        """Malformed or backwards date ranges are rejected with a readable message"""
+        import datetime
+        from vehicle_providers.documents import statement_period
+
+        self.assertEqual(statement_period('', None), (None, None))
+        self.assertEqual(statement_period('2024-01-01', '2024-12-31'),
+                         (datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)))
+        for start, end in (('2024-02-30', ''), ('yesterday', ''), ('2024-12-31', '2024-01-01')):
+            with self.assertRaises(ValueError):
+                statement_period(start, end)
+
+    def test_download_view_serves_statement_for_a_range(self):
+        """The statement downloads as a PDF for a date range; a bad range redirects back"""
+        client = Client()
+        client.login(username='statement_provider', password='testpass123')
+
+        response = client.get(reverse('download_statement'), {'start': '2024-01-01'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+        self.assertRedirects(client.get(reverse('download_statement'), {'start': 'yesterday'}),
+                             reverse('vehicle_provider_dashboard'), fetch_redirect_response=False)
+
+    def test_download_view_serves_withdrawal_slip(self):
+        """The withdrawal slip downloads as a PDF for any of the provider's withdrawals"""
+        client = Client()
+        client.login(username='statement_provider', password='testpass123')
+        withdrawal = Withdrawal.objects.create(
+            provider=self.provider, amount=Decimal('250.00'), account_holder_name='Statement Provider',
+            account_number='123456789012', bank_name='Test Bank', ifsc_code='TEST0001234',
+        )
+        response = client.get(reverse('download_withdrawal_slip', args=[withdrawal.pk]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class StatementJobTestCase(TestCase):
+    """Test background statement jobs: queueing, dedupe, the worker and polling"""
+
+    def setUp(self):
+        import datetime
+        import tempfile
+        from django.test import override_settings
+
+        self.media = tempfile.TemporaryDirectory()
+        self.private_media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name, PRIVATE_MEDIA_ROOT=self.private_media.name)
+        self.settings_override.enable()
+
+        self.provider = User.objects.create_user(username='job_provider', password='testpass123', is_vehicle_provider=True)
+        rider = User.objects.create_user(username='job_rider', password='testpass123', is_rider=True)
+        ebike = EBike.objects.create(
+            name='Job Bike', description='Statement job bike', price_per_day=500.00,
+            price_per_week=3000.00, provider=self.provider
+        )
+        today = datetime.date.today()
+        Booking.objects.bulk_create([
+            Booking(rider=rider, ebike=ebike, start_date=today, end_date=today, total_price=Decimal('100.00'),
+                    status='approved', is_approved=True)
+            for _ in range(30)
+        ])
+        self.client = Client()
+        self.client.login(username='job_provider', password='testpass123')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+        self.private_media.cleanup()
+
+    def test_identical_in_flight_jobs_are_deduplicated(self):
+        """Queueing the same statement twice returns the job already in flight"""
+        import datetime
+        from vehicle_providers.statement_jobs import enqueue_statement
+
+        job, created = enqueue_statement(self.provider)
+        again, created_again = enqueue_statement(self.provider)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(job.pk, again.pk)
+
+        other, created_other = enqueue_statement(self.provider, start=datetime.date(2024, 1, 1))
+        self.assertTrue(created_other)
+        self.assertNotEqual(other.pk, job.pk)
+
+    def test_worker_renders_job_and_status_hands_back_download(self):
+        """The worker stores the PDF, and polling reports progress then the download URL"""
+        from io import StringIO
+        from django.core.management import call_command
+        from vehicle_providers.statement_jobs import enqueue_statement
+
+        job, _ = enqueue_statement(self.provider)
+        status_url = reverse('statement_job_status', args=[job.pk])
+        queued = self.client.get(status_url).json()
+        self.assertEqual((queued['status'], queued['progress']), ('queued', 0))
+        self.assertNotIn('download_url', queued)
+
+        call_command('process_statement_jobs', stdout=StringIO())
+
+        done = self.client.get(status_url).json()
+        self.assertEqual((done['status'], done['progress'], done['total_bookings']), ('done', 100, 30))
+        response = self.client.get(done['download_url'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        response.close()
+
+        # A finished job no longer blocks a fresh one for the same range
+        self.assertTrue(enqueue_statement(self.provider)[1])
+
+    def test_jobs_are_private_to_their_provider(self):
+        """Other users can neither poll nor download someone else's statement"""
+        from vehicle_providers.statement_jobs import enqueue_statement, process_statement_jobs
+
+        job, _ = enqueue_statement(self.provider)
+        process_statement_jobs()
+        User.objects.create_user(username='other_provider', password='testpass123', is_vehicle_provider=True)
+        other = Client()
+        other.login(username='other_provider', password='testpass123')
+
+        self.assertEqual(other.get(reverse('statement_job_status', args=[job.pk])).status_code, 404)
+        self.assertEqual(other.get(reverse('download_statement_job', args=[job.pk])).status_code, 404)
+
+    def test_worker_that_lost_its_claim_discards_the_render(self):
+        """A job reclaimed by another worker isn't overwritten by the worker that overran"""
+        import os
+        from datetime import timedelta
+        from django.utils import timezone
+        from core.models import StatementJob
+        from vehicle_providers.statement_jobs import claim_statement_jobs, enqueue_statement, run_statement_job
+
+        enqueue_statement(self.provider)
+        [job] = claim_statement_jobs()
+        StatementJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() + timedelta(seconds=1))
+
+        self.assertEqual(run_statement_job(job), 'lost')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.file.name), ('running', ''))
+        self.assertEqual(os.listdir(os.path.join(self.private_media.name, 'statements', f'provider_{self.provider.pk}')), [])
+
+    def test_finished_jobs_expire_with_their_files(self):
+        """The worker deletes finished jobs and their files once the retention period has passed"""
+        import os
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from core.models import StatementJob
+        from vehicle_providers.statement_jobs import JOB_RETENTION, enqueue_statement, process_statement_jobs
+
+        old, _ = enqueue_statement(self.provider)
+        process_statement_jobs()
+        old.refresh_from_db()
+        path = old.file.path
+        StatementJob.objects.filter(pk=old.pk).update(finished_at=timezone.now() - JOB_RETENTION - timedelta(minutes=1))
+        recent, _ = enqueue_statement(self.provider)
+
+        call_command('process_statement_jobs', stdout=StringIO())
+
+        self.assertFalse(StatementJob.objects.filter(pk=old.pk).exists())
+        self.assertFalse(os.path.exists(path))
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'done')
+        self.assertTrue(os.path.exists(recent.file.path))
+
+    def test_statement_files_are_kept_out_of_public_media(self):
+        """Rendered statements live outside MEDIA_ROOT under random names, with no URL"""
+        import os
+        from vehicle_providers.statement_jobs import enqueue_statement, process_statement_jobs
+
+        first, _ = enqueue_statement(self.provider)
+        process_statement_jobs()
+        first.refresh_from_db()
+        path = first.file.path
+
+        self.assertTrue(path.startswith(os.path.realpath(self.private_media.name) + os.sep))
+        self.assertEqual(os.listdir(self.media.name), [])
+        self.assertRegex(os.path.basename(path), r'^[0-9a-f]{32}\.pdf$')
+        with self.assertRaises(ValueError):
+            first.file.url
+
+    def test_statement_endpoints_require_the_provider_role(self):
+        """Riders can neither queue, poll nor download statements"""
+        from core.models import StatementJob
+        from vehicle_providers.statement_jobs import enqueue_statement
+
+        job, _ = enqueue_statement(self.provider)
+        User.objects.create_user(username='job_rider_only', password='testpass123', is_rider=True)
+        rider = Client()
+        rider.login(username='job_rider_only', password='testpass123')
+
+        self.assertEqual(rider.get(reverse('download_statement'), {'mode': 'async'}).status_code, 403)
+        self.assertEqual(rider.get(reverse('statement_job_status', args=[job.pk])).status_code, 403)
+        self.assertEqual(rider.get(reverse('download_statement_job', args=[job.pk])).status_code, 302)
+        self.assertEqual(rider.get(reverse('download_statement')).status_code, 302)
+        self.assertEqual(StatementJob.objects.count(), 1)
@@ -14,6 +14,8 @@ urlpatterns = [
     path('favorites/toggle/<int:ebike_id>/', views.toggle_favorite, name='toggle_favorite'),
     path('submit-review/', views.submit_review, name='submit_review'),
     path('profile/update/', views.profile_update, name='profile_update'),
+    path('notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     # Password Reset URLs
     path('password-reset/', views.password_reset_request, name='password_reset_request'),
     path('password-reset/done/', views.password_reset_done, name='password_reset_done'),
@@ -22,6 +24,7 @@ urlpatterns = [
 
     # AI Features
     path('chatbot/', views.chatbot_view, name='chatbot'),
+    path('chatbot/stream/', views.chatbot_stream_view, name='chatbot_stream'),
     path('chatbot/initial-questions/', views.get_initial_questions, name='initial_questions'),
     path('smart-search/', views.smart_search, name='smart_search'),
 ]
@@ -1,153 +1,73 @@
+import json
 import os
-from google import genai
 from django.conf import settings
-from django.utils import timezone
-from django.db import transaction, models
+from django.db import transaction
 import logging
 
+from asgiref.sync import sync_to_async
+
+from core import ai
+from core.ai import get_client, get_working_model
+from core.chat_cache import answer_cache, answer_cache_key
+from core.conversation import MAX_SUMMARY_CHARS, fallback_summary
 from core.models import EBike, Booking
+from core.search_index import awarm_index, offline_recommendations, shortlist_bikes, warm_index
 
 logger = logging.getLogger(__name__)
 
-# 🔧 Initialize Gemini AI with NEW SDK
-# The client automatically gets the API key from GEMINI_API_KEY environment variable
-client = genai.Client()
-
-# Find working model - NEW SDK approach
-working_model = None
-
-try:
-    # List available models with new SDK
-    models_list = client.models.list()
-    available_models = [model.name for model in models_list]
-
-    logger.info(f"API Key supports these models: {available_models}")
-
-    # Preferred models in order of preference (gemini-2.5-flash is the latest flagship!)
-    preferred_models = ['gemini-2.5-flash', 'gemini-2.5-pro', 'gemini-2.5-flash-lite', 'gemini-pro']
-
-    # Clean model names (API returns "models/gemini-..." but we need just "gemini-...")
-    clean_available_models = [model.replace('models/', '') for model in available_models]
-
-    # Find intersection
-    supported_models = [model for model in preferred_models if model in clean_available_models]
-
-    if supported_models:
-        for model_name in supported_models:
-            try:
-                # Test with new SDK method
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents="test"
-                )
-                working_model = model_name
-                logger.info(f"✅ Successfully connected with NEW SDK - Model: {working_model}")
-                break
-            except Exception as e:
-                logger.warning(f"Model {model_name} failed: {e}")
-                continue
-    else:
-        logger.error("None of the preferred models are available!")
-        logger.error(f"Available models: {available_models}")
-
-except Exception as e:
-    logger.warning(f"Could not connect to Gemini API: {e}")
-    logger.error("🚨 GEMINI API UNAVAILABLE!")
-    logger.error("   1. Check your GEMINI_API_KEY in .env")
-    logger.error("   2. Ensure it's from: https://makersuite.google.com/app/apikey")
-    logger.error("   3. Restart your Django server")
-
-# Note: We'll use the client directly in the functions below instead of a global model
+# The Gemini client and working model are resolved lazily on first use (see core.ai),
+# so importing this module makes no network calls.
+
+
+def occupied_bike_ids(now=None):
+    """Return a queryset of the IDs of bikes that have an active booking right now.
+
+    Uses ``Booking.objects.occupying()``, a single range predicate over the
+    indexed ``start_at``/``end_at`` columns, and yields a ``SELECT DISTINCT
+    ebike_id`` that can be used directly as a subquery.
+    """
+    return Booking.objects.occupying(now).order_by().values_list('ebike_id', flat=True).distinct()
 
 
 def sync_bike_availability() -> int:
     """Recompute EBike.is_available based on current date AND time (real-time updates).
 
-    This function now handles expired bookings by checking both date and time
-    to ensure bikes become available immediately when bookings expire.
+    The set of occupied bikes is computed in one aggregated query and availability
+    is flipped with two bulk ``UPDATE ... WHERE id IN (...)`` statements, so the
+    cost no longer grows with one query and one save per bike.
 
     Returns the number of bikes whose availability was updated.
     """
-    now = timezone.now()
-    today = now.date()
-    current_time = now.time()
-    updated = 0
+    occupied = occupied_bike_ids()
 
     with transaction.atomic():
-        for bike in EBike.objects.all():
-            # Check for bookings that are still active
-            # A booking is active if:
-            # 1. It's approved, paid, not rejected AND
-            # 2. Current datetime is between start_datetime and end_datetime
-            has_active_booking = Booking.objects.filter(
-                ebike=bike,
-                status='approved',
-                is_rejected=False,
-                is_paid=True,
-            ).filter(
-                # Booking starts before now AND ends after now
-                models.Q(
-                    # Multi-day booking spanning across current date
-                    start_date__lt=today,
-                    end_date__gt=today
-                ) | models.Q(
-                    # Started earlier today and hasn't ended yet
-                    start_date=today,
-                    start_time__lte=current_time,
-                    end_date__gt=today
-                ) | models.Q(
-                    # Started and ends today, current time is between start and end
-                    start_date=today,
-                    end_date=today,
-                    start_time__lte=current_time,
-                    end_time__gt=current_time
-                ) | models.Q(
-                    # Starts later today
-                    start_date=today,
-                    start_time__gt=current_time,
-                    end_date__gt=today
-                ) | models.Q(
-                    # Ends today, hasn't started yet (for same-day bookings)
-                    start_date=today,
-                    end_date=today,
-                    start_time__gt=current_time
-                )
-            ).exists()
-
-            new_available = not has_active_booking
-
-            if bike.is_available != new_available:
-                bike.is_available = new_available
-                bike.save(update_fields=["is_available"])
-                updated += 1
-
-    return updated
+        # Bikes with an active booking that are still marked as available
+        now_booked = EBike.objects.filter(id__in=occupied, is_available=True).update(is_available=False)
+        # Bikes whose bookings have expired (or never existed) that are still marked as booked
+        now_free = EBike.objects.filter(is_available=False).exclude(id__in=occupied).update(is_available=True)
 
+    return now_booked + now_free
 
-def get_bike_recommendations(user_query, available_bikes, user=None):
+
+def build_recommendation_prompt(user_query, available_bikes):
     """
-    Use Gemini AI to recommend bikes based on user query and available bikes.
+    Build the Gemini prompt describing the available bikes and the user's query.
 
     Args:
         user_query: User's requirements (e.g., "fast bike for city commute")
-        available_bikes: QuerySet of available EBike objects
-        user: User object (optional, for personalization)
+        available_bikes: Iterable of EBike objects from ``EBike.objects.with_review_stats()``
 
     Returns:
-        List of recommended bikes with explanations
+        Prompt string
     """
-    if not available_bikes:
-        return []
-
     # Build bike information
     bikes_data = []
     for bike in available_bikes:
-        review_count = bike.reviews.count()
-        avg_rating = 0
-        if review_count > 0:
-            avg_rating = sum(review.rating for review in bike.reviews.all()) / review_count
+        review_count = bike.review_count
+        avg_rating = bike.avg_rating or 0
 
         bike_info = f"""
+        Bike ID: {bike.id}
         Bike Name: {bike.name}
         Description: {bike.description[:200]}...
         Daily Rate: ₹{bike.price_per_day}
@@ -172,54 +92,191 @@ def get_bike_recommendations(user_query, available_bikes, user=None):
     2. Recommend 1-3 best matching bikes from the available options
     3. For each recommendation, explain why it's a good match
     4. Consider factors like speed, battery life, comfort, terrain, distance, budget
-    5. Keep responses helpful and conversational
+    5. Keep each reason to one or two friendly sentences
 
-    Format your response as:
-    **Recommended E-Bikes:**
+    Respond with JSON only: a "recommendations" list, best match first, where
+    each item has the "bike_id" of a bike listed above and the "reason" it suits
+    the user.
+    """
+    return context
+
+
+# Requested from Gemini as structured output and checked again on the way in
+RECOMMENDATION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'recommendations': {
+            'type': 'array',
+            'maxItems': 3,
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'bike_id': {'type': 'integer'},
+                    'reason': {'type': 'string'},
+                },
+                'required': ['bike_id', 'reason'],
+            },
+        },
+    },
+    'required': ['recommendations'],
+}
+
+RECOMMENDATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_json_schema': RECOMMENDATION_SCHEMA,
+}
+
+
+def validate_recommendations(data):
+    """
+    Check a decoded model answer against RECOMMENDATION_SCHEMA.
 
-    1. **Bike Name** - ₹Price/day
-       Why this bike: [brief explanation]
+    Returns:
+        List of (bike_id, reason) pairs
 
-    2. **Bike Name** - ₹Price/day
-       Why this bike: [brief explanation]
+    Raises:
+        ValueError: If the answer doesn't match the schema
+    """
+    items = data.get('recommendations') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValueError("Expected an object with a 'recommendations' list")
+
+    pairs = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"Recommendation is not an object: {item!r}")
+        bike_id, reason = item.get('bike_id'), item.get('reason')
+        # bool is an int subclass, but True is not a bike ID
+        if not isinstance(bike_id, int) or isinstance(bike_id, bool) or not isinstance(reason, str):
+            raise ValueError(f"Recommendation needs an integer bike_id and a string reason: {item!r}")
+        pairs.append((bike_id, reason.strip()))
+    return pairs
+
+
+def parse_recommendations(response_text, available_bikes):
     """
+    Resolve the model's JSON answer to bikes (top 3).
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",  # Use the actual working model here
-            contents=context
-        )
+    Bike IDs are looked up in a dict, so parsing cost doesn't depend on fleet
+    size or how long the answer is. IDs that weren't offered are ignored.
 
-        # Extract bike recommendations from response
-        recommendations = []
-        response_text = response.text
+    Raises:
+        ValueError: If the answer isn't valid JSON matching RECOMMENDATION_SCHEMA
+    """
+    bikes_by_id = {bike.id: bike for bike in available_bikes}
+    recommendations = []
+    seen = set()
+
+    for bike_id, reason in validate_recommendations(json.loads(response_text)):
+        bike = bikes_by_id.get(bike_id)
+        if bike is None or bike_id in seen:
+            continue
+        seen.add(bike_id)
+        recommendations.append({
+            'bike': bike,
+            'explanation': reason or 'AI-powered recommendation based on your requirements'
+        })
+
+    return recommendations[:3]  # Return top 3 recommendations
 
-        # Simple parsing to extract bike names from response
-        for bike in available_bikes:
-            if bike.name.lower() in response_text.lower():
-                recommendations.append({
-                    'bike': bike,
-                    'explanation': 'AI-powered recommendation based on your requirements'
-                })
 
-        return recommendations[:3]  # Return top 3 recommendations
+def get_bike_recommendations(user_query, available_bikes, user=None):
+    """
+    Use Gemini AI to recommend bikes based on user query and available bikes.
+
+    Args:
+        user_query: User's requirements (e.g., "fast bike for city commute")
+        available_bikes: QuerySet of available EBike objects
+        user: User object (optional, for personalization)
+
+    Returns:
+        List of recommended bikes with explanations
+
+    Only the bikes the local search index ranks highest for the query go into
+    the prompt; if Gemini fails, that ranking is returned instead.
+    """
+    # One query loads the bikes, their providers and review statistics
+    available_bikes = list(available_bikes.with_review_stats())
+    if not available_bikes:
+        return []
+
+    warm_index()
+    candidates = shortlist_bikes(user_query, available_bikes)
+    try:
+        prompt = build_recommendation_prompt(user_query, candidates)
+        response = ai.call(lambda timeout: get_client().models.generate_content(
+            model=get_working_model(),
+            contents=prompt,
+            config=ai.request_config(RECOMMENDATION_CONFIG, timeout)
+        ))
+        return parse_recommendations(response.text, candidates)
+
+    except ai.AIUnavailable:
+        return offline_recommendations(user_query, available_bikes)
 
     except Exception as e:
         logger.error(f"Error getting bike recommendations: {str(e)}")
+        return offline_recommendations(user_query, available_bikes)
+
+
+async def aget_bike_recommendations(user_query, available_bikes, user=None):
+    """
+    Async version of get_bike_recommendations for ASGI views.
+
+    The bikes are loaded with the async ORM and the model is called through the
+    SDK's async client, so no worker thread waits on Gemini.
+    """
+    available_bikes = [bike async for bike in available_bikes.with_review_stats()]
+    if not available_bikes:
         return []
 
+    await awarm_index()
+    candidates = shortlist_bikes(user_query, available_bikes)
+    try:
+        # Review statistics are annotated, so building the prompt touches no database
+        prompt = build_recommendation_prompt(user_query, candidates)
+        model = await sync_to_async(get_working_model, thread_sensitive=False)()
+        response = await ai.acall(lambda timeout: get_client().aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=ai.request_config(RECOMMENDATION_CONFIG, timeout)
+        ))
+        return parse_recommendations(response.text, candidates)
+
+    except ai.AIUnavailable:
+        return offline_recommendations(user_query, available_bikes)
 
-def chatbot_response(user_message, user=None, context="general"):
+    except Exception as e:
+        logger.error(f"Error getting bike recommendations: {str(e)}")
+        return offline_recommendations(user_query, available_bikes)
+
+
+CHATBOT_ERROR_MESSAGE = "I'm sorry, I'm having trouble connecting to my AI brain right now. Please try again or contact our support team for immediate assistance."
+
+
+def degraded_chatbot_answer(user_message, context="general"):
     """
-    Generate intelligent responses using Gemini AI for customer service.
+    Answer without calling Gemini, for when the circuit breaker is open.
+
+    Serves the answer cached for guests asking the same question if there is
+    one, otherwise the apology message.
+    """
+    shared_answer = answer_cache.get(answer_cache_key(user_message, context))
+    return shared_answer if shared_answer is not None else CHATBOT_ERROR_MESSAGE
+
+
+def build_chatbot_prompt(user_message, user=None, context="general", conversation=None):
+    """
+    Build the full Gemini prompt for a chatbot message.
 
     Args:
         user_message: User's question or message
         user: User object (optional, for personalization)
         context: Context like "booking", "support", "general"
+        conversation: core.conversation.Conversation with the chat so far (optional)
 
     Returns:
-        AI-generated response string
+        Prompt string
     """
     # Get system context based on the context parameter
     system_contexts = {
@@ -312,6 +369,8 @@ def chatbot_response(user_message, user=None, context="general"):
 
     {user_context}
 
+    {conversation.prompt_block() if conversation else ''}
+
     IMPORTANT: Answer ANY question about our e-bike rental service with accurate information from the above details. Be helpful, knowledgeable, and encouraging about electric bike rentals.
 
     User Question: "{user_message}"
@@ -326,16 +385,204 @@ def chatbot_response(user_message, user=None, context="general"):
     - Include relevant next steps or contact information when appropriate
     - Never refuse to answer - use the information provided
     """
+    return chat_context
 
+
+def build_summary_prompt(summary, turns):
+    """Prompt asking Gemini to fold older chat turns into the rolling summary."""
+    transcript = "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+    return f"""
+    Summarize this customer's chat with the AIS E-Bike Rental assistant in at most
+    three sentences. Keep every detail the customer gave (dates, bikes, budget,
+    problems, decisions) and drop greetings and small talk.
+
+    Summary so far: {summary or "(none)"}
+
+    Newer messages:
+    {transcript}
+    """
+
+
+def summarize_conversation(summary, turns):
+    """
+    Return a new rolling summary covering ``summary`` and ``turns``.
+
+    Falls back to a plain list of the questions asked if Gemini is unavailable.
+    """
     try:
-        response = client.models.generate_content(
-            model=working_model or "gemini-2.5-flash",
-            contents=chat_context
-        )
-        return response.text.strip()
+        response = ai.call(lambda timeout: get_client().models.generate_content(
+            model=get_working_model(),
+            contents=build_summary_prompt(summary, turns),
+            config=ai.request_config(None, timeout)
+        ))
+        return response.text.strip()[:MAX_SUMMARY_CHARS] or fallback_summary(summary, turns)
+    except Exception as e:
+        logger.warning(f"Could not summarize conversation: {str(e)}")
+        return fallback_summary(summary, turns)
+
+
+async def asummarize_conversation(summary, turns):
+    """Async version of summarize_conversation."""
+    try:
+        model = await sync_to_async(get_working_model, thread_sensitive=False)()
+        response = await ai.acall(lambda timeout: get_client().aio.models.generate_content(
+            model=model,
+            contents=build_summary_prompt(summary, turns),
+            config=ai.request_config(None, timeout)
+        ))
+        return response.text.strip()[:MAX_SUMMARY_CHARS] or fallback_summary(summary, turns)
+    except Exception as e:
+        logger.warning(f"Could not summarize conversation: {str(e)}")
+        return fallback_summary(summary, turns)
+
+
+def chatbot_response(user_message, user=None, context="general", conversation=None):
+    """
+    Generate intelligent responses using Gemini AI for customer service.
+
+    Answers are cached by normalized question, context and role (see
+    core.chat_cache); answers for a logged-in user are cached for that user only.
+
+    Args:
+        user_message: User's question or message
+        user: User object (optional, for personalization)
+        context: Context like "booking", "support", "general"
+        conversation: core.conversation.Conversation for this session (optional);
+            the new turn is added to it, and the caller saves it
+
+    Returns:
+        AI-generated response string
+    """
+    # A follow-up depends on what was said before, so only opening questions are cached
+    cache_key = None if conversation else answer_cache_key(user_message, context, user)
+    answer = answer_cache.get(cache_key) if cache_key else None
+
+    if answer is None:
+        try:
+            prompt = build_chatbot_prompt(user_message, user, context, conversation)
+            response = ai.call(lambda timeout: get_client().models.generate_content(
+                model=get_working_model(),
+                contents=prompt,
+                config=ai.request_config(None, timeout)
+            ))
+            answer = response.text.strip()
+        except ai.AIUnavailable:
+            return degraded_chatbot_answer(user_message, context)
+        except Exception as e:
+            logger.error(f"Error generating chatbot response: {str(e)}")
+            return degraded_chatbot_answer(user_message, context)
+
+        # Error replies are never cached, so the next request retries the API
+        if cache_key:
+            answer_cache.set(cache_key, answer)
+
+    if conversation is not None:
+        overflow = conversation.add_turn(user_message, answer)
+        if overflow:
+            conversation.summary = summarize_conversation(conversation.summary, overflow)
+    return answer
+
+
+async def achatbot_response(user_message, user=None, context="general", conversation=None):
+    """
+    Async version of chatbot_response using the SDK's async client.
+
+    Shares the answer cache with chatbot_response.
+    """
+    cache_key = None if conversation else answer_cache_key(user_message, context, user)
+    answer = answer_cache.get(cache_key) if cache_key else None
+
+    if answer is None:
+        try:
+            prompt = build_chatbot_prompt(user_message, user, context, conversation)
+            model = await sync_to_async(get_working_model, thread_sensitive=False)()
+            response = await ai.acall(lambda timeout: get_client().aio.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=ai.request_config(None, timeout)
+            ))
+            answer = response.text.strip()
+        except ai.AIUnavailable:
+            return degraded_chatbot_answer(user_message, context)
+        except Exception as e:
+            logger.error(f"Error generating chatbot response: {str(e)}")
+            return degraded_chatbot_answer(user_message, context)
+
+        if cache_key:
+            answer_cache.set(cache_key, answer)
+
+    if conversation is not None:
+        overflow = conversation.add_turn(user_message, answer)
+        if overflow:
+            conversation.summary = await asummarize_conversation(conversation.summary, overflow)
+    return answer
+
+
+async def astream_chatbot_response(user_message, user=None, context="general", conversation=None):
+    """
+    Stream a chatbot answer as it is generated.
+
+    Async generator over the SDK's async streaming generation, so a streaming
+    view holds no worker thread while Gemini answers. A cached answer is
+    yielded as a single chunk; a fully streamed answer is added to the cache.
+    If the stream fails, the apology message is yielded instead (or appended
+    if part of the answer was already sent). A completed answer is added to
+    ``conversation`` like in chatbot_response.
+    """
+    # An empty conversation is falsy, so an opening question can be served from the
+    # cache and still has to be recorded as the session's first turn
+    cache_key = None if conversation else answer_cache_key(user_message, context, user)
+    cached_answer = answer_cache.get(cache_key) if cache_key else None
+    if cached_answer is not None:
+        yield cached_answer
+        if conversation is not None:
+            overflow = conversation.add_turn(user_message, cached_answer)
+            if overflow:
+                conversation.summary = await asummarize_conversation(conversation.summary, overflow)
+        return
+
+    chunks = []
+    try:
+        prompt = build_chatbot_prompt(user_message, user, context, conversation)
+        model = await sync_to_async(get_working_model, thread_sensitive=False)()
+
+        async def open_stream(timeout):
+            # The SDK sends the request when the first chunk is awaited, so that is what gets retried
+            stream = aiter(await get_client().aio.models.generate_content_stream(
+                model=model,
+                contents=prompt,
+                config=ai.request_config(None, timeout)
+            ))
+            return await anext(stream, None), stream
+
+        first, stream = await ai.acall(open_stream)
+        if first is not None and first.text:
+            chunks.append(first.text)
+            yield first.text
+        async for chunk in stream:
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+    except ai.AIUnavailable:
+        yield degraded_chatbot_answer(user_message, context)
+        return
     except Exception as e:
-        logger.error(f"Error generating chatbot response: {str(e)}")
-        return "I'm sorry, I'm having trouble connecting to my AI brain right now. Please try again or contact our support team for immediate assistance."
+        logger.error(f"Error streaming chatbot response: {str(e)}")
+        if chunks and ai.is_retryable(e):
+            # Gemini broke off mid-answer, after ai.acall() had already counted a success
+            await ai.breaker.arecord_failure()
+        yield ("\n\n" if chunks else "") + CHATBOT_ERROR_MESSAGE
+        return
+
+    answer = ''.join(chunks).strip()
+    if not answer:
+        return
+    if cache_key:
+        answer_cache.set(cache_key, answer)
+    if conversation is not None:
+        overflow = conversation.add_turn(user_message, answer)
+        if overflow:
+            conversation.summary = await asummarize_conversation(conversation.summary, overflow)
 
 
 def generate_role_based_questions(user):
@@ -431,11 +678,14 @@ def generate_smart_content(content_type, context_data=None):
     prompt = prompts.get(content_type, "Generate engaging content for AIS E-Bike Rental.")
 
     try:
-        response = client.models.generate_content(
-            model=working_model or "gemini-2.5-flash",
-            contents=prompt
-        )
+        response = ai.call(lambda timeout: get_client().models.generate_content(
+            model=get_working_model(),
+            contents=prompt,
+            config=ai.request_config(None, timeout)
+        ))
         return response.text.strip()
+    except ai.AIUnavailable:
+        return "Content generation temporarily unavailable."
     except Exception as e:
         logger.error(f"Error generating smart content: {str(e)}")
         return "Content generation temporarily unavailable."
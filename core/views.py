@@ -11,7 +11,7 @@ from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import url_has_allowed_host_and_scheme, urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 <<<<<<< HEAD
 from django.utils import timezone
@@ -21,13 +21,20 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_protect, csrf_exempt
+from django.views.decorators.http import require_POST
 from django.template.loader import render_to_string
 
 # Local imports
+from .mail import queue_email
+from .notifications import mark_notifications_read, user_unread_count
 <<<<<<< HEAD
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from .conversation import aload_conversation, asave_conversation
+from .ratelimit import rate_limit
 from .models import EBike, User, Review, Testimonial, ContactMessage, Favorite
 from .forms import SignUpForm, ProfileUpdateForm, CustomPasswordResetForm, PasswordResetConfirmForm, ReviewForm
-from .utils import chatbot_response, get_bike_recommendations, generate_role_based_questions
+from .utils import achatbot_response, aget_bike_recommendations, astream_chatbot_response, generate_role_based_questions
 
 def home(request):
     """
@@ -148,7 +155,8 @@ def ebikes(request):
     Displays all available e-bikes with user's favorite selections
     highlighted for authenticated users.
     """
-    ebikes = EBike.objects.filter(is_available=True)
+    # Provider and review statistics come back with the bikes in one query
+    ebikes = EBike.objects.with_review_stats().filter(is_available=True)
     # Get user's favorite bike IDs if logged in
     favorite_ids = []
     if request.user.is_authenticated:
@@ -333,6 +341,31 @@ def toggle_favorite(request, ebike_id):
     return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
 
 
+@login_required
+@require_POST
+def mark_notification_read(request, notification_id):
+    """Mark one of the user's notifications as read"""
+    updated = mark_notifications_read(request.user, [notification_id])
+    return JsonResponse({
+        'success': bool(updated),
+        'unread_count': user_unread_count(request.user),
+    })
+
+
+@login_required
+@require_POST
+def mark_all_notifications_read(request):
+    """Mark all of the user's notifications as read"""
+    updated = mark_notifications_read(request.user)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({'success': True, 'marked_read': updated, 'unread_count': 0})
+    messages.success(request, f'Marked {updated} notification(s) as read.')
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('home')
+
+
 @login_required
 def my_favorites(request):
     """View user's favorite e-bikes"""
@@ -367,12 +400,12 @@ def contact(request):
         ContactMessage.objects.create(name=name, email=email, subject=subject, message=message)
 
 <<<<<<< HEAD
-        # Send email to admin/owner for processing - PRODUCTION EMAIL LOGIC
+        # Queue email to admin/owner for processing - delivered by the send_queued_emails worker
         admin_email = getattr(settings, 'CONTACT_RECEIVER_EMAIL', None) or getattr(settings, 'DEFAULT_FROM_EMAIL', None)
         admin_email_sent = False
         if admin_email:
             try:
-                send_mail(
+                queue_email(
                     subject=f"[Contact Form] {subject}",
                     message=f"""From: {name} <{email}>
 Subject: {subject}
@@ -385,14 +418,13 @@ This message was submitted via the contact form on {timezone.now().strftime('%Y-
 """,
                     from_email=settings.DEFAULT_FROM_EMAIL,
                     recipient_list=[admin_email],
-                    fail_silently=False,  # DON'T silently fail in production!
                 )
                 admin_email_sent = True
             except Exception as e:
                 # Log error in production but still accept the submission
                 import logging
                 logger = logging.getLogger(__name__)
-                logger.error(f"Failed to send admin contact email: {str(e)}")
+                logger.error(f"Failed to queue admin contact email: {str(e)}")
                 # Continue processing instead of failing completely
 
         # Send acknowledgment email to the person who submitted the form
@@ -404,16 +436,15 @@ Dear {name},
 
 Thank you for contacting AIS E-bike Rental! We have received your message and our team will respond within 24-48 hours.
 =======
-        # Send email to admin/owner for processing
+        # Queue email to admin/owner for processing
         admin_email = getattr(settings, 'CONTACT_RECEIVER_EMAIL', None) or getattr(settings, 'DEFAULT_FROM_EMAIL', None)
         if admin_email:
             try:
-                send_mail(
+                queue_email(
                     subject=f"[Contact] {subject}",
                     message=f"From: {name} <{email}>\n\nSubject: {subject}\n\n{message}",
                     from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', email),
                     recipient_list=[admin_email],
-                    fail_silently=True,
                 )
             except Exception:
                 # Silently ignore admin email failures but still accept the submission
@@ -455,27 +486,25 @@ support@aisebikerental.com
             """.strip()
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
 
-            send_mail(
+            queue_email(
                 subject=acknowledgment_subject,
                 message=acknowledgment_message,
 <<<<<<< HEAD
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=False,  # DON'T silently fail user acknowledgments!
             )
             acknowledgment_email_sent = True
         except Exception as e:
             # Log error but don't fail the submission
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Failed to send user acknowledgment email: {str(e)}")
+            logger.error(f"Failed to queue user acknowledgment email: {str(e)}")
 =======
                 from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'support@aisebikerental.com'),
                 recipient_list=[email],
-                fail_silently=True,
             )
         except Exception:
-            # Don't fail the submission if user acknowledgment email fails
+            # Don't fail the submission if user acknowledgment email can't be queued
             pass
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
 
@@ -487,11 +516,13 @@ support@aisebikerental.com
 
 
 @csrf_exempt
-def chatbot_view(request):
+@rate_limit('chatbot', methods=['POST'])
+async def chatbot_view(request):
     """
     AI Chatbot view for customer support using Gemini API.
 
-    Handles both GET (for display) and POST (for chat) requests.
+    Handles both GET (for display) and POST (for chat) requests. Async, so
+    under ASGI a pending Gemini call doesn't hold a worker thread.
     """
     if request.method == 'POST':
         # Handle JSON data from chat widget
@@ -508,12 +539,16 @@ def chatbot_view(request):
         if not user_message or len(user_message.strip()) == 0:
             return JsonResponse({'error': 'Please provide a message to chat with'}, status=400)
 
-        # Get AI response using Gemini
-        ai_response = chatbot_response(
+        # Get AI response using Gemini, with this session's recent conversation
+        user = await request.auser()
+        conversation = await aload_conversation(request.session)
+        ai_response = await achatbot_response(
             user_message=user_message,
-            user=request.user if request.user.is_authenticated else None,
-            context=context_type
+            user=user if user.is_authenticated else None,
+            context=context_type,
+            conversation=conversation
         )
+        await asave_conversation(request.session, conversation)
 
         return JsonResponse({
             'response': ai_response,
@@ -521,11 +556,75 @@ def chatbot_view(request):
         })
 
     # GET request - show chatbot interface
-    return render(request, 'core/chatbot.html')
+    return await sync_to_async(render)(request, 'core/chatbot.html')
+
+
+def _sse_event(data, event=None):
+    """Format one Server-Sent Events message."""
+    import json
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@csrf_exempt
+@rate_limit('chatbot')
+async def chatbot_stream_view(request):
+    """
+    Streaming version of chatbot_view using Server-Sent Events.
+
+    Accepts the same JSON/form POST as chatbot_view, or GET with ``message``
+    and ``context`` query parameters for EventSource clients. Each chunk is
+    sent as ``data: {"text": ...}`` as soon as Gemini produces it, followed
+    by an ``event: done`` message. chatbot_view stays as the non-streaming
+    fallback.
+
+    Async with an async iterator, so under ASGI each chunk is sent as it
+    arrives and no worker thread waits on Gemini.
+    """
+    import json
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            context_type = data.get('context', 'general')
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            user_message = request.POST.get('message', '').strip()
+            context_type = request.POST.get('context', 'general')
+    elif request.method == 'GET':
+        user_message = request.GET.get('message', '').strip()
+        context_type = request.GET.get('context', 'general')
+    else:
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if not user_message:
+        return JsonResponse({'error': 'Please provide a message to chat with'}, status=400)
+
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+    conversation = await aload_conversation(request.session)
+    if not request.session.session_key:
+        # Create the session now: its cookie must go out before the stream starts
+        await request.session.acreate()
+
+    async def events():
+        # Comment line so the client gets its first byte before the model answers
+        yield ": stream opened\n\n"
+        async for chunk in astream_chatbot_response(user_message, user=user, context=context_type, conversation=conversation):
+            yield _sse_event({'text': chunk})
+        # The answer is complete only now, after the session middleware has run
+        await asave_conversation(request.session, conversation)
+        yield _sse_event({'timestamp': timezone.now().strftime('%H:%M')}, event='done')
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable nginx response buffering
+    return response
 
 
 @csrf_exempt
-def get_initial_questions(request):
+@rate_limit('initial_questions')
+async def get_initial_questions(request):
     """
     Return role-based AI questions for newly logged-in users.
 
@@ -533,7 +632,8 @@ def get_initial_questions(request):
     questions based on the user's role after login.
     """
     if request.method == 'GET':
-        user = request.user if request.user.is_authenticated else None
+        user = await request.auser()
+        user = user if user.is_authenticated else None
         questions = generate_role_based_questions(user)
 
         return JsonResponse({
@@ -559,11 +659,14 @@ def get_user_role(user):
         return 'user'
 
 
-def smart_search(request):
+@rate_limit('smart_search', methods=['POST'])
+async def smart_search(request):
     """
     AI-powered bike search and recommendations.
 
     Uses Gemini AI to analyze user queries and recommend suitable bikes.
+    Async: bikes and favorites are read with the async ORM and the model is
+    called through the async client.
     """
     if request.method == 'POST':
         query = request.POST.get('query', '').strip()
@@ -574,9 +677,10 @@ def smart_search(request):
 
         # Get all available bikes for recommendations
         available_bikes = EBike.objects.filter(is_available=True)
+        user = await request.auser()
 
         # Get AI recommendations
-        recommendations = get_bike_recommendations(query, available_bikes, request.user)
+        recommendations = await aget_bike_recommendations(query, available_bikes, user)
 
         if recommendations:
             # Show success message with count
@@ -586,13 +690,19 @@ def smart_search(request):
 
         # Render ebikes template with filtered results
         favorite_ids = []
-        if request.user.is_authenticated:
-            favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('ebike_id', flat=True))
+        if user.is_authenticated:
+            favorite_ids = [
+                ebike_id async for ebike_id in Favorite.objects.filter(user=user).values_list('ebike_id', flat=True)
+            ]
 
         # If we have AI recommendations, show only those
         if recommendations:
-            recommended_bikes = [rec['bike'] for rec in recommendations]
-            return render(request, 'core/ebikes.html', {
+            recommended_bikes = []
+            for rec in recommendations:
+                # Let each card show the model's reason for picking it
+                rec['bike'].ai_explanation = rec['explanation']
+                recommended_bikes.append(rec['bike'])
+            return await sync_to_async(render)(request, 'core/ebikes.html', {
                 'ebikes': recommended_bikes,
                 'favorite_ids': favorite_ids,
                 'ai_recommendations': recommendations,
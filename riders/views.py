@@ -1,10 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from core.models import Booking, EBike, Notification, User
-from django.db.models import Q
+from core.models import Booking, EBike
+from core.bookings import BookingConflictError, blocking_bookings, confirm_payment, create_booking
+from core.mail import queue_email
+from core.notifications import notify_staff
+from core.receipts import cached_receipt, receipt_digest
+from core.storage import private_storage
+from django.utils import timezone
 from .forms import BookingForm
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from decimal import Decimal
@@ -12,7 +18,6 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.urls import reverse
@@ -32,11 +37,13 @@ logger = logging.getLogger(__name__)
 
 def rider_dashboard(request):
     bookings = Booking.objects.filter(rider=request.user)  # Get bookings for the current rider
-    # All e-bikes that are booked (approved OR waiting for approval after payment) by any rider
+    # E-bikes that are out on a booking right now (approved, waiting for approval, or held for payment).
+    # Future bookings no longer hide a bike: overlapping dates are rejected when booking.
+    now = timezone.now()
     all_booked_ebikes = EBike.objects.filter(
-        Q(bookings__is_approved=True) | Q(bookings__status='awaiting_approval')
-    ).distinct()
-    # Only show e-bikes that are available and not already booked by anyone
+        id__in=blocking_bookings().overlapping(now, now).values('ebike_id')
+    )
+    # Only show e-bikes that are available and not currently booked by anyone
     available_ebikes = EBike.objects.filter(is_available=True).exclude(id__in=all_booked_ebikes.values_list('id', flat=True))
     user_booked_ids = list(bookings.values_list('ebike_id', flat=True))
 
@@ -82,19 +89,20 @@ def book_ebike(request, ebike_id):
             booking.total_price = total_price
             booking.ebike = ebike
             booking.rider = request.user  # Set the rider to the currently logged-in user
-            booking.save()
+            try:
+                create_booking(booking)
+            except BookingConflictError as e:
+                messages.error(request, str(e))
+                return render(request, 'riders/book_bike.html', {'form': form, 'ebike': ebike})
 
-<<<<<<< HEAD
-=======
             # Notify all admins
-            admins = User.objects.filter(is_staff=True)
-            for admin in admins:
-                Notification.objects.create(
-                    recipient=admin,
-                    message=f"New booking by {request.user.username} for {ebike.name}.",
-                    link=f"/admin-dashboard/#bookings"
-                )
+            notify_staff(
+                message=f"New booking by {request.user.username} for {ebike.name}.",
+                link="/admin-dashboard/#bookings"
+            )
 
+<<<<<<< HEAD
+=======
             # Send booking request notification email to admin
             try:
                 subject = 'New Booking Request Submitted - AIS E-Bike Rental'
@@ -123,15 +131,14 @@ AIS E-Bike Rental System
                 admin_email = getattr(settings, 'ADMIN_EMAIL', None)
 
                 if admin_email:
-                    result = send_mail(
+                    queue_email(
                         subject=subject,
                         message=plain_message,
                         html_message=html_message,
                         from_email=from_email,
                         recipient_list=[admin_email],
-                        fail_silently=False  # Change to False to capture errors
                     )
-                    logger.info(f"Booking request email sent to admin {admin_email} for booking #{booking.id}, result: {result}")
+                    logger.info(f"Booking request email queued for admin {admin_email} for booking #{booking.id}")
                 else:
                     logger.error(f"No ADMIN_EMAIL configured - cannot send booking request notification for booking #{booking.id}")
             except Exception as e:
@@ -337,12 +344,15 @@ def verify_razorpay_payment(request, booking_id):
             # Verify payment signature using Razorpay client utility
             client.utility.verify_payment_signature(params_dict)
 
-            # Payment successful, update booking status
-            booking.is_paid = True
-            booking.status = 'awaiting_approval'  # Wait for admin approval
-            booking.razorpay_payment_id = razorpay_payment_id
-            booking.razorpay_order_id = razorpay_order_id
-            booking.save(update_fields=['is_paid', 'status', 'razorpay_payment_id', 'razorpay_order_id'])
+            # Payment successful, wait for admin approval unless the window was taken meanwhile
+            try:
+                confirm_payment(booking, razorpay_order_id, razorpay_payment_id)
+            except BookingConflictError as e:
+                _notify_refund_needed(booking)
+                return JsonResponse({
+                    'success': False,
+                    'error': f'{e} Your payment has been recorded and will be refunded.'
+                }, status=409)
 <<<<<<< HEAD
 
             logger.info(f"Payment verified for booking {booking_id}. Status set to awaiting approval.")
@@ -399,8 +409,17 @@ def verify_razorpay_payment(request, booking_id):
         }, status=400)
 
 
+def _notify_refund_needed(booking):
+    """Tell staff a paid booking was cancelled because its window was taken."""
+    logger.error(f"Booking {booking.id} was paid after its window was taken; cancelled pending refund.")
+    notify_staff(
+        message=f"Refund needed: booking #{booking.id} for {booking.ebike.name} was paid after the dates were taken.",
+        link="/admin-dashboard/#bookings"
+    )
+
+
 def send_payment_confirmation_email(booking):
-    """Send payment confirmation email to the user."""
+    """Queue payment confirmation email to the user."""
     try:
         subject = f"Payment Successful - Booking #{booking.id}"
 
@@ -414,14 +433,13 @@ def send_payment_confirmation_email(booking):
         # Create plain text version
         plain_message = strip_tags(html_message)
 
-        # Send email
-        send_mail(
+        # Queue email for the send_queued_emails worker
+        queue_email(
             subject=subject,
             message=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[booking.rider.email],
             html_message=html_message,
-            fail_silently=False,
         )
     except Exception as e:
         # Log the error for debugging
@@ -432,7 +450,7 @@ def send_payment_confirmation_email(booking):
 
 
 def send_booking_confirmation_email(booking):
-    """Send booking approval confirmation email to the user."""
+    """Queue booking approval confirmation email to the user."""
     try:
         subject = f"Booking Confirmed - Collect Your E-bike from AIS Store"
 
@@ -446,14 +464,13 @@ def send_booking_confirmation_email(booking):
         # Create plain text version
         plain_message = strip_tags(html_message)
 
-        # Send email
-        send_mail(
+        # Queue email for the send_queued_emails worker
+        queue_email(
             subject=subject,
             message=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[booking.rider.email],
             html_message=html_message,
-            fail_silently=False,
         )
     except Exception as e:
         # Log the error for debugging
@@ -505,11 +522,12 @@ def razorpay_webhook(request):
                         if booking_id:
                             booking = Booking.objects.filter(id=booking_id).first()
                             if booking and not booking.is_paid:
-                                booking.is_paid = True
 <<<<<<< HEAD
-                                booking.status = 'awaiting_approval'  # Wait for admin approval
-                                booking.razorpay_order_id = order_id
-                                booking.save(update_fields=["is_paid", "status", "razorpay_order_id"])
+                                try:
+                                    confirm_payment(booking, order_id)
+                                except BookingConflictError:
+                                    _notify_refund_needed(booking)
+                                    return JsonResponse({"success": True})
 
                                 # Send payment confirmation email for webhook payments
                                 try:
@@ -517,6 +535,7 @@ def razorpay_webhook(request):
                                 except Exception as e:
                                     logger.error(f"Failed to send payment confirmation email via webhook for booking {booking.id}: {str(e)}")
 =======
+                                booking.is_paid = True
                                 booking.razorpay_order_id = order_id
                                 booking.save(update_fields=["is_paid", "razorpay_order_id"])
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
@@ -549,256 +568,49 @@ def payment_cancel(request, booking_id):
 @login_required
 def download_receipt(request, booking_id):
     """
-    Generate and return a PDF receipt for the booking.
+    Return the PDF receipt for the booking.
+
+    The receipt is rendered once per version of the booking and then served
+    from the on-disk cache (see core.receipts). The digest doubles as the
+    ETag, so a browser revalidating with If-None-Match gets a 304.
 
     Args:
         request: The HTTP request object
         booking_id: ID of the booking to generate receipt for
 
     Returns:
-        HttpResponse: PDF receipt as attachment or redirect with error message
+        FileResponse: PDF receipt as attachment, 304, or redirect with error message
     """
     try:
         # Get the booking or return 404
-        booking = get_object_or_404(Booking, id=booking_id, rider=request.user)
+        booking = get_object_or_404(Booking.objects.select_related('rider', 'ebike'), id=booking_id, rider=request.user)
 
         # Check if booking is approved
         if booking.status != 'approved':
             messages.error(request, 'Receipt is only available for approved bookings.')
             return redirect('booking_confirmation', booking_id=booking.id)
 
-        # Import required libraries
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from reportlab.lib.utils import ImageReader
-        from io import BytesIO
-        import os
-        import qrcode
-        from datetime import datetime
-        from decimal import Decimal, InvalidOperation
-
-        # Validate dates
-        if not all([hasattr(booking, 'start_date'), hasattr(booking, 'end_date')]):
-            raise ValueError("Booking is missing required date information")
-
-        if booking.start_date > booking.end_date:
-            raise ValueError("Start date cannot be after end date")
-
-        # Validate price
-        try:
-            total_price = Decimal(str(booking.total_price))
-            if total_price < 0:
-                raise ValueError("Total price cannot be negative")
-        except (TypeError, InvalidOperation):
-            raise ValueError("Invalid price format")
-
-        # Initialize PDF buffer and canvas
-        buffer = BytesIO()
-        width, height = A4
-        p = canvas.Canvas(buffer, pagesize=A4)
-
-        # --- Ultra Modern Styling constants with enhanced layout ---
-        card_x = 12
-        top_margin = 12
-        card_width = width - 2 * card_x
-        card_height = 650  # Optimized compact height for all content
-        card_y = height - card_height - top_margin
-        padding = 32
-        section_gap = 40
-        line_height = 24
-        title_font = "Helvetica-Bold"
-        label_font = "Helvetica-Bold"
-        value_font = "Helvetica-Bold"  # Made bold for currency visibility
-        rup_font = "Symbol"            # For rupee symbol clarity
-        highlight_color = colors.HexColor('#00D4AA')  # Modern teal
-        header_color = colors.HexColor('#1a202c')     # Dark slate
-        success_color = colors.HexColor('#38a169')    # Green
-        accent_color = colors.HexColor('#3182ce')     # Blue accent
-        meta_color = colors.HexColor('#718096')       # Gray
-        bg_color = colors.HexColor('#f8fafc')         # Off-white bg
-        card_bg_color = colors.white
-        border_color = colors.HexColor('#cbd5e0')     # Light blue border
-        section_bg = colors.HexColor('#f7fafc')       # Section backgrounds
-        status_paid_color = colors.HexColor('#00BFA6') # Paid status color
-        platform_charge = Decimal('20.00')
-
-        # --- Card background with border ---
-        p.setFillColor(bg_color)
-        p.rect(0, 0, width, height, fill=1, stroke=0)
-        p.setFillColor(card_bg_color)
-        border_color = highlight_color
-        p.setStrokeColor(border_color)
-        p.setLineWidth(2)
-        p.roundRect(card_x, card_y, card_width, card_height, 20, fill=1, stroke=1)
-
-        # --- All content inside the card ---
-        y = card_y + card_height - padding
-
-        # Header with brand logo and title (inside card)
-        header_height = 70
-        brand_logo_path = os.path.join('media', 'brand_logo.png')
-        if os.path.exists(brand_logo_path):
-            p.drawImage(brand_logo_path, card_x + padding, y - header_height + 10, 50, 50, mask='auto')
-        else:
-            # Draw a placeholder rectangle and text if logo is missing
-            p.setFillColor(colors.HexColor('#cccccc'))
-            p.rect(card_x + padding, y - header_height + 10, 50, 50, fill=1, stroke=0)
-            p.setFillColor(colors.black)
-            p.setFont("Helvetica", 8)
-            p.drawString(card_x + padding + 5, y - header_height + 35, "No Logo")
-
-        p.setFillColor(header_color)
-        p.roundRect(card_x, y - header_height, card_width, header_height, 20, fill=1, stroke=0)
-        p.setFillColor(colors.white)
-        p.setFont("Helvetica-Bold", 24)
-        p.drawString(card_x + padding + 60, y - header_height + 35, "AIS E-BIKE RENTAL")
-        p.setFont("Helvetica", 12)
-        p.drawString(card_x + padding + 60, y - header_height + 15, "Booking Receipt")
-        y -= header_height + section_gap
-
-        # Billing to with user logo
-        p.setFont(label_font, 14)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Billing to")
-
-        user_logo_path = None
-        if hasattr(booking.rider, 'profile_image') and booking.rider.profile_image:
-            try:
-                if os.path.exists(booking.rider.profile_image.path):
-                    user_logo_path = booking.rider.profile_image.path
-            except (ValueError, AttributeError):
-                pass
-
-        if user_logo_path:
-            p.drawImage(user_logo_path, card_x + padding + 90, y - 10, 32, 32, mask='auto')
-            text_x = card_x + padding + 130
+        digest = receipt_digest(booking)
+        etag = f'"{digest}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
         else:
-            text_x = card_x + padding + 90
-
-        p.setFont(value_font, 12)
-        p.setFillColor(colors.black)
-        p.drawString(text_x, y, booking.rider.get_full_name() or booking.rider.username)
-        p.setFont(value_font, 10)
-        p.setFillColor(meta_color)
-        p.drawString(text_x, y - line_height, f" {booking.rider.email}")
-        p.drawString(text_x, y - 2 * line_height, f" {getattr(booking.rider, 'mobile_number', '')}")
-        y -= (section_gap + 2 * line_height)
-
-        # Booking Details Section
-        p.setFont(label_font, 14)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Booking Details")
-        y -= (line_height + 10)
-        p.setFillColor(colors.white)
-        p.roundRect(card_x + padding, y - 90, card_width - 2 * padding, 90, 12, fill=1, stroke=0)
-
-        # Handle e-bike image
-        ebike_img_path = None
-        if hasattr(booking.ebike, 'image') and booking.ebike.image:
-            try:
-                if os.path.exists(booking.ebike.image.path):
-                    ebike_img_path = booking.ebike.image.path
-            except (ValueError, AttributeError):
-                pass
-
-        if ebike_img_path:
-            p.drawImage(ebike_img_path, card_x + padding + 10, y - 80, 70, 70, mask='auto')
-
-        p.setFont(label_font, 12)
-        p.setFillColor(colors.black)
-        p.drawString(card_x + padding + 90, y - 30, f" {booking.ebike.name}")
-        p.setFont(value_font, 11)
-        p.setFillColor(meta_color)
-
-        # Format dates safely
-        try:
-            date_fmt = lambda d: d.strftime('%d %b %Y') if d else 'N/A'
-            date_range = f"{date_fmt(booking.start_date)} to {date_fmt(booking.end_date)}"
-        except (AttributeError, ValueError):
-            date_range = "Date information not available"
-
-        p.drawString(card_x + padding + 90, y - 50, f" {date_range}")
-        p.setFillColor(colors.black)
-        p.drawString(card_x + padding + 90, y - 70, f"RS.{total_price:.2f}")
-
-        # Payment status - Approved by Admin badge
-        p.setFillColor(success_color)
-        p.roundRect(card_x + card_width - 2 * padding - 80, y - 40, 70, 24, 12, fill=1, stroke=1)
-        p.setFillColor(colors.white)
-        p.setFont(label_font, 10)
-        p.drawCentredString(card_x + card_width - 2 * padding - 45, y - 27, "APPROVED BY")
-        p.drawCentredString(card_x + card_width - 2 * padding - 45, y - 35, "ADMIN")
-
-        # Generate QR code
-        try:
-            qr_data = (
-                f"BookingID:{booking.id}|User:{booking.rider.username}|"
-                f"Bike:{booking.ebike.name}|From:{date_fmt(booking.start_date)}|"
-                f"To:{date_fmt(booking.end_date)}|Amount:{(total_price + platform_charge):.2f}"
+            name = cached_receipt(booking, digest)
+            response = FileResponse(
+                private_storage.open(name, 'rb'),
+                as_attachment=True,
+                filename=f'receipt_booking_{booking.id}.pdf',
+                content_type='application/pdf',
             )
-            qr = qrcode.make(qr_data)
-            qr_io = BytesIO()
-            qr.save(qr_io, kind='PNG')
-            qr_io.seek(0)
-            qr_img = ImageReader(qr_io)
-            p.drawImage(qr_img, card_x + card_width - 2 * padding - 70, y - 80, 50, 50, mask='auto')
-        except Exception as e:
-            # Log the error but don't fail the receipt generation
-            logger.error(f"Error generating QR code: {str(e)}")
-<<<<<<< HEAD
-
-=======
-            
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-        y -= (100 + section_gap)
-
-        # Payment Section
-        p.setFont(label_font, 13)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Payment Received")
-        y -= (line_height + 5)
-        p.setFont(value_font, 11)
-        p.setFillColor(colors.black)
-        p.drawString(card_x + padding, y, "Rental amount")
-        p.drawRightString(card_x + card_width - padding, y, f" RS.{total_price:.2f}")
-        y -= line_height
-        p.setFillColor(meta_color)
-        p.drawString(card_x + padding, y, "Platform charges")
-        p.drawRightString(card_x + card_width - padding, y, f" RS.{platform_charge:.2f}")
-        y -= line_height
-        p.setFont(label_font, 12)
-        p.setFillColor(highlight_color)
-        p.drawString(card_x + padding, y, "Total")
-        p.setFillColor(colors.black)
-        p.setFont(label_font, 12)
-        p.drawRightString(card_x + card_width - padding, y, f" RS.{(total_price + platform_charge):.2f}")
-        y -= (section_gap)
-
-        # Footer (inside card)
-        p.setFont(value_font, 9)
-        p.setFillColor(meta_color)
-        p.drawCentredString(card_x + card_width / 2, card_y + 20, "AIS E-Bike Rental | GSTIN: 29ABCDE1234F1Z5 | CIN: U12345KA2023PTC123456 | Contact: support@aisebike.com")
-        p.drawCentredString(card_x + card_width / 2, card_y + 8, "This is a computer-generated receipt. No signature required.")
-
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-
-        # Set up response
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_booking_{booking.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
+        response['ETag'] = etag
+        # Receipts contain personal details: browsers may keep them, shared caches may not
+        response['Cache-Control'] = 'private, no-cache'
         return response
 
     except Exception as e:
         # Log the error
         logger.error(f"Error generating receipt for booking {booking_id}: {str(e)}")
-<<<<<<< HEAD
 
-=======
-        
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
         # Show error message to user
         messages.error(request, f"Error generating receipt: {str(e)}")
         return redirect('booking_confirmation', booking_id=booking_id)
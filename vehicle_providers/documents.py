@@ -0,0 +1,596 @@
+"""
+PDF documents for vehicle providers: the financial statement, the withdrawal
+request slip and the receipt for a completed withdrawal.
+
+Each ``render_*`` function returns the PDF bytes; the views only look up the
+objects and wrap the bytes in a response. Statements can cover a provider's
+whole history, so they are also written straight to a file object
+(``write_statement_pdf``/``spool_statement_pdf``) and streamed from there.
+Drawing is done with the shared components in ``core.pdf``.
+"""
+
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+from core import pdf
+from core.ledger import CENTS, PLATFORM_CHARGE_RATE, get_provider_ledger
+from core.models import Booking, Withdrawal
+
+# Transaction fee charged on every withdrawal
+WITHDRAWAL_FEE_RATE = Decimal('0.02')
+
+# Withdrawals counted as paid out on a statement
+WITHDRAWN_STATUSES = ('approved', 'completed')
+
+# Bookings fetched per database round trip while drawing a statement
+STATEMENT_CHUNK_SIZE = getattr(settings, 'STATEMENT_CHUNK_SIZE', 2000)
+# Statements larger than this are spooled to disk instead of memory
+STATEMENT_SPOOL_SIZE = getattr(settings, 'STATEMENT_SPOOL_SIZE', 5 * 1024 * 1024)
+
+
+def statement_period(start, end):
+    """
+    Parse optional YYYY-MM-DD ``start``/``end`` strings into dates.
+
+    Raises:
+        ValueError: With a message for the provider if a date is malformed or
+            the range is backwards
+    """
+    dates = []
+    for value in (start, end):
+        try:
+            parsed = parse_date(value) if value else None
+        except ValueError:
+            parsed = None
+        if value and parsed is None:
+            raise ValueError("Please enter statement dates as YYYY-MM-DD.")
+        dates.append(parsed)
+    start, end = dates
+    if start and end and start > end:
+        raise ValueError("The statement start date must be on or before the end date.")
+    return start, end
+
+
+def statement_bookings(provider, start=None, end=None):
+    """The provider's bookings created between ``start`` and ``end`` (inclusive dates, either optional)."""
+    bookings = Booking.objects.filter(ebike__provider=provider)
+    if start:
+        bookings = bookings.filter(created_at__date__gte=start)
+    if end:
+        bookings = bookings.filter(created_at__date__lte=end)
+    return bookings
+
+
+def statement_totals(provider, start=None, end=None):
+    """
+    Summary figures for a statement, summed by the database.
+
+    Earnings, charges and withdrawals cover the statement period; the
+    available balance is the provider's current balance.
+    """
+    totals = statement_bookings(provider, start, end).aggregate(
+        total_bookings=Count('pk'),
+        completed_bookings=Count('pk', filter=Booking.EARNING_FILTER),
+        total_earnings=Sum('total_price', filter=Booking.EARNING_FILTER, default=Decimal('0.00')),
+    )
+    withdrawals = Withdrawal.objects.filter(provider=provider, status__in=WITHDRAWN_STATUSES)
+    if start:
+        withdrawals = withdrawals.filter(created_at__date__gte=start)
+    if end:
+        withdrawals = withdrawals.filter(created_at__date__lte=end)
+    totals['withdrawn'] = withdrawals.aggregate(total=Sum('amount', default=Decimal('0.00')))['total']
+
+    earnings = Decimal(totals['total_earnings']).quantize(CENTS)
+    totals['total_earnings'] = earnings
+    totals['pending_bookings'] = totals['total_bookings'] - totals['completed_bookings']
+    totals['platform_charges'] = (earnings * PLATFORM_CHARGE_RATE).quantize(CENTS)
+    totals['net_profit'] = earnings - totals['platform_charges']
+
+    ledger = get_provider_ledger(provider)
+    paid_out = ledger.approved_withdrawals + ledger.completed_withdrawals
+    totals['available_balance'] = max(ledger.net_earnings - paid_out, Decimal('0.0'))
+    return totals
+
+
+class StatementWriter:
+    """
+    Draws a statement page by page onto a canvas.
+
+    Bookings are read from the database in chunks with ``.iterator()`` and
+    each row is drawn as it arrives, starting a new page whenever the current
+    one is full, so no more than one chunk of bookings is held at a time.
+    """
+
+    card_x = 20
+    top_margin = 20
+    bottom_margin = 60
+    row_height = 15
+    label_font = "Helvetica-Bold"
+    value_font = "Helvetica"
+    highlight_color = colors.HexColor('#00BFA6')
+    header_color = colors.HexColor('#0D47A1')
+    bg_color = colors.HexColor('#f9f9f9')
+    card_bg_color = colors.HexColor('#f4f6fa')
+    columns = ((10, "Date"), (80, "E-Bike"), (180, "Duration"), (280, "Amount"), (340, "Status"))
+
+    def __init__(self, provider, p, start=None, end=None, progress=None):
+        self.provider = provider
+        self.p = p
+        self.start, self.end = start, end
+        self.progress = progress
+        self.width, self.height = pdf.PAGE_SIZE
+        self.card_width = self.width - 2 * self.card_x
+        self.left, self.right = self.card_x + 20, self.card_x + self.card_width - 20
+        self.page_number = 1
+        self.y = self.height - self.top_margin
+
+    def period(self):
+        if not (self.start or self.end):
+            return "All activity"
+        start = self.start.strftime('%d %b %Y') if self.start else "the beginning"
+        end = self.end.strftime('%d %b %Y') if self.end else "today"
+        return f"{start} to {end}"
+
+    def header(self):
+        generated = timezone.localtime().strftime('%B %d, %Y at %I:%M %p')
+        pdf.header_band(self.p, self.card_x, self.y - 60, self.card_width, 60, self.header_color,
+                        "AIS E-BIKE RENTAL - FINANCIAL STATEMENT", f"Generated on: {generated}",
+                        title_size=18, subtitle_size=10, title_offset=30, radius=15)
+        self.y -= 80
+
+        pdf.card(self.p, self.card_x, self.y - 50, self.card_width, 50, self.card_bg_color)
+        pdf.section_title(self.p, self.left, self.y - 20, "Provider Information", colors.black, size=12)
+        self.p.setFont(self.value_font, 10)
+        self.p.drawString(self.left, self.y - 35, f"Name: {self.provider.get_full_name() or self.provider.username}")
+        self.p.drawString(self.left, self.y - 45, f"Email: {self.provider.email}")
+        self.p.drawRightString(self.right, self.y - 35, f"Period: {self.period()}")
+        self.y -= 70
+
+    def summary(self, totals):
+        p = self.p
+        pdf.card(p, self.card_x, self.y - 100, self.card_width, 100, self.card_bg_color)
+        pdf.section_title(p, self.left, self.y - 20, "Financial Summary", colors.black, size=12)
+        summary_y = self.y - 35
+        p.setFont(self.value_font, 10)
+        p.drawString(self.left, summary_y, f"Total Bookings: {totals['total_bookings']}")
+        p.drawString(self.card_x + 320, summary_y, f"Completed: {totals['completed_bookings']}")
+        p.drawString(self.card_x + 440, summary_y, f"Pending: {totals['pending_bookings']}")
+
+        rows = [
+            ("Total Earnings (from approved bookings):", totals['total_earnings'], self.value_font, colors.black),
+            ("Platform Charges (10%):", totals['platform_charges'], self.value_font, colors.black),
+            ("Net Profit:", totals['net_profit'], self.label_font, self.highlight_color),
+            ("Total Withdrawn:", totals['withdrawn'], self.value_font, colors.black),
+            ("Available Balance:", totals['available_balance'], self.label_font, colors.black),
+        ]
+        for label, amount, font, color in rows:
+            summary_y -= 15
+            pdf.amount_row(p, self.left, self.right, summary_y, label, f"₹{amount:,.2f}", font=font, size=10, color=color)
+        self.y -= 130
+
+    def table_header(self):
+        pdf.card(self.p, self.card_x, self.y - 20, self.card_width, 20, colors.white, radius=5)
+        self.p.setFillColor(colors.black)
+        self.p.setFont(self.label_font, 9)
+        for x, heading in self.columns:
+            self.p.drawString(self.card_x + x, self.y - 13, heading)
+        self.y -= 25
+        self.p.setFont(self.value_font, 8)
+
+    def footer(self):
+        pdf.centred_lines(self.p, self.card_x + self.card_width / 2, 30, [
+            f"AIS E-Bike Rental | Financial Statement | Page {self.page_number}",
+            "This is a computer-generated statement. Please retain for your records.",
+        ], colors.gray, size=8, leading=10)
+
+    def new_page(self):
+        self.footer()
+        self.p.showPage()
+        self.page_number += 1
+        self.y = self.height - self.top_margin
+        pdf.page_background(self.p, self.bg_color)
+        name = self.provider.get_full_name() or self.provider.username
+        pdf.section_title(self.p, self.left, self.y - 15, f"Booking Activity (continued) - {name}", self.header_color, size=11)
+        self.y -= 30
+        self.table_header()
+
+    def row(self, booking):
+        if self.y - self.row_height < self.bottom_margin:
+            self.new_page()
+        p = self.p
+        name = booking.ebike.name
+        ebike_name = name[:15] + "..." if len(name) > 15 else name
+        duration = f"{booking.start_date} to {booking.end_date}"
+        duration = duration[:20] + "..." if len(duration) > 20 else duration
+        p.setFillColor(colors.black)
+        p.drawString(self.card_x + 10, self.y - 10, booking.created_at.strftime('%m/%d/%Y') if booking.created_at else '')
+        p.drawString(self.card_x + 80, self.y - 10, ebike_name)
+        p.drawString(self.card_x + 180, self.y - 10, duration)
+        p.drawString(self.card_x + 280, self.y - 10, f"₹{booking.total_price}")
+        p.drawString(self.card_x + 340, self.y - 10, booking.get_status_display())
+        self.y -= self.row_height
+
+    def write(self):
+        """Draw the whole statement; returns the number of booking rows."""
+        pdf.page_background(self.p, self.bg_color)
+        self.header()
+        totals = statement_totals(self.provider, self.start, self.end)
+        self.summary(totals)
+        if self.progress:
+            self.progress(0, totals['total_bookings'])
+
+        count = 0
+        if totals['total_bookings']:
+            pdf.section_title(self.p, self.left, self.y, "Booking Activity", self.header_color, size=12)
+            self.y -= 20
+            self.table_header()
+            bookings = (
+                statement_bookings(self.provider, self.start, self.end)
+                .select_related('ebike')
+                .only('created_at', 'start_date', 'end_date', 'total_price', 'status', 'ebike__name')
+                .order_by('-created_at', '-pk')
+            )
+            for booking in bookings.iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+                self.row(booking)
+                count += 1
+                if self.progress and count % STATEMENT_CHUNK_SIZE == 0:
+                    self.progress(count, totals['total_bookings'])
+        self.footer()
+        return count
+
+
+def write_statement_pdf(provider, output, start=None, end=None, progress=None):
+    """
+    Write a provider's full statement for the period to the file object ``output``.
+
+    ``progress``, if given, is called as ``progress(bookings drawn, total)``
+    before the first booking and after every chunk of bookings.
+
+    Returns:
+        Number of bookings listed
+    """
+    p = canvas.Canvas(output, pagesize=pdf.PAGE_SIZE)
+    count = StatementWriter(provider, p, start, end, progress).write()
+    p.showPage()
+    p.save()
+    return count
+
+
+def spool_statement_pdf(provider, start=None, end=None, progress=None):
+    """
+    The statement in a temporary file, rewound and ready to stream.
+
+    Small statements stay in memory; bigger ones roll over to disk once they
+    pass ``STATEMENT_SPOOL_SIZE`` bytes.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=STATEMENT_SPOOL_SIZE)
+    try:
+        write_statement_pdf(provider, spool, start, end, progress)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def render_statement_pdf(provider, start=None, end=None):
+    """The statement as bytes."""
+    buffer = BytesIO()
+    write_statement_pdf(provider, buffer, start, end)
+    return buffer.getvalue()
+
+
+def _slip_styles():
+    styles = getSampleStyleSheet()
+    title = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.HexColor('#0D47A1'),
+    )
+    header = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Normal'],
+        fontSize=14,
+        textColor=colors.HexColor('#1565C0'),
+        spaceAfter=15,
+    )
+    normal = ParagraphStyle('SlipNormal', parent=styles['Normal'], fontSize=11)
+    return styles, title, header, normal
+
+
+def render_withdrawal_slip_pdf(withdrawal):
+    """Invoice-style slip for a withdrawal request, in any status."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pdf.PAGE_SIZE)
+    styles, title_style, header_style, normal_style = _slip_styles()
+    provider = withdrawal.provider
+    light_blue = colors.HexColor('#E3F2FD')
+
+    elements = [
+        Paragraph("<b>AIS E-BIKE RENTAL</b>", title_style),
+        Paragraph("Your Trusted E-bike Rental Partner", header_style),
+        Spacer(1, 20),
+        pdf.key_value_table([
+            ['Invoice Type:', 'Withdrawal Request Invoice'],
+            ['Invoice Number:', f'WD-{withdrawal.id:06d}'],
+            ['Issue Date:', withdrawal.created_at.strftime('%d %b %Y')],
+            ['Issue Time:', withdrawal.created_at.strftime('%I:%M %p')],
+        ], styles=[
+            ('BACKGROUND', (0, 0), (1, 0), light_blue),
+            ('BACKGROUND', (0, 2), (1, 2), light_blue),
+            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1976D2')),
+        ]),
+        Spacer(1, 25),
+
+        Paragraph("<b>Provider Information</b>", header_style),
+        pdf.key_value_table([
+            ['Provider Name:', provider.get_full_name() or provider.username],
+            ['Provider ID:', provider.username],
+            ['Email Address:', provider.email],
+        ], styles=[('BACKGROUND', (0, 0), (1, 2), colors.whitesmoke)]),
+        Spacer(1, 25),
+
+        Paragraph("<b>Withdrawal Request Details</b>", header_style),
+        Paragraph("<b>Requested Amount:</b>", normal_style),
+        Paragraph(f"<font size='16' color='#D32F2F'><b>₹{withdrawal.amount:,.2f}</b></font>", styles['Heading1']),
+        Spacer(1, 20),
+    ]
+
+    payment_data = [
+        ['Account Holder:', withdrawal.account_holder_name],
+        ['Payment Method:', 'UPI' if withdrawal.upi_id else 'Bank Transfer'],
+    ]
+    if withdrawal.upi_id:
+        payment_data.append(['UPI ID:', withdrawal.upi_id])
+    else:
+        payment_data.extend([
+            ['Account Number:', withdrawal.account_number or 'Not provided'],
+            ['Bank Name:', withdrawal.bank_name or 'Not provided'],
+            ['IFSC Code:', withdrawal.ifsc_code or 'Not provided'],
+        ])
+    elements += [
+        pdf.key_value_table(payment_data, styles=[('BACKGROUND', (0, 0), (1, -1), colors.white)]),
+        Spacer(1, 25),
+    ]
+
+    # Status Section
+    status_color = {
+        'pending': colors.orange,
+        'approved': colors.blue,
+        'completed': colors.green,
+        'rejected': colors.red,
+    }.get(withdrawal.status, colors.grey)
+    elements += [
+        Paragraph("<b>Request Status</b>", header_style),
+        pdf.key_value_table([
+            ['Current Status:', withdrawal.get_status_display().upper()],
+            ['Status Color:', '●'],
+        ], col_widths=(120, 80), font='Helvetica-Bold', styles=[
+            ('BACKGROUND', (0, 0), (1, 0), colors.white),
+            ('BACKGROUND', (0, 1), (1, 1), status_color),
+            ('TEXTCOLOR', (0, 1), (0, 1), status_color),
+            ('FONTSIZE', (1, 1), (1, 1), 16),
+        ]),
+        Spacer(1, 20),
+    ]
+
+    # Processing Information
+    if withdrawal.processed_at:
+        processed_on = withdrawal.processed_at.strftime('%d %b %Y at %I:%M %p')
+        elements.append(Paragraph(f"<b>Processed On:</b> {processed_on}", normal_style))
+        if withdrawal.transaction_id:
+            elements.append(Paragraph(
+                f"<b>Transaction ID:</b> <font color='green'>{withdrawal.transaction_id}</font>", normal_style
+            ))
+        elements.append(Spacer(1, 15))
+
+    if withdrawal.admin_notes:
+        elements += [
+            Paragraph("<b>Admin Remarks:</b>", normal_style),
+            Paragraph(f"<i>{withdrawal.admin_notes}</i>", normal_style),
+            Spacer(1, 20),
+        ]
+
+    elements.append(Paragraph("""
+        <b>Important Notes:</b><br/>
+        • This is a system-generated withdrawal request invoice<br/>
+        • Processing time may vary based on verification and availability<br/>
+        • For any queries, contact support@aisebikerental.com<br/>
+        • AIS E-bike Rental - Your trusted rental partner<br/>
+        <br/>
+        <font color='#666666' size='8'>Generated on: {}</font>
+        """.format(timezone.localtime().strftime('%d %b %Y, %I:%M %p')), styles['Normal']))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_withdrawal_receipt_pdf(withdrawal):
+    """Receipt for a completed withdrawal, with a verification QR code."""
+    buffer, p = pdf.start_document()
+    width, height = pdf.PAGE_SIZE
+
+    # --- Styling constants ---
+    card_x = 12
+    top_margin = 12
+    card_width = width - 2 * card_x
+    card_height = 750
+    card_y = height - card_height - top_margin
+    padding = 32
+    section_gap = 40
+    line_height = 24
+    label_font = "Helvetica-Bold"
+    value_font = "Helvetica-Bold"  # Bold for currency visibility
+    highlight_color = colors.HexColor('#00D4AA')  # Modern teal
+    header_color = colors.HexColor('#1a202c')     # Dark slate
+    success_color = colors.HexColor('#38a169')    # Green
+    accent_color = colors.HexColor('#3182ce')     # Blue accent
+    meta_color = colors.HexColor('#718096')       # Gray
+    bg_color = colors.HexColor('#f8fafc')         # Off-white bg
+    border_color = colors.HexColor('#cbd5e0')     # Light blue border
+    section_bg = colors.HexColor('#f7fafc')       # Section backgrounds
+    left, right = card_x + padding, card_x + card_width - padding
+    provider = withdrawal.provider
+    now = timezone.localtime()
+
+    # --- Background and main card ---
+    pdf.page_background(p, bg_color)
+    pdf.card(p, card_x, card_y, card_width, card_height, colors.white, radius=12, stroke=border_color, line_width=1.5)
+
+    # --- Header Section ---
+    header_height = 80
+    y = card_y + card_height - padding
+    pdf.header_band(p, card_x, y - header_height, card_width, header_height, header_color,
+                    "AIS E-BIKE RENTAL", f"Withdrawal Receipt - {now.strftime('%B %d, %Y')}",
+                    title_size=28, subtitle_size=14, title_offset=40, subtitle_font=value_font,
+                    radius=12, centred=True)
+    p.setFillColor(highlight_color)
+    p.circle(card_x + 30, y - 25, 8, fill=1, stroke=0)
+    p.circle(card_x + card_width - 30, y - 25, 6, fill=1, stroke=0)
+
+    # Transaction success banner
+    banner_height = 25
+    banner_y = y - header_height - 10
+    pdf.card(p, left, banner_y - banner_height, card_width - 2 * padding, banner_height, colors.green, radius=8)
+    p.setFillColor(colors.white)
+    p.setFont(label_font, 11)
+    p.drawCentredString(card_x + card_width / 2, banner_y - banner_height + 8, "✓ TRANSACTION COMPLETED SUCCESSFULLY")
+    y = banner_y - banner_height - section_gap
+
+    # --- Provider Information Section ---
+    pdf.section_title(p, left, y, "Provider Information", header_color, size=16)
+    y -= (line_height + 5)
+    box_height = 70
+    pdf.card(p, left, y - box_height, card_width - 2 * padding, box_height, colors.white, radius=8, stroke=border_color)
+    detail_x = left + 15
+    p.setFont(label_font, 13)
+    p.setFillColor(colors.black)
+    p.drawString(detail_x, y - 20, provider.get_full_name() or provider.username)
+    p.setFont(value_font, 12)
+    p.setFillColor(meta_color)
+    p.drawString(detail_x, y - 38, f"Provider ID: {provider.username}")
+    p.drawString(detail_x, y - 55, f"Email: {provider.email}")
+    y -= (box_height + section_gap)
+
+    # --- Transaction Summary ---
+    pdf.section_title(p, left, y, "Transaction Summary", header_color, size=16)
+    y -= (line_height + 8)
+    amount_box_height = 90
+    pdf.card(p, left, y - amount_box_height, card_width - 2 * padding, amount_box_height, section_bg,
+             stroke=accent_color, line_width=1.5)
+
+    fee = Decimal(str(withdrawal.amount)) * WITHDRAWAL_FEE_RATE
+    net_amount = withdrawal.amount - fee
+    amt_y = y - 25
+    pdf.amount_row(p, left + 15, right - 15, amt_y, "Principal Amount:", f"₹ {withdrawal.amount:,.2f}",
+                   font=value_font, size=12, value_size=18, value_color=accent_color)
+    charge_y = amt_y - 25
+    pdf.amount_row(p, left + 15, right - 15, charge_y, "Transaction Fee (2%):", f"₹ {fee:,.2f}",
+                   font=value_font, color=meta_color, value_size=13, value_color=colors.HexColor('#e53e3e'))
+    net_y = charge_y - 28
+    pdf.amount_row(p, left + 15, right - 15, net_y, "Net Amount Received:", f"₹ {net_amount:,.2f}",
+                   font=label_font, size=14, color=success_color, value_size=16)
+    p.setStrokeColor(highlight_color)
+    p.setLineWidth(0.5)
+    p.line(left + 10, net_y - 8, right - 10, net_y - 8)
+    y -= (amount_box_height + section_gap) + section_gap
+
+    # --- Payment Details ---
+    pdf.section_title(p, left, y, "Payment Details", header_color, size=13)
+    y -= (line_height + 5)
+    p.setFont(value_font, 12)
+    p.setFillColor(colors.green)
+    p.drawString(left, y, "Status: SUCCESSFUL")
+    y -= line_height
+    if withdrawal.transaction_id:
+        p.setFillColor(colors.black)
+        p.drawString(left, y, f"Transaction ID: {withdrawal.transaction_id}")
+        y -= line_height
+
+    p.setFont(value_font, 10)
+    p.setFillColor(meta_color)
+    p.drawString(left, y, f"Account Holder: {withdrawal.account_holder_name}")
+    y -= line_height
+    if withdrawal.upi_id:
+        p.drawString(left, y, f"Payment Method: UPI ({withdrawal.upi_id})")
+    else:
+        p.drawString(left, y, f"Bank: {withdrawal.bank_name}")
+        y -= line_height
+        account_tail = withdrawal.account_number[-4:] if withdrawal.account_number else 'XXXX'
+        p.drawString(left, y, f"Account: {account_tail}...{withdrawal.ifsc_code}")
+
+    # --- Authorization: company block, QR code, signature and stamp ---
+    logo_x = left + 10
+    logo_y = card_y + 110
+
+    pdf.card(p, logo_x, logo_y - 35, 45, 35, header_color, radius=6)
+    p.setFillColor(colors.white)
+    p.setFont(label_font, 14)
+    p.drawCentredString(logo_x + 22.5, logo_y - 20, "AIS")
+
+    p.setFillColor(meta_color)
+    p.setFont(value_font, 7)
+    p.drawString(logo_x + 55, logo_y - 12, "AIS E-Bike Rental Services Pvt. Ltd.")
+    p.drawString(logo_x + 55, logo_y - 22, "GSTIN: 29ABCDE1234F1Z5 | CIN: U12345KA2023PTC123456")
+    p.drawString(logo_x + 55, logo_y - 32, "support@aisebike.com")
+
+    qr_code_x = right - 50
+    qr_data = "\n".join([
+        "AIS E-BIKE RENTAL",
+        "TRANSACTION VERIFICATION",
+        f"ID: {withdrawal.transaction_id or f'W{withdrawal.id:06d}'}",
+        f"Provider: {provider.username}",
+        f"Amount: ₹{withdrawal.amount}",
+        f"Status: {withdrawal.status.title()}",
+        f"Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M:%S')}",
+        "Verified by AIS E-Bike Rental",
+    ])
+    qr = pdf.qr_image(qr_data, version=1, box_size=3, border=1)
+    if not pdf.draw_image(p, qr, qr_code_x, logo_y - 35, 35):
+        # Placeholder when QR codes can't be generated
+        p.setStrokeColor(accent_color)
+        p.setLineWidth(1.2)
+        p.rect(qr_code_x, logo_y - 35, 35, 35, fill=0, stroke=1)
+        p.rect(qr_code_x + 3, logo_y - 33, 10, 10, fill=1, stroke=0)
+        p.rect(qr_code_x + 22, logo_y - 33, 10, 10, fill=1, stroke=0)
+        p.rect(qr_code_x + 3, logo_y - 10, 29, 7, fill=1, stroke=0)
+    pdf.centred_lines(p, qr_code_x + 17.5, logo_y - 40, ["SCAN TO VERIFY"], meta_color, size=5, font=value_font)
+
+    signature_y = card_y + 30
+    signature_x = left + 100
+    p.setStrokeColor(colors.black)
+    p.setLineWidth(1.2)
+    p.line(signature_x, signature_y, signature_x + 70, signature_y)
+    pdf.centred_lines(p, signature_x + 35, signature_y + 5, ["Authorized Signatory"], meta_color, size=8, font=value_font)
+
+    stamp_x = qr_code_x - 20
+    stamp_y = signature_y - 5
+    p.setFillColor(colors.HexColor('#f9fafb'))
+    p.circle(stamp_x, stamp_y, 20, fill=1, stroke=0)
+    p.setStrokeColor(header_color)
+    p.setLineWidth(1.5)
+    p.circle(stamp_x, stamp_y, 20, fill=0, stroke=1)
+    pdf.centred_lines(p, stamp_x, stamp_y + 5, ["APPROVED"], header_color, size=8, font=label_font)
+    pdf.centred_lines(p, stamp_x, stamp_y + 1, ["AIS E-BIKE", "ADMIN"], header_color, size=5, leading=4, font=value_font)
+    pdf.centred_lines(p, stamp_x, stamp_y - 10, [now.strftime('%d/%m/%Y')], header_color, size=6, font=value_font)
+
+    pdf.centred_lines(p, card_x + card_width / 2, card_y + 12, [
+        "This is a computer-generated receipt. No signature required for verification.",
+        "AIS E-Bike Rental Services - Making electric mobility accessible",
+    ], meta_color, size=7, leading=8, font=value_font)
+
+    return pdf.finish_document(p, buffer)
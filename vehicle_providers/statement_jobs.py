@@ -0,0 +1,155 @@
+"""
+Background generation of provider statements.
+
+A multi-year statement for a busy provider can take longer to draw than a
+request is allowed to run, so ``download_statement`` can queue it instead:
+``enqueue_statement`` inserts a StatementJob row (or returns the identical one
+already queued or running), and the ``process_statement_jobs`` management
+command calls ``process_statement_jobs`` to render queued jobs into private
+storage (see core.storage), which only ``download_statement_job`` serves from.
+While a job runs it records how many bookings it has drawn, which the status
+endpoint reports as progress. Finished jobs and their files are deleted by
+``expire_statement_jobs`` (run by the same command) once
+``STATEMENT_JOB_RETENTION`` has passed.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import StatementJob
+from .documents import spool_statement_pdf
+
+logger = logging.getLogger(__name__)
+
+# Jobs claimed by a worker that died mid-render are picked up again after this
+CLAIM_TIMEOUT = timedelta(minutes=30)
+# Finished jobs, and their files, are kept this long for the provider to download
+JOB_RETENTION = timedelta(seconds=getattr(settings, 'STATEMENT_JOB_RETENTION', 24 * 60 * 60))
+
+
+def dedupe_key(provider, start=None, end=None):
+    return f"{provider.pk}:{start or ''}:{end or ''}"
+
+
+def enqueue_statement(provider, start=None, end=None):
+    """
+    Queue a statement for the provider and date range.
+
+    Returns:
+        (job, created): the new job, or the identical job already in flight
+    """
+    key = dedupe_key(provider, start, end)
+    in_flight = StatementJob.objects.filter(dedupe_key=key, status__in=StatementJob.IN_FLIGHT_STATUSES)
+    job = in_flight.first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            return StatementJob.objects.create(provider=provider, start_date=start, end_date=end, dedupe_key=key), True
+    except IntegrityError:
+        # A concurrent request queued the same statement first
+        return in_flight.get(), False
+
+
+def job_status(job):
+    """What the status endpoint reports for a job."""
+    data = {
+        'job_id': job.pk,
+        'status': job.status,
+        'progress': job.progress,
+        'processed_bookings': job.processed_bookings,
+        'total_bookings': job.total_bookings,
+        'status_url': reverse('statement_job_status', args=[job.pk]),
+    }
+    if job.status == 'done':
+        data['download_url'] = reverse('download_statement_job', args=[job.pk])
+    elif job.status == 'failed':
+        data['error'] = 'The statement could not be generated. Please try again.'
+    return data
+
+
+def claim_statement_jobs(limit=1):
+    """
+    Mark up to ``limit`` queued jobs as running in this worker.
+
+    The claim is a conditional UPDATE, so two workers never pick up the same job.
+    """
+    now = timezone.now()
+    due = Q(status='queued') | Q(status='running', locked_at__lt=now - CLAIM_TIMEOUT)
+    with transaction.atomic():
+        ids = list(StatementJob.objects.filter(due).order_by('created_at').values_list('id', flat=True)[:limit])
+        StatementJob.objects.filter(due, id__in=ids).update(status='running', locked_at=now, processed_bookings=0)
+    return list(StatementJob.objects.filter(id__in=ids, status='running', locked_at=now).select_related('provider'))
+
+
+def run_statement_job(job):
+    """
+    Render one claimed job into private storage, recording progress and the outcome.
+
+    A worker that overruns ``CLAIM_TIMEOUT`` can have its job reclaimed by
+    another, so every write is conditional on the claim (``locked_at``) still
+    being this worker's. If it isn't, the rendered file is thrown away.
+
+    Returns:
+        'done', 'failed', or 'lost' if another worker took the job over
+    """
+    claim = StatementJob.objects.filter(pk=job.pk, status='running', locked_at=job.locked_at)
+
+    def progress(processed, total):
+        # Plain UPDATE so the status endpoint sees progress while the PDF is drawn
+        claim.update(processed_bookings=processed, total_bookings=total)
+
+    try:
+        with spool_statement_pdf(job.provider, job.start_date, job.end_date, progress) as statement:
+            job.file.save(f'statement_{job.pk}.pdf', File(statement), save=False)
+    except Exception as e:
+        logger.error(f"Error generating statement job #{job.pk} for {job.provider.username}: {str(e)}")
+        if not claim.update(status='failed', error=str(e), finished_at=timezone.now(), locked_at=None):
+            return 'lost'
+        return 'failed'
+
+    finished = claim.update(
+        file=job.file.name, status='done', processed_bookings=F('total_bookings'),
+        finished_at=timezone.now(), locked_at=None,
+    )
+    if not finished:
+        logger.warning(f"Statement job #{job.pk} was reclaimed by another worker; discarding this render")
+        job.file.delete(save=False)
+        return 'lost'
+    return 'done'
+
+
+def process_statement_jobs(limit=1):
+    """
+    Render up to ``limit`` queued statements.
+
+    Returns:
+        Dict with counts of 'done', 'failed' and 'lost' jobs
+    """
+    counts = {'done': 0, 'failed': 0, 'lost': 0}
+    for job in claim_statement_jobs(limit):
+        counts[run_statement_job(job)] += 1
+    return counts
+
+
+def expire_statement_jobs():
+    """
+    Delete jobs that finished more than ``JOB_RETENTION`` ago, with their files.
+
+    Returns:
+        Number of jobs deleted
+    """
+    cutoff = timezone.now() - JOB_RETENTION
+    expired = list(StatementJob.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+    StatementJob.objects.filter(id__in=[job.id for job in expired]).delete()
+    return len(expired)
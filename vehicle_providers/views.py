@@ -2,22 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 <<<<<<< HEAD
-from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_POST
 =======
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-from core.models import EBike, Booking, VehicleRegistration, ProviderDocument, Withdrawal
+from core.models import EBike, Booking, VehicleRegistration, ProviderDocument, StatementJob, Withdrawal
+from core.ledger import get_provider_ledger
 from .forms import EBikeForm, VehicleRegistrationForm, ProviderDocumentForm, WithdrawalForm
+from .documents import render_withdrawal_receipt_pdf, render_withdrawal_slip_pdf, spool_statement_pdf, statement_period
+from .statement_jobs import enqueue_statement, job_status
+from datetime import datetime
 from decimal import Decimal
-from django.db.models import Sum
 from django.core.mail import send_mail
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.template.loader import render_to_string
 from django.conf import settings
-<<<<<<< HEAD
-from django.utils import timezone
-=======
-from django.http import HttpResponse
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,23 +28,18 @@ def vehicle_provider_dashboard(request):
     bookings = Booking.objects.filter(ebike__provider=request.user)
     approved_bookings = bookings.filter(is_approved=True).order_by('-start_date')
 
-    # Calculate provider's total earnings from approved bookings only (optimized DB query)
-    total_earnings_result = Booking.objects.filter(
-        ebike__provider=request.user, is_approved=True
-    ).aggregate(total=Sum('total_price'))['total'] or 0.0
-    total_earnings = Decimal(str(total_earnings_result))
+    # Earnings and withdrawal totals are kept up to date in the provider's ledger row
+    ledger = get_provider_ledger(request.user)
+    total_earnings = ledger.total_earnings
 
     # Apply platform fee (10%) - this is deducted by the platform
-    platform_charges = total_earnings * Decimal('0.10')
+    platform_charges = ledger.platform_charges
 
     # Net earnings after platform fee
-    net_earnings = total_earnings - platform_charges
+    net_earnings = ledger.net_earnings
 
     # Only subtract pending and approved withdrawals (exclude completed - already paid)
-    pending_withdrawals_total = Withdrawal.objects.filter(
-        provider=request.user,
-        status__in=['pending', 'approved']  # Exclude 'completed' - already paid
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
+    pending_withdrawals_total = ledger.reserved_withdrawals
 
     # Get registration fee status - one-time fee providers must pay
     registration_fee = Decimal('100.00')
@@ -92,7 +85,6 @@ def vehicle_provider_dashboard(request):
     print("=" * 60)
     print(f"👤 Provider: {request.user.username} (ID: {request.user.id})")
     print(f"📊 Total Bookings: {bookings.count()} | Approved: {approved_bookings.count()}")
-    print(f"💰 Total Earnings Result: {total_earnings_result}")
     print(f"💰 Total Earnings: ₹{total_earnings}")
     print(f"➖ Platform Charges (10%): ₹{platform_charges}")
     print(f"💵 Net Earnings: ₹{net_earnings}")
@@ -174,17 +166,15 @@ def vehicle_provider_dashboard(request):
 =======
     ebikes = EBike.objects.filter(provider=request.user)
     bookings = Booking.objects.filter(ebike__provider=request.user, is_approved=True)
-    total_earnings = sum(float(booking.total_price) for booking in bookings)
-    platform_charges = Decimal(str(total_earnings)) * Decimal('0.1')
+    ledger = get_provider_ledger(request.user)
+    total_earnings = ledger.total_earnings
+    platform_charges = ledger.platform_charges
 
     # Calculate completed withdrawals
-    completed_withdrawals = Withdrawal.objects.filter(
-        provider=request.user,
-        status__in=['approved', 'completed']
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
+    completed_withdrawals = ledger.approved_withdrawals + ledger.completed_withdrawals
 
     # Calculate net profit (earnings - platform charges)
-    net_profit = Decimal(str(total_earnings)) - platform_charges
+    net_profit = ledger.net_earnings
 
     # Calculate available balance (net profit - withdrawn amounts)
     available_balance = net_profit - completed_withdrawals
@@ -309,21 +299,13 @@ def request_withdrawal(request):
         return redirect('vehicle_provider_dashboard')
 
 <<<<<<< HEAD
-    # Calculate available balance same as dashboard (FIXED: exclude completed withdrawals)
-    total_earnings_result = Booking.objects.filter(
-        ebike__provider=request.user, is_approved=True
-    ).aggregate(total=Sum('total_price'))['total'] or 0.0
-    total_earnings = Decimal(str(total_earnings_result))
-
-    platform_charges = total_earnings * Decimal('0.10')
+    # Calculate available balance same as dashboard, from the provider's ledger row
+    ledger = get_provider_ledger(request.user)
+    total_earnings = ledger.total_earnings
+    platform_charges = ledger.platform_charges
 
-    # FIX: Only subtract pending and approved withdrawals, not completed ones
-    pending_withdrawals_total = Withdrawal.objects.filter(
-        provider=request.user,
-        status__in=['pending', 'approved']  # Exclude completed - already paid
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
-
-    available_balance = max(total_earnings - platform_charges - pending_withdrawals_total, Decimal('0.0'))
+    # Only pending and approved withdrawals are subtracted, not completed ones
+    available_balance = ledger.available_balance
 
     # Update MINIMUM_RESERVE to use registration_fee instead of fixed 100
     registration_fee = Decimal('100.00')
@@ -351,17 +333,12 @@ def request_withdrawal(request):
         return redirect('vehicle_provider_dashboard')
 =======
     # Calculate available balance
-    bookings = Booking.objects.filter(ebike__provider=request.user, is_approved=True)
-    total_earnings = sum(float(b.total_price) for b in bookings)
-    platform_charges = Decimal(str(total_earnings)) * Decimal('0.1')
+    ledger = get_provider_ledger(request.user)
 
     # Subtract already withdrawn amounts
-    completed_withdrawals = Withdrawal.objects.filter(
-        provider=request.user,
-        status__in=['approved', 'completed']
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
+    completed_withdrawals = ledger.approved_withdrawals + ledger.completed_withdrawals
 
-    available_balance = Decimal(str(total_earnings)) - platform_charges - completed_withdrawals
+    available_balance = ledger.net_earnings - completed_withdrawals
     # Ensure balance can't go negative
     available_balance = max(available_balance, Decimal('0.0'))
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
@@ -468,202 +445,46 @@ def withdrawal_history(request):
 
 
 @login_required
-<<<<<<< HEAD
-=======
 def download_statement(request):
     """
     Generate and return a PDF statement for the provider's financial activity.
 
+    The statement lists every booking in the period, across as many pages as
+    needed, and is streamed from a temporary file. ``start`` and ``end``
+    query parameters (YYYY-MM-DD, both optional) limit it to a date range.
+    With ``mode=async`` the statement is queued for the background worker
+    instead, and the response (202) carries the job's status URL to poll.
+
     Args:
         request: The HTTP request object
 
     Returns:
-        HttpResponse: PDF statement as attachment
+        FileResponse: PDF statement as attachment, or JsonResponse with the queued job
     """
-    try:
-        # Get all bookings for this provider
-        bookings = Booking.objects.filter(ebike__provider=request.user).order_by('-created_at')
-
-        # Calculate financial metrics
-        total_bookings = bookings.count()
-        total_earnings = sum(float(booking.total_price) for booking in bookings.filter(is_approved=True))
-
-        if bookings.filter(is_approved=True).exists():
-            completed_bookings = bookings.filter(is_approved=True).count()
-            pending_bookings = total_bookings - completed_bookings
-
-            # Platform charges (10%)
-            platform_charges = Decimal(str(total_earnings)) * Decimal('0.1')
+    if not request.user.is_vehicle_provider:
+        if request.GET.get('mode') == 'async':
+            return JsonResponse({'error': 'Only vehicle providers can download statements.'}, status=403)
+        messages.error(request, 'Only vehicle providers can download statements.')
+        return redirect('vehicle_provider_dashboard')
 
-            # Total withdrawals
-            completed_withdrawals = Withdrawal.objects.filter(
-                provider=request.user,
-                status__in=['approved', 'completed']
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0.0')
+    try:
+        start, end = statement_period(request.GET.get('start'), request.GET.get('end'))
+    except ValueError as e:
+        if request.GET.get('mode') == 'async':
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, str(e))
+        return redirect('vehicle_provider_dashboard')
 
-            # Net profit (earnings - platform charges)
-            net_profit = Decimal(str(total_earnings)) - platform_charges
+    if request.GET.get('mode') == 'async':
+        # Large statements: render in the background and let the page poll for it
+        job, _ = enqueue_statement(request.user, start, end)
+        return JsonResponse(job_status(job), status=202)
 
-            # Available balance
-            available_balance = net_profit - completed_withdrawals
-            available_balance = max(available_balance, Decimal('0.0'))
-        else:
-            completed_bookings = 0
-            pending_bookings = 0
-            platform_charges = Decimal('0.0')
-            completed_withdrawals = Decimal('0.0')
-            net_profit = Decimal('0.0')
-            available_balance = Decimal('0.0')
-
-        # Import required libraries
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from reportlab.lib.utils import ImageReader
-        from io import BytesIO
-        import os
-        from datetime import datetime, date
-
-        # Initialize PDF buffer and canvas
-        buffer = BytesIO()
-        width, height = A4
-        p = canvas.Canvas(buffer, pagesize=A4)
-
-        # --- Styling constants ---
-        card_x = 20
-        top_margin = 20
-        card_width = width - 2 * card_x
-        line_height = 16
-        section_gap = 20
-        label_font = "Helvetica-Bold"
-        value_font = "Helvetica"
-        highlight_color = colors.HexColor('#00BFA6')
-        header_color = colors.HexColor('#0D47A1')
-        bg_color = colors.HexColor('#f9f9f9')
-        card_bg_color = colors.HexColor('#f4f6fa')
-
-        # --- Page background ---
-        p.setFillColor(bg_color)
-        p.rect(0, 0, width, height, fill=1, stroke=0)
-
-        # --- Header section ---
-        y = height - top_margin
-        p.setFillColor(header_color)
-        p.roundRect(card_x, y - 60, card_width, 60, 15, fill=1, stroke=0)
-        p.setFillColor(colors.white)
-        p.setFont("Helvetica-Bold", 18)
-        p.drawString(card_x + 20, y - 30, "AIS E-BIKE RENTAL - FINANCIAL STATEMENT")
-        p.setFont("Helvetica", 10)
-        p.drawString(card_x + 20, y - 45, f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}")
-        y -= 80
-
-        # --- Provider information ---
-        p.setFillColor(card_bg_color)
-        p.roundRect(card_x, y - 50, card_width, 50, 10, fill=1, stroke=0)
-        p.setFillColor(colors.black)
-        p.setFont(label_font, 12)
-        p.drawString(card_x + 20, y - 20, "Provider Information")
-        p.setFont(value_font, 10)
-        p.drawString(card_x + 20, y - 35, f"Name: {request.user.get_full_name() or request.user.username}")
-        p.drawString(card_x + 20, y - 45, f"Email: {request.user.email}")
-        y -= 70
-
-        # --- Financial Summary ---
-        p.setFillColor(card_bg_color)
-        p.roundRect(card_x, y - 100, card_width, 100, 10, fill=1, stroke=0)
-        p.setFillColor(colors.black)
-        p.setFont(label_font, 12)
-        p.drawString(card_x + 20, y - 20, "Financial Summary")
-        p.setFont(value_font, 10)
-
-        # Summary data
-        summary_y = y - 35
-        p.drawString(card_x + 20, summary_y, f"Total Bookings: {total_bookings}")
-        p.drawString(card_x + 320, summary_y, f"Completed: {completed_bookings}")
-        p.drawString(card_x + 440, summary_y, f"Pending: {pending_bookings}")
-
-        summary_y -= 15
-        p.drawString(card_x + 20, summary_y, "Total Earnings (from approved bookings):")
-        p.drawRightString(card_x + card_width - 20, summary_y, f"₹{total_earnings:,.2f}")
-
-        summary_y -= 15
-        p.drawString(card_x + 20, summary_y, "Platform Charges (10%):")
-        p.drawRightString(card_x + card_width - 20, summary_y, f"₹{platform_charges:,.2f}")
-
-        summary_y -= 15
-        p.setFont(label_font, 10)
-        p.setFillColor(highlight_color)
-        p.drawString(card_x + 20, summary_y, "Net Profit:")
-        p.drawRightString(card_x + card_width - 20, summary_y, f"₹{net_profit:,.2f}")
-
-        summary_y -= 15
-        p.setFillColor(colors.black)
-        p.setFont(value_font, 10)
-        p.drawString(card_x + 20, summary_y, "Total Withdrawn:")
-        p.drawRightString(card_x + card_width - 20, summary_y, f"₹{completed_withdrawals:,.2f}")
-
-        summary_y -= 15
-        p.setFont(label_font, 10)
-        p.drawString(card_x + 20, summary_y, "Available Balance:")
-        p.drawRightString(card_x + card_width - 20, summary_y, f"₹{available_balance:,.2f}")
-
-        y -= 130
-
-        # --- Recent Activity ---
-        if bookings.exists():
-            p.setFillColor(header_color)
-            p.setFont(label_font, 12)
-            p.drawString(card_x + 20, y, "Recent Booking Activity")
-            y -= 20
-
-            # Table header
-            p.setFillColor(colors.white)
-            p.roundRect(card_x, y - 20, card_width, 20, 5, fill=1, stroke=0)
-            p.setFillColor(colors.black)
-            p.setFont(label_font, 9)
-            p.drawString(card_x + 10, y - 13, "Date")
-            p.drawString(card_x + 80, y - 13, "E-Bike")
-            p.drawString(card_x + 180, y - 13, "Duration")
-            p.drawString(card_x + 280, y - 13, "Amount")
-            p.drawString(card_x + 340, y - 13, "Status")
-            y -= 25
-
-            # Show last 10 bookings
-            p.setFont(value_font, 8)
-            for booking in bookings[:10]:
-                if y < 50:  # Start new page if needed
-                    p.showPage()
-                    y = height - top_margin
-                    p.setFillColor(bg_color)
-                    p.rect(0, 0, width, height, fill=1, stroke=0)
-
-                p.drawString(card_x + 10, y - 10, booking.created_at.strftime('%m/%d/%Y'))
-                # Truncate ebike name if too long
-                ebike_name = booking.ebike.name[:15] + "..." if len(booking.ebike.name) > 15 else booking.ebike.name
-                p.drawString(card_x + 80, y - 10, ebike_name)
-                duration = f"{booking.start_date} to {booking.end_date}"
-                duration = duration[:20] + "..." if len(duration) > 20 else duration
-                p.drawString(card_x + 180, y - 10, duration)
-                p.drawString(card_x + 280, y - 10, f"₹{booking.total_price}")
-                p.drawString(card_x + 340, y - 10, booking.get_status_display())
-                y -= 15
-
-        # --- Footer ---
-        p.setFillColor(colors.gray)
-        p.setFont(value_font, 8)
-        footer_y = 30
-        p.drawCentredString(card_x + card_width / 2, footer_y, "AIS E-Bike Rental | Financial Statement")
-        p.drawCentredString(card_x + card_width / 2, footer_y - 10, "This is a computer-generated statement. Please retain for your records.")
-
-        p.showPage()
-        p.save()
-        buffer.seek(0)
+    try:
+        statement = spool_statement_pdf(request.user, start, end)
 
-        # Set up response
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="financial_statement_{request.user.username}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-        return response
+        filename = f'financial_statement_{request.user.username}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+        return FileResponse(statement, as_attachment=True, filename=filename, content_type='application/pdf')
 
     except Exception as e:
         logger.error(f"Error generating financial statement for user {request.user.username}: {str(e)}")
@@ -687,225 +508,11 @@ def download_withdrawal_slip(request, withdrawal_id):
         # Get the withdrawal or return 404
         withdrawal = get_object_or_404(Withdrawal, id=withdrawal_id, provider=request.user)
 
-        # Import required libraries
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from reportlab.lib.units import inch
-        from io import BytesIO
-        from datetime import datetime
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-
-        # Initialize PDF buffer and canvas
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=20,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#0D47A1')
-        )
-
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Normal'],
-            fontSize=14,
-            textColor=colors.HexColor('#1565C0'),
-            spaceAfter=15
-        )
-
-        normal_style = styles['Normal']
-        normal_style.fontSize = 11
-
-        # Company Header
-        company_name = Paragraph("<b>AIS E-BIKE RENTAL</b>", title_style)
-        tagline = Paragraph("Your Trusted E-bike Rental Partner", header_style)
-
-        elements.append(company_name)
-        elements.append(tagline)
-        elements.append(Spacer(1, 20))
-
-        # Invoice Details Box
-        invoice_data = [
-            ['Invoice Type:', 'Withdrawal Request Invoice'],
-            ['Invoice Number:', f'WD-{withdrawal.id:06d}'],
-            ['Issue Date:', withdrawal.created_at.strftime('%d %b %Y')],
-            ['Issue Time:', withdrawal.created_at.strftime('%I:%M %p')],
-        ]
-
-        invoice_table = Table(invoice_data, colWidths=[120, 250])
-        invoice_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 0), colors.HexColor('#E3F2FD')),
-            ('BACKGROUND', (0, 2), (1, 2), colors.HexColor('#E3F2FD')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1976D2')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-
-        elements.append(invoice_table)
-        elements.append(Spacer(1, 25))
-
-        # Provider Information Section
-        provider_title = Paragraph("<b>Provider Information</b>", header_style)
-        elements.append(provider_title)
-
-        provider_data = [
-            ['Provider Name:', withdrawal.provider.get_full_name() or withdrawal.provider.username],
-            ['Provider ID:', withdrawal.provider.username],
-            ['Email Address:', withdrawal.provider.email],
-        ]
-
-        provider_table = Table(provider_data, colWidths=[120, 250])
-        provider_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 2), colors.whitesmoke),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-
-        elements.append(provider_table)
-        elements.append(Spacer(1, 25))
-
-        # Withdrawal Details Section
-        withdrawal_title = Paragraph("<b>Withdrawal Request Details</b>", header_style)
-        elements.append(withdrawal_title)
-
-        # Withdrawal Amount Box (prominent)
-        amount_highlight = Paragraph(
-            f"<font size='16' color='#D32F2F'>"
-            f"<b>₹{withdrawal.amount:,.2f}</b></font>",
-            styles['Heading1']
-        )
-
-        elements.append(Paragraph("<b>Requested Amount:</b>", normal_style))
-        elements.append(amount_highlight)
-        elements.append(Spacer(1, 20))
-
-        # Payment Details
-        payment_data = [
-            ['Account Holder:', withdrawal.account_holder_name],
-            ['Payment Method:', 'UPI' if withdrawal.upi_id else 'Bank Transfer'],
-        ]
-
-        if withdrawal.upi_id:
-            payment_data.extend([
-                ['UPI ID:', withdrawal.upi_id],
-            ])
-        else:
-            payment_data.extend([
-                ['Account Number:', withdrawal.account_number if withdrawal.account_number else 'Not provided'],
-                ['Bank Name:', withdrawal.bank_name if withdrawal.bank_name else 'Not provided'],
-                ['IFSC Code:', withdrawal.ifsc_code if withdrawal.ifsc_code else 'Not provided'],
-            ])
-
-        payment_table = Table(payment_data, colWidths=[120, 250])
-        payment_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, -1), colors.white),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-
-        elements.append(payment_table)
-        elements.append(Spacer(1, 25))
-
-        # Status Section
-        status_title = Paragraph("<b>Request Status</b>", header_style)
-        elements.append(status_title)
-
-        status_color = {
-            'pending': colors.orange,
-            'approved': colors.blue,
-            'completed': colors.green,
-            'rejected': colors.red
-        }.get(withdrawal.status, colors.grey)
-
-        status_data = [
-            ['Current Status:', withdrawal.get_status_display().upper()],
-            ['Status Color:', '●'],
-        ]
-
-        status_table = Table(status_data, colWidths=[120, 80])
-        status_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 0), colors.white),
-            ('BACKGROUND', (0, 1), (1, 1), status_color),
-            ('TEXTCOLOR', (0, 0), (0, 0), colors.black),
-            ('TEXTCOLOR', (0, 1), (0, 1), status_color),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 1, 1), 16),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-
-        elements.append(status_table)
-        elements.append(Spacer(1, 20))
-
-        # Processing Information
-        if withdrawal.processed_at:
-            processed_info = Paragraph(
-                f"<b>Processed On:</b> {withdrawal.processed_at.strftime('%d %b %Y at %I:%M %p')}",
-                normal_style
-            )
-            elements.append(processed_info)
-
-            if withdrawal.transaction_id:
-                transaction_info = Paragraph(
-                    f"<b>Transaction ID:</b> <font color='green'>{withdrawal.transaction_id}</font>",
-                    normal_style
-                )
-                elements.append(transaction_info)
-
-            elements.append(Spacer(1, 15))
-
-        # Admin Notes (if any)
-        if withdrawal.admin_notes:
-            notes_title = Paragraph("<b>Admin Remarks:</b>", normal_style)
-            elements.append(notes_title)
-            notes_content = Paragraph(f"<i>{withdrawal.admin_notes}</i>", normal_style)
-            elements.append(notes_content)
-            elements.append(Spacer(1, 20))
-
-        # Footer
-        footer_text = """
-        <b>Important Notes:</b><br/>
-        • This is a system-generated withdrawal request invoice<br/>
-        • Processing time may vary based on verification and availability<br/>
-        • For any queries, contact support@aisebikerental.com<br/>
-        • AIS E-bike Rental - Your trusted rental partner<br/>
-        <br/>
-        <font color='#666666' size='8'>Generated on: {}</font>
-        """.format(datetime.now().strftime('%d %b %Y, %I:%M %p'))
-
-        footer_paragraph = Paragraph(footer_text, styles['Normal'])
-        elements.append(footer_paragraph)
-
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
+        pdf_bytes = render_withdrawal_slip_pdf(withdrawal)
 
         # Set up response
         status_text = withdrawal.get_status_display().replace(' ', '_')
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="withdrawal_invoice_WD_{withdrawal.id}_{status_text}_{datetime.now().strftime("%Y%m%d")}.pdf"'
         return response
 
@@ -916,7 +523,6 @@ def download_withdrawal_slip(request, withdrawal_id):
 
 
 @login_required
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
 def download_withdrawal_receipt(request, withdrawal_id):
     """
     Generate and return a PDF receipt for the withdrawal.
@@ -941,439 +547,10 @@ def download_withdrawal_receipt(request, withdrawal_id):
 >>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
             return redirect('withdrawal_history')
 
-        # Import required libraries
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from reportlab.lib.utils import ImageReader
-        from io import BytesIO
-        import os
-        from datetime import datetime
-        from decimal import Decimal
-<<<<<<< HEAD
-        import qrcode
-=======
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-
-        # Initialize PDF buffer and canvas
-        buffer = BytesIO()
-        width, height = A4
-        p = canvas.Canvas(buffer, pagesize=A4)
-
-<<<<<<< HEAD
-        # --- Ultra Modern Styling constants with enhanced layout ---
-        card_x = 12
-        top_margin = 12
-        card_width = width - 2 * card_x
-        card_height = 750  # Significantly increased to eliminate all overlapping
-        card_y = height - card_height - top_margin
-        padding = 32
-        section_gap = 40
-        line_height = 24
-        title_font = "Helvetica-Bold"
-        label_font = "Helvetica-Bold"
-        value_font = "Helvetica-Bold"  # Made bold for currency visibility
-        rup_font = "Symbol"            # Changed to Symbol font for better rupee visibility
-        highlight_color = colors.HexColor('#00D4AA')  # Modern teal
-        header_color = colors.HexColor('#1a202c')     # Dark slate
-        success_color = colors.HexColor('#38a169')    # Green
-        accent_color = colors.HexColor('#3182ce')     # Blue accent
-        meta_color = colors.HexColor('#718096')       # Gray
-        bg_color = colors.HexColor('#f8fafc')         # Off-white bg
-        card_bg_color = colors.white
-        border_color = colors.HexColor('#cbd5e0')     # Light blue border
-        section_bg = colors.HexColor('#f7fafc')       # Section backgrounds
-
-        # --- Background and main card ---
-        p.setFillColor(bg_color)
-        p.rect(0, 0, width, height, fill=1, stroke=0)
-        p.setFillColor(card_bg_color)
-        p.setStrokeColor(border_color)
-        p.setLineWidth(1.5)
-        p.roundRect(card_x, card_y, card_width, card_height, 12, fill=1, stroke=1)
-
-        # --- Header Section ---
-        header_height = 80
-        y = card_y + card_height - padding
-
-        # Header background gradient effect
-        p.setFillColor(header_color)
-        p.roundRect(card_x, y - header_height, card_width, header_height, 12, fill=1, stroke=0)
-
-        # Add decorative elements
-        p.setFillColor(highlight_color)
-        p.circle(card_x + 30, y - 25, 8, fill=1, stroke=0)  # Left circle
-        p.circle(card_x + card_width - 30, y - 25, 6, fill=1, stroke=0)  # Right circle
-
-        # Company title
-        p.setFillColor(colors.white)
-        p.setFont(title_font, 28)
-        p.drawCentredString(card_x + card_width/2, y - header_height + 40, "AIS E-BIKE RENTAL")
-
-        # Subtitle and date
-        p.setFont(value_font, 14)
-        receipt_date = timezone.now().strftime('%B %d, %Y')
-        p.drawCentredString(card_x + card_width/2, y - header_height + 15, f"Withdrawal Receipt - {receipt_date}")
-
-        # Transaction success banner
-        banner_height = 25
-        banner_y = y - header_height - 10
-        p.setFillColor(colors.green)
-        p.roundRect(card_x + padding, banner_y - banner_height, card_width - 2*padding, banner_height, 8, fill=1, stroke=0)
-        p.setFillColor(colors.white)
-        p.setFont(label_font, 11)
-        p.drawCentredString(card_x + card_width/2, banner_y - banner_height + 8, "✓ TRANSACTION COMPLETED SUCCESSFULLY")
-
-        y = banner_y - banner_height - section_gap
-
-        # --- Provider Information Section ---
-        p.setFont(label_font, 16)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Provider Information")
-        y -= (line_height + 5)
-
-        # Provider details box with border
-        box_height = 70
-        p.setFillColor(colors.white)
-        p.setStrokeColor(colors.HexColor('#cbd5e0'))
-        p.setLineWidth(1)
-        p.roundRect(card_x + padding, y - box_height, card_width - 2 * padding, box_height, 8, fill=1, stroke=1)
-
-        # Provider details
-        detail_x = card_x + padding + 15
-        p.setFont(label_font, 13)
-        p.setFillColor(colors.black)
-        p.drawString(detail_x, y - 20, withdrawal.provider.get_full_name() or withdrawal.provider.username)
-        p.setFont(value_font, 12)
-        p.setFillColor(meta_color)
-        p.drawString(detail_x, y - 38, f"Provider ID: {withdrawal.provider.username}")
-        p.drawString(detail_x, y - 55, f"Email: {withdrawal.provider.email}")
-        y -= (box_height + section_gap)
-
-        # --- Amount Details Section with Modern Styling ---
-        p.setFont(label_font, 16)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Transaction Summary")
-        y -= (line_height + 8)
-
-        # Create amount display box with modern borders
-        amount_box_height = 90
-        p.setFillColor(section_bg)
-        p.setStrokeColor(accent_color)
-        p.setLineWidth(1.5)
-        p.roundRect(card_x + padding, y - amount_box_height, card_width - 2*padding, amount_box_height, 10, fill=1, stroke=1)
-
-        # Withdrawal Amount - Large, prominent with clear rupee symbol
-        amt_y = y - 25
-        p.setFont(value_font, 12)
-        p.setFillColor(colors.black)
-        p.drawString(card_x + padding + 15, amt_y, "Principal Amount:")
-        p.setFont(label_font, 18)
-        p.setFillColor(accent_color)
-        principal_amount = f"₹ {withdrawal.amount:,.2f}"
-        p.drawRightString(card_x + card_width - padding - 15, amt_y, principal_amount)
-
-        # Platform charges - Clear display
-        charge_y = amt_y - 25
-        p.setFont(value_font, 11)
-        p.setFillColor(meta_color)
-        p.drawString(card_x + padding + 15, charge_y, "Transaction Fee (2%):")
-        platform_charges = Decimal(str(withdrawal.amount)) * Decimal('0.02')
-        fee_amount = f"₹ {platform_charges:,.2f}"
-        p.setFont(label_font, 13)
-        p.setFillColor(colors.HexColor('#e53e3e'))  # Red for fee
-        p.drawRightString(card_x + card_width - padding - 15, charge_y, fee_amount)
-
-        # Net Amount - Highlighted, large and clear
-        net_y = charge_y - 28
-        p.setFont(label_font, 14)
-        p.setFillColor(success_color)
-        p.drawString(card_x + padding + 15, net_y, "Net Amount Received:")
-        net_amount = withdrawal.amount - platform_charges
-        net_amount_str = f"₹ {net_amount:,.2f}"
-        p.setFont(label_font, 16)
-        p.setFillColor(success_color)
-        p.drawRightString(card_x + card_width - padding - 15, net_y, net_amount_str)
-
-        # Add decorative line
-        p.setStrokeColor(highlight_color)
-        p.setLineWidth(0.5)
-        p.line(card_x + padding + 10, net_y - 8, card_x + card_width - padding - 10, net_y - 8)
-
-        y -= (amount_box_height + section_gap)
-=======
-        # --- Styling constants ---
-        card_x = 30
-        top_margin = 30
-        card_width = width - 2 * card_x
-        card_height = 400  # Adjusted for withdrawal content
-        card_y = height - card_height - top_margin
-        padding = 18
-        section_gap = 24
-        line_height = 18
-        label_font = "Helvetica-Bold"
-        value_font = "Helvetica"
-        highlight_color = colors.HexColor('#00BFA6')
-        header_color = colors.HexColor('#0D47A1')
-        meta_color = colors.HexColor('#888888')
-        bg_color = colors.HexColor('#f9f9f9')
-        card_bg_color = colors.HexColor('#f4f6fa')
-
-        # --- Card background with border ---
-        p.setFillColor(bg_color)
-        p.rect(0, 0, width, height, fill=1, stroke=0)
-        p.setFillColor(card_bg_color)
-        border_color = highlight_color
-        p.setStrokeColor(border_color)
-        p.setLineWidth(2)
-        p.roundRect(card_x, card_y, card_width, card_height, 20, fill=1, stroke=1)
-
-        # --- All content inside the card ---
-        y = card_y + card_height - padding
-
-        # Header with company name and title
-        header_height = 70
-        p.setFillColor(header_color)
-        p.roundRect(card_x, y - header_height, card_width, header_height, 20, fill=1, stroke=0)
-        p.setFillColor(colors.white)
-        p.setFont("Helvetica-Bold", 24)
-        p.drawString(card_x + padding, y - header_height + 35, "AIS E-BIKE RENTAL")
-        p.setFont("Helvetica", 12)
-        p.drawString(card_x + padding, y - header_height + 15, "Withdrawal Receipt")
-        y -= header_height + section_gap
-
-        # Provider Information Section
-        p.setFont(label_font, 14)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Withdrawal Details")
-        y -= (line_height + 10)
-
-        # Provider details box
-        p.setFillColor(colors.white)
-        p.roundRect(card_x + padding, y - 60, card_width - 2 * padding, 60, 12, fill=1, stroke=0)
-
-        p.setFont(label_font, 12)
-        p.setFillColor(colors.black)
-        p.drawString(card_x + padding + 10, y - 20, withdrawal.provider.get_full_name() or withdrawal.provider.username)
-        p.setFont(value_font, 11)
-        p.setFillColor(meta_color)
-        p.drawString(card_x + padding + 10, y - 35, f"ID: {withdrawal.provider.username}")
-        p.drawString(card_x + padding + 10, y - 50, f"Email: {withdrawal.provider.email}")
-        y -= (80 + section_gap)
-
-        # Withdrawal Amount and Status
-        p.setFont(label_font, 13)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Amount Details")
-        y -= (line_height + 5)
-        p.setFont(value_font, 11)
-        p.setFillColor(colors.black)
-
-        # Amount
-        p.drawString(card_x + padding, y, "Withdrawal Amount")
-        p.drawRightString(card_x + card_width - padding, y, f"₹{withdrawal.amount:.2f}")
-        y -= line_height
-
-        # Platform charges (if any)
-        platform_charges = Decimal(str(withdrawal.amount)) * Decimal('0.02')  # 2% transaction fee
-        if platform_charges > 0:
-            p.setFillColor(meta_color)
-            p.drawString(card_x + padding, y, "Transaction Charges (2%)")
-            p.drawRightString(card_x + card_width - padding, y, f"₹{platform_charges:.2f}")
-            y -= line_height
-
-            p.setFont(label_font, 12)
-            p.setFillColor(highlight_color)
-            p.drawString(card_x + padding, y, "Net Amount Credited")
-            net_amount = withdrawal.amount - platform_charges
-            p.drawRightString(card_x + card_width - padding, y, f"₹{net_amount:.2f}")
-            y -= line_height
-        else:
-            p.setFont(label_font, 12)
-            p.setFillColor(highlight_color)
-            p.drawString(card_x + padding, y, "Amount Credited")
-            p.drawRightString(card_x + card_width - padding, y, f"₹{withdrawal.amount:.2f}")
-            y -= line_height
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-
-        y -= (section_gap)
-
-        # Account and Transaction Details
-        p.setFont(label_font, 13)
-        p.setFillColor(header_color)
-        p.drawString(card_x + padding, y, "Payment Details")
-        y -= (line_height + 5)
-
-        # Status
-        p.setFont(value_font, 12)
-        p.setFillColor(colors.black)
-        status_text = "SUCCESSFUL" if withdrawal.status == 'completed' else withdrawal.status.upper()
-        if withdrawal.status == 'completed':
-            p.setFillColor(colors.green)
-        p.drawString(card_x + padding, y, f"Status: {status_text}")
-        y -= line_height
-
-        # Transaction ID
-        if withdrawal.transaction_id:
-            p.setFillColor(colors.black)
-            p.drawString(card_x + padding, y, f"Transaction ID: {withdrawal.transaction_id}")
-            y -= line_height
-
-        # Account details
-        p.setFont(value_font, 10)
-        p.setFillColor(meta_color)
-        p.drawString(card_x + padding, y, f"Account Holder: {withdrawal.account_holder_name}")
-        y -= line_height
-        if withdrawal.upi_id:
-            p.drawString(card_x + padding, y, f"Payment Method: UPI ({withdrawal.upi_id})")
-        else:
-            p.drawString(card_x + padding, y, f"Bank: {withdrawal.bank_name}")
-            y -= line_height
-            p.drawString(card_x + padding, y, f"Account: {withdrawal.account_number[-4:] if withdrawal.account_number else 'XXXX'}...{withdrawal.ifsc_code}")
-        y -= section_gap
-
-<<<<<<< HEAD
-        # --- Authorization Section with Signature, Stamp & QR Code ---
-        # Position it well below all other content to prevent overlapping
-        auth_section_start = card_y + 60  # Start authorization section 60px from card bottom
-
-        # Left side - Company Logo & Info (at bottom left)
-        logo_x = card_x + padding + 10
-        logo_y = auth_section_start + 50
-
-        # AIS Logo placeholder
-        p.setFillColor(header_color)
-        p.roundRect(logo_x, logo_y - 35, 45, 35, 6, fill=1, stroke=0)
-        p.setFillColor(colors.white)
-        p.setFont(title_font, 14)
-        p.drawCentredString(logo_x + 22.5, logo_y - 20, "AIS")
-
-        # Company Info (to the right of logo)
-        company_info_x = logo_x + 55
-        p.setFillColor(meta_color)
-        p.setFont(value_font, 7)
-        p.drawString(company_info_x, logo_y - 12, "AIS E-Bike Rental Services Pvt. Ltd.")
-        p.drawString(company_info_x, logo_y - 22, "GSTIN: 29ABCDE1234F1Z5 | CIN: U12345KA2023PTC123456")
-        p.drawString(company_info_x, logo_y - 32, "support@aisebike.com")
-
-        # Right side - QR Code (at bottom right)
-        qr_code_x = card_x + card_width - padding - 50
-
-        # Try to generate real QR code, fallback to placeholder if not available
-        qr_generated = False
-        try:
-            # Generate real QR code with transaction data
-            qr_data = f"""AIS E-BIKE RENTAL
-TRANSACTION VERIFICATION
-ID: {withdrawal.transaction_id or f"W{withdrawal.id:06d}"}
-Provider: {withdrawal.provider.username}
-Amount: ₹{withdrawal.amount}
-Status: {withdrawal.status.title()}
-Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M:%S')}
-Verified by AIS E-Bike Rental"""
-
-            # Create QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=3,
-                border=1,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-
-            # Generate QR code image
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            qr_buffer = BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
-
-            # Draw the QR code on PDF
-            qr_image_data = qr_buffer.getvalue()
-            qr_image = ImageReader(BytesIO(qr_image_data))
-
-            # Position QR code (35x35 pixels matches our layout)
-            p.drawImage(qr_image, qr_code_x, logo_y - 35, width=35, height=35, mask='auto')
-            qr_generated = True
-
-        except ImportError:
-            # Fallback to simple QR placeholder if libraries not available
-            qr_generated = False
-
-        # Draw QR code (real or placeholder)
-        if not qr_generated:
-            # Simple QR Code placeholder representation
-            p.setStrokeColor(accent_color)
-            p.setLineWidth(1.2)
-            p.rect(qr_code_x, logo_y - 35, 35, 35, fill=0, stroke=1)
-            # Inner pattern
-            p.rect(qr_code_x + 3, logo_y - 33, 10, 10, fill=1, stroke=0)
-            p.rect(qr_code_x + 22, logo_y - 33, 10, 10, fill=1, stroke=0)
-            p.rect(qr_code_x + 3, logo_y - 10, 29, 7, fill=1, stroke=0)
-
-        # QR verification text
-        p.setFillColor(meta_color)
-        p.setFont(value_font, 5)
-        p.drawCentredString(qr_code_x + 17.5, logo_y - 40, "SCAN TO VERIFY")
-
-        # Signature section (middle area)
-        signature_y = card_y + 30
-
-        # Authorized Signature (center left)
-        signature_x = card_x + padding + 100
-        p.setStrokeColor(colors.black)
-        p.setLineWidth(1.2)
-        p.line(signature_x, signature_y, signature_x + 70, signature_y)
-
-        p.setFillColor(meta_color)
-        p.setFont(value_font, 8)
-        p.drawCentredString(signature_x + 35, signature_y + 5, "Authorized Signatory")
-
-        # Company Stamp (center right)
-        stamp_x = qr_code_x - 20
-        stamp_y = signature_y - 5
-
-        # Stamp circle
-        p.setFillColor(colors.HexColor('#f9fafb'))
-        p.circle(stamp_x, stamp_y, 20, fill=1, stroke=0)
-        p.setStrokeColor(header_color)
-        p.setLineWidth(1.5)
-        p.circle(stamp_x, stamp_y, 20, fill=0, stroke=1)
-
-        # Stamp content
-        p.setFillColor(header_color)
-        p.setFont(label_font, 8)
-        p.drawCentredString(stamp_x, stamp_y + 5, "APPROVED")
-        p.setFont(value_font, 5)
-        p.drawCentredString(stamp_x, stamp_y + 1, "AIS E-BIKE")
-        p.drawCentredString(stamp_x, stamp_y - 3, "ADMIN")
-
-        # Date stamp
-        p.setFont(value_font, 6)
-        date_stamp = timezone.now().strftime('%d/%m/%Y')
-        p.drawCentredString(stamp_x, stamp_y - 10, date_stamp)
-
-        # Bottom Footer (very bottom)
-        footer_y = card_y + 12
-        p.setFillColor(meta_color)
-        p.setFont(value_font, 7)
-        p.drawCentredString(card_x + card_width / 2, footer_y, "This is a computer-generated receipt. No signature required for verification.")
-        p.drawCentredString(card_x + card_width / 2, footer_y - 8, "AIS E-Bike Rental Services - Making electric mobility accessible")
-=======
-        # Footer
-        p.setFont(value_font, 9)
-        p.setFillColor(meta_color)
-        p.drawCentredString(card_x + card_width / 2, card_y + 20, "AIS E-Bike Rental | GSTIN: 29ABCDE1234F1Z5 | CIN: U12345KA2023PTC123456 | Contact: support@aisebike.com")
-        p.drawCentredString(card_x + card_width / 2, card_y + 8, "This is a computer-generated receipt. No signature required.")
->>>>>>> bc478c3b2f51a242be15138610bac84cb0a5f46a
-
-        p.showPage()
-        p.save()
-        buffer.seek(0)
+        pdf_bytes = render_withdrawal_receipt_pdf(withdrawal)
 
         # Set up response
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="withdrawal_receipt_{withdrawal.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
         return response
 
@@ -1384,3 +561,40 @@ Verified by AIS E-Bike Rental"""
         # Show error message to user
         messages.error(request, f"Error generating receipt: {str(e)}")
         return redirect('withdrawal_history')
+
+
+@login_required
+def statement_job_status(request, job_id):
+    """
+    Report a background statement's progress, and its download URL once it is ready.
+
+    Returns:
+        JsonResponse: Job status (see statement_jobs.job_status)
+    """
+    if not request.user.is_vehicle_provider:
+        return JsonResponse({'error': 'Only vehicle providers can view statements.'}, status=403)
+
+    job = get_object_or_404(StatementJob, id=job_id, provider=request.user)
+    return JsonResponse(job_status(job))
+
+
+@login_required
+def download_statement_job(request, job_id):
+    """
+    Stream a statement rendered in the background.
+
+    Statements are kept in private storage with no public URL, so this view,
+    which only serves a provider their own jobs, is the only way to fetch one.
+
+    Returns:
+        FileResponse: PDF statement as attachment
+    """
+    if not request.user.is_vehicle_provider:
+        messages.error(request, 'Only vehicle providers can download statements.')
+        return redirect('vehicle_provider_dashboard')
+
+    job = get_object_or_404(StatementJob, id=job_id, provider=request.user, status='done')
+    if not job.file:
+        raise Http404("Statement file not found")
+    filename = f'financial_statement_{request.user.username}_{job.created_at.strftime("%Y%m%d_%H%M%S")}.pdf'
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=filename, content_type='application/pdf')